@@ -0,0 +1,31 @@
+"""Бенчмарк пакетной обработки: 12 полей в одном тайле, группы тайл×дата."""
+from pathlib import Path
+from unittest.mock import patch
+
+from rlm import sentinel_filter
+from rlm.batch import run_batch
+from rlm.bench import FIELD_CENTER, case
+
+
+def _farm(ctx):
+    lon0, lat0 = FIELD_CENTER
+    placemarks = []
+    for i in range(12):
+        lon, lat, d = lon0 + 0.02 * (i % 4 - 1.5), lat0 + 0.01 * (i // 4 - 1), 0.004
+        ring = [(lon - d, lat - d), (lon + d, lat - d), (lon + d, lat + d), (lon - d, lat + d), (lon - d, lat - d)]
+        placemarks.append(
+            f"<Placemark><name>field-{i:02d}</name><Polygon><outerBoundaryIs><LinearRing><coordinates>"
+            + " ".join(f"{x},{y},0" for x, y in ring)
+            + "</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>"
+        )
+    path = Path(ctx.workdir) / "farm.kml"
+    path.write_text('<?xml version="1.0" encoding="utf-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">'
+                    f"<Document>{''.join(placemarks)}</Document></kml>\n", encoding="utf-8")
+    return path
+
+
+@case("batch_12_fields", setup=_farm)
+def bench_batch(ctx, farm):
+    with patch.object(sentinel_filter.Client, "open", return_value=ctx.stac_client()):
+        result = run_batch(farm, ctx.date_range, max_cloud=10.0)
+    assert len(result["records"]) == 12 * result["groups"], result["groups"]
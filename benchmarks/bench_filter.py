@@ -0,0 +1,32 @@
+"""Бенчмарки SCL-фильтрации: оконное чтение COG и полный filter_pipeline."""
+from unittest.mock import patch
+
+from rlm.bench import case
+from rlm import sentinel_filter
+
+
+def _polygon(ctx):
+    return sentinel_filter._load_field_polygon(ctx.kml_path)
+
+
+@case("read_field_window", setup=_polygon)
+def bench_read_field_window(ctx, polygon):
+    for item in ctx.clear_items():
+        sentinel_filter._read_field_window(ctx.href(ctx.items.index(item), "red"), polygon)
+
+
+@case("check_cloud_over_field", setup=_polygon)
+def bench_check_cloud_over_field(ctx, polygon):
+    for i in range(len(ctx.items)):
+        sentinel_filter._check_cloud_over_field(ctx.href(i, "scl"), polygon)
+
+
+@case("filter_pipeline_multidate")
+def bench_filter_pipeline(ctx):
+    with patch.object(sentinel_filter.Client, "open", return_value=ctx.stac_client()):
+        passed = sentinel_filter.filter_pipeline(
+            kml_path=ctx.kml_path,
+            date_range=ctx.date_range,
+            max_cloud_percent=10.0,
+        )
+    assert passed, "синтетика должна содержать чистые даты"
@@ -0,0 +1,78 @@
+"""Бенчмарки работы с геометрией поля: разбор KML, буфер, проекция и перевод контура в пиксели."""
+import shutil
+from pathlib import Path
+
+from rlm.bench import case
+# Импорт на уровне модуля: дочерний процесс загружает его до старта замера
+from rlm.search import create_buffer, read_geometry_file
+from rlm.geometry import project_polygon, to_pixels
+from rlm.sentinel_filter import _load_field_polygon
+
+
+def _local_kml(ctx):
+    # Копия в рабочую директорию: create_buffer пишет GeoJSON рядом с KML
+    dst = Path(ctx.workdir) / Path(ctx.kml_path).name
+    shutil.copy(ctx.kml_path, dst)
+    return str(dst)
+
+
+@case("kml_parsing")
+def bench_kml_parsing(ctx):
+    gdf = read_geometry_file(ctx.kml_path)
+    assert not gdf.empty
+    _load_field_polygon(ctx.kml_path)
+
+
+@case("create_buffer", setup=_local_kml)
+def bench_create_buffer(ctx, kml_path):
+    assert Path(create_buffer(kml_path, 500)).exists()
+
+
+def _warm_field(ctx):
+    # Первый вызов MCP-инструмента по полю: наполняет кэши процесса
+    kml_path = _local_kml(ctx)
+    _warm_calls(kml_path)
+    return kml_path
+
+
+def _warm_calls(kml_path):
+    create_buffer(kml_path, 500)
+    polygon = _load_field_polygon(kml_path)
+    project_polygon(polygon, "EPSG:32637")
+
+
+@case("field_geometry_warm", setup=_warm_field)
+def bench_field_geometry_warm(ctx, kml_path):
+    # Повторный вызов по тому же полю в долгоживущем процессе
+    for _ in range(10):
+        _warm_calls(kml_path)
+
+
+@case("project_polygon_cold")
+def bench_project_polygon_cold(ctx):
+    # Новое поле (4000 вершин) в нескольких CRS: проекция без кэша полигонов, трансформеры — повторно
+    polygon = _load_field_polygon(ctx.kml_path)
+    for zone in range(32634, 32640):
+        for _ in range(5):
+            project_polygon.cache.clear()
+            project_polygon(polygon, f"EPSG:{zone}")
+
+
+def _detailed_field(ctx):
+    # Детальная граница из KML: 40 000 вершин и внутреннее кольцо (лесополоса), в UTM
+    import numpy as np
+    from rasterio.transform import from_origin
+    from shapely.geometry import Polygon
+
+    t = np.linspace(0, 2 * np.pi, 40_000)
+    outer = np.column_stack([500_000 + 900 * np.cos(t) + 5 * np.sin(40 * t), 5_740_000 + 700 * np.sin(t)])
+    inner = np.column_stack([500_000 + 100 * np.cos(t[::40]), 5_740_000 + 80 * np.sin(t[::40])])
+    return Polygon(outer, [inner]), from_origin(498_900, 5_740_900, 10, 10)
+
+
+@case("contour_to_pixels", setup=_detailed_field)
+def bench_contour_to_pixels(ctx, field):
+    polygon, transform = field
+    for _ in range(10):
+        pixels = to_pixels(polygon, transform, center=True)
+    assert len(pixels.interiors) == 1
@@ -0,0 +1,42 @@
+"""Бенчмарки расчёта индексов: только статистика, полный рендер PNG и перерисовка из хранилища окон."""
+from pathlib import Path
+
+from rlm.bench import case
+from rlm.indices import process_scene_indices
+from rlm.search import create_buffer
+
+
+def _prepare(ctx):
+    buffer_path = create_buffer(ctx.kml_path, 500)
+    return buffer_path, ctx.scene_metadata(ctx.clear_items()[0])
+
+
+@case("process_scene_indices_stats", setup=_prepare)
+def bench_indices_stats(ctx, prepared):
+    buffer_path, scene = prepared
+    result = process_scene_indices(scene, buffer_path, visualize=False, output_dir=Path("output"))
+    assert result["status"] == "success", result
+
+
+@case("process_scene_indices_render", setup=_prepare)
+def bench_indices_render(ctx, prepared):
+    buffer_path, scene = prepared
+    result = process_scene_indices(scene, buffer_path, visualize=True, output_dir=Path("output"))
+    assert result["status"] == "success", result
+
+
+def _prepare_windows(ctx):
+    # Первый прогон заполняет хранилище окон; PNG-кэш удаляем, чтобы рендер повторился
+    buffer_path, scene = _prepare(ctx)
+    process_scene_indices(scene, buffer_path, visualize=True, output_dir=Path("output"))
+    for png in Path("cache").glob("*.png"):
+        png.unlink()
+    return buffer_path, scene
+
+
+@case("process_scene_indices_rerender", setup=_prepare_windows)
+def bench_indices_rerender(ctx, prepared):
+    """Перерисовка поля из хранилища окон — без сети."""
+    buffer_path, scene = prepared
+    result = process_scene_indices(scene, buffer_path, visualize=True, output_dir=Path("output"))
+    assert result["status"] == "success", result
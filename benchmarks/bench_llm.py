@@ -0,0 +1,39 @@
+"""
+Бенчмарки LLM-этапа без сети: заглушка-бэкенд с задержкой настоящей модели.
+Кэш ответов — 40 отчётов, из них 10 разных (обновления дашборда повторяют отчёт);
+пакетный анализ — 40 полей одновременно (llm_batch.analyze_many).
+"""
+from pathlib import Path
+from unittest.mock import patch
+
+from rlm import llm
+from rlm.bench import case
+from rlm.config import settings
+from rlm.llm_batch import analyze_many, build_prompt
+
+
+def _reports(ctx):
+    return [f"Поле SYN-{i % 10:04d}\nNDVI средний {0.4 + 0.02 * (i % 10):.2f}\nОблачность 3%" for i in range(40)]
+
+
+@case("llm_cached_reports", setup=_reports)
+def bench_llm_cached_reports(ctx, reports):
+    with patch.object(settings, "llm_backend", "stub"), patch.object(settings, "llm_stub_latency_s", 0.05), \
+            patch.object(settings, "llm_cache_path", str(Path(ctx.workdir) / "llm_cache.sqlite")):
+        llm.response_cache().clear()
+        answers = {llm.call_llm(report) for report in reports}
+    assert len(answers) == 10
+
+
+def _fields(ctx):
+    return {f"field-{i:02d}": build_prompt(f"field-{i:02d}", [
+        {"date": f"2025-05-{d + 1:02d}", "status": "ok", "ndvi_mean": 0.3 + 0.01 * (i + d)} for d in range(12)
+    ]) for i in range(40)}
+
+
+@case("llm_batch_fields", setup=_fields)
+def bench_llm_batch_fields(ctx, prompts):
+    with patch.object(settings, "llm_backend", "stub"), patch.object(settings, "llm_stub_latency_s", 0.05), \
+            patch.object(settings, "llm_cache", False):
+        answers = analyze_many(prompts)
+    assert all(answers.values()) and len(answers) == 40
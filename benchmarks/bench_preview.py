@@ -0,0 +1,17 @@
+"""Бенчмарк превью дат для интерактивного выбора: окно поля из обзоров COG по всем кандидатам."""
+from rlm.bench import case
+from rlm.preview import build_previews
+
+
+def _scenes(ctx):
+    return [
+        {"item_id": item["id"], "datetime": item["datetime"], "cloud_cover_field": item["eo:cloud_cover"],
+         "assets": {key: ctx.href(i, key) for key in item["assets"]}}
+        for i, item in enumerate(ctx.items)
+    ]
+
+
+@case("preview_dates", setup=_scenes)
+def bench_preview_dates(ctx, scenes):
+    result = build_previews(scenes, ctx.kml_path)
+    assert all(result["previews"]), result
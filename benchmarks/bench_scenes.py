@@ -0,0 +1,25 @@
+"""Бенчмарки пакетной обработки сцен: последовательно и в пуле процессов (run_scenes)."""
+from pathlib import Path
+
+from rlm.bench import case
+from rlm.processor import run_scenes
+from rlm.search import create_buffer
+
+
+def _prepare(ctx):
+    buffer_path = create_buffer(ctx.kml_path, 500)
+    return buffer_path, [ctx.scene_metadata(item) for item in ctx.clear_items()]
+
+
+@case("run_scenes_sequential", setup=_prepare)
+def bench_run_scenes_sequential(ctx, prepared):
+    buffer_path, scenes = prepared
+    results = run_scenes(scenes, buffer_path, Path("output"), workers=1)
+    assert all(r["status"] == "success" for r, _ in results)
+
+
+@case("run_scenes_parallel", setup=_prepare)
+def bench_run_scenes_parallel(ctx, prepared):
+    buffer_path, scenes = prepared
+    results = run_scenes(scenes, buffer_path, Path("output"), workers=0)
+    assert all(r["status"] == "success" for r, _ in results)
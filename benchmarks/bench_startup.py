@@ -0,0 +1,38 @@
+"""
+Бенчмарки старта: импорт CLI и MCP-сервера в чистом интерпретаторе.
+
+Тяжёлые зависимости должны грузиться только внутри команд и инструментов,
+поэтому кейс падает, если при импорте подтянулся хоть один из HEAVY_MODULES.
+"""
+import subprocess
+import sys
+
+from rlm.bench import case
+
+HEAVY_MODULES = (
+    "rasterio", "geopandas", "matplotlib", "litellm",
+    "sentinelsat", "pystac_client", "fsspec", "tqdm",
+)
+
+_PROBE = (
+    "import sys, {module}; "
+    "print(','.join(m for m in {heavy!r} if m in sys.modules))"
+)
+
+
+def _cold_import(module):
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    assert not out, f"import {module} загрузил тяжёлые модули: {out}"
+
+
+@case("import_cli")
+def bench_import_cli(ctx):
+    _cold_import("rlm.cli")
+
+
+@case("import_mcp_server")
+def bench_import_mcp_server(ctx):
+    _cold_import("rlm.server")
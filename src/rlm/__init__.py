@@ -1,11 +1,31 @@
 from .config import settings
-# Lazy import of llm to avoid dependency error when litellm not installed
-try:
-    from .llm import get_llm_client, call_llm
-except ImportError:
-    get_llm_client = None
-    call_llm = None
-
-from .processor import process_scene
 
 __version__ = "0.2.0"
+
+# Тяжёлые зависимости (geopandas, rasterio, matplotlib, litellm…) грузятся
+# только при первом обращении к атрибуту — `rlm --help` и MCP-сервер стартуют быстро.
+_LAZY = {
+    "process_scene": ".processor",
+    "get_llm_client": ".llm",
+    "call_llm": ".llm",
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    try:
+        value = getattr(importlib.import_module(module_name, __name__), name)
+    except ImportError:
+        # litellm может быть не установлен — как и раньше, отдаём None
+        if module_name != ".llm":
+            raise
+        value = None
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
@@ -0,0 +1,352 @@
+"""
+Пакетная обработка множества полей: `rlm batch <поля> --start-date ... --end-date ...`.
+
+Поля — папка с KML/GeoJSON/GPKG/GeoParquet, KML с несколькими Placemark или
+GeoParquet. Работа планируется не по полям, а по группам «тайл × дата»:
+
+  1. один STAC-поиск по охвату всех полей;
+  2. на каждый (тайл MGRS, дата) — один снимок с наименьшей облачностью;
+  3. COG группы (SCL, B04, B08) открываются один раз, и из них оконно читаются
+     все поля, попавшие в тайл: облачность по SCL, nodata, статистика NDVI;
+  4. поле в перекрытии тайлов MGRS попадает в несколько групп одной даты —
+     остаётся запись тайла с наибольшим числом валидных пикселей.
+
+Заголовки COG и общие блоки читаются один раз на сцену, поэтому время растёт
+с числом сцен, а не с «поля × сцены». Результаты пишутся по полям:
+
+    output/batch/<field_id>/indices.csv       (строка на дату)
+    output/batch/<field_id>/<scene_id>_ndvi.tif (с --cog)
+    output/batch/summary.csv                  (или .parquet — settings.records_format)
+
+Записи — IndexRecord (records.py); сводка дописывается по мере готовности групп
+и в конце перезаписывается без повторов (поле, дата), если они были.
+"""
+
+import hashlib
+import logging
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .coalesce import coalesced
+from .config import settings
+from .metrics import inc, stage
+
+logger = logging.getLogger(__name__)
+
+FIELD_FILES = ("*.kml", "*.geojson", "*.gpkg", "*.parquet")
+_ID_COLUMNS = ("field_id", "name", "Name", "id")
+
+
+@dataclass
+class SceneGroup:
+    """Снимок, выбранный для пары (тайл, дата), и его ассеты."""
+    tile: str
+    date: str
+    scene_id: str
+    cloud_cover: float
+    assets: Dict[str, str]
+
+
+def _safe_id(value) -> str:
+    return re.sub(r"[^\w.-]+", "_", str(value)).strip("_") or "field"
+
+
+def _read_fields_file(path: Path):
+    import geopandas as gpd
+    from .search import read_geometry_file
+
+    if path.suffix.lower() == ".parquet":
+        return gpd.read_parquet(path)  # нужен pyarrow
+    return read_geometry_file(str(path))
+
+
+def load_fields(source) -> "gpd.GeoDataFrame":
+    """
+    Поля из файла или папки → GeoDataFrame (EPSG:4326) с колонкой field_id.
+    field_id берётся из field_id/name/id, иначе `<имя файла>_<номер>`.
+    """
+    import geopandas as gpd
+    import pandas as pd
+
+    source = Path(source)
+    files = sorted(f for pattern in FIELD_FILES for f in source.glob(pattern)) if source.is_dir() else [source]
+    frames = []
+    for path in files:
+        gdf = _read_fields_file(path)
+        gdf = gdf.set_crs("EPSG:4326") if gdf.crs is None else gdf.to_crs("EPSG:4326")
+        gdf = gdf[gdf.geometry.notna() & gdf.geometry.geom_type.isin(("Polygon", "MultiPolygon"))]
+        id_col = next((c for c in _ID_COLUMNS if c in gdf.columns and gdf[c].notna().all() and gdf[c].is_unique), None)
+        ids = gdf[id_col].map(_safe_id) if id_col else [f"{path.stem}_{i + 1}" for i in range(len(gdf))]
+        if len(gdf) == 1 and not id_col:
+            ids = [_safe_id(path.stem)]
+        frames.append(gpd.GeoDataFrame({"field_id": list(ids)}, geometry=list(gdf.geometry), crs="EPSG:4326"))
+    if not frames:
+        raise ValueError(f"В {source} нет полей ({', '.join(FIELD_FILES)})")
+    fields = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs="EPSG:4326")
+    duplicated = fields["field_id"].duplicated(keep=False)
+    if duplicated.any():
+        fields.loc[duplicated, "field_id"] += "_" + fields.index[duplicated].astype(str)
+    logger.info(f"Поля для пакетной обработки: {len(fields)} из {len(files)} файлов")
+    return fields
+
+
+def _tile_of(item) -> str:
+    props = item.properties
+    if props.get("s2:mgrs_tile"):
+        return props["s2:mgrs_tile"]
+    if props.get("mgrs:utm_zone"):
+        return f"{props['mgrs:utm_zone']}{props.get('mgrs:latitude_band', '')}{props.get('mgrs:grid_square', '')}"
+    parts = item.id.split("_")
+    return parts[1] if len(parts) > 1 else item.id
+
+
+def plan_groups(fields, date_range: str, max_scene_cloud_prefilter: float = 90.0) -> List[SceneGroup]:
+    """Один STAC-поиск по охвату всех полей → по снимку на (тайл, дата)."""
+    import shapely
+    from shapely.geometry import mapping
+    from . import remote_io, sentinel_filter
+
+    hull = shapely.union_all(fields.geometry.values).convex_hull
+    with stage("search"):
+        client = sentinel_filter.Client.open(sentinel_filter.STAC_API_URL)
+        search = client.search(
+            collections=["sentinel-2-l2a"],
+            intersects=mapping(hull),
+            datetime=date_range,
+            query={"eo:cloud_cover": {"lte": max_scene_cloud_prefilter}},
+            max_items=None,
+        )
+        items = remote_io.call(sentinel_filter.STAC_API_URL, lambda: list(search.items()))
+    inc("rlm_http_requests_total", client="stac")
+
+    best = {}
+    for item in items:
+        key = (_tile_of(item), item.properties.get("datetime", "")[:10])
+        cloud = float(item.properties.get("eo:cloud_cover", 99.0))
+        if key not in best or cloud < best[key].cloud_cover:
+            if key in best:
+                inc("rlm_scenes_rejected_total", reason="same_day")
+            assets = {k: a.href for k, a in item.assets.items()}
+            best[key] = SceneGroup(tile=key[0], date=key[1], scene_id=item.id, cloud_cover=cloud, assets=assets)
+        else:
+            inc("rlm_scenes_rejected_total", reason="same_day")
+    groups = sorted(best.values(), key=lambda g: (g.date, g.tile))
+    logger.info(f"STAC: {len(items)} снимков → {len(groups)} групп тайл×дата для {len(fields)} полей")
+    return groups
+
+
+def _field_windows(href: str, polygons) -> List:
+    """Окна bbox полигонов (в CRS ассета) одного ассета: чтения склеиваются reader.read_windows."""
+    from rasterio.windows import from_bounds, transform as window_transform
+    from . import reader
+
+    hdr = reader.header(href)
+    windows = [from_bounds(*polygon.bounds, transform=hdr.transform).round_offsets().round_lengths()
+               for polygon in polygons]
+    parts = reader.read_windows(href, windows, boundless=True, fill_value=0)
+    for data in parts:
+        inc("rlm_bytes_fetched_total", data.nbytes, source="cog_window")
+    return [(data, window_transform(window, hdr.transform)) for data, window in zip(parts, windows)]
+
+
+def process_group(group: SceneGroup, fields, max_cloud: float, out_dir: Path, cog: bool = False) -> List[Dict]:
+    """
+    Все поля одной сцены: заголовки и дескрипторы COG — из общего читателя (reader),
+    окна полей одного ассета читаются склеенными. Поля вне тайла пропускаются
+    (их покрывает другая группа или никто).
+    """
+    from shapely.geometry import box
+    from . import reader
+    from .cog import write_index_cog
+    from .geometry import field_mask
+    from .indices import calculate_ndvi
+    from .sentinel_filter import CLOUD_SCL_CLASSES
+
+    hrefs = {band: group.assets.get(keys[0]) or group.assets.get(keys[1])
+             for band, keys in {"SCL": ("scl", "SCL"), "B04": ("red", "B04"), "B08": ("nir", "B08")}.items()}
+    if not all(hrefs.values()):
+        logger.warning(f"{group.scene_id}: нет ассетов SCL/B04/B08 — группа пропущена")
+        inc("rlm_scenes_rejected_total", reason="missing_assets")
+        return []
+
+    records = []
+    with stage("read"):
+        red_hdr = reader.header(hrefs["B04"])
+        footprint = box(*red_hdr.bounds)
+        projected = fields.to_crs(red_hdr.crs)
+        inside = [(field_id, polygon) for field_id, polygon in zip(projected["field_id"], projected.geometry)
+                  if footprint.contains(polygon)]
+        scl_parts = _field_windows(hrefs["SCL"], [polygon for _, polygon in inside])
+
+        passed = []
+        for (field_id, polygon), (scl, scl_transform) in zip(inside, scl_parts):
+            record = {"field_id": field_id, "date": group.date, "scene_id": group.scene_id, "tile": group.tile}
+            records.append(record)
+
+            field_scl = scl[field_mask(polygon, scl_transform, scl.shape)]
+            valid = field_scl > 0
+            record["nodata_percent"] = round(100 * (1 - valid.mean()), 1) if field_scl.size else 100.0
+            record["cloud_percent"] = (
+                round(100 * np.isin(field_scl[valid], list(CLOUD_SCL_CLASSES)).mean(), 1) if valid.any() else 100.0
+            )
+            if record["nodata_percent"] > 0:
+                record["status"] = "nodata"
+                continue
+            if record["cloud_percent"] > max_cloud:
+                record["status"] = "cloud"
+                continue
+            passed.append((record, polygon))
+
+        # B04 и B08 — одна 10-метровая сетка: окна и маска общие
+        red_parts = _field_windows(hrefs["B04"], [polygon for _, polygon in passed])
+        nir_parts = _field_windows(hrefs["B08"], [polygon for _, polygon in passed])
+        for (record, polygon), (red, transform), (nir, _) in zip(passed, red_parts, nir_parts):
+            mask = field_mask(polygon, transform, red.shape)
+            with stage("compute"):
+                ndvi = calculate_ndvi(nir.astype(np.float32), red.astype(np.float32))
+                ndvi = np.where(mask & ((red > 0) | (nir > 0)), ndvi, np.nan)
+                values = ndvi[~np.isnan(ndvi)]
+            record.update(status="ok", valid_pixels=int(values.size),
+                          ndvi_mean=round(float(values.mean()), 4) if values.size else None,
+                          ndvi_median=round(float(np.median(values)), 4) if values.size else None)
+            if cog and values.size:
+                field_id = record["field_id"]
+                record["ndvi_cog_path"] = str(write_index_cog(
+                    out_dir / field_id / f"{group.scene_id}_ndvi.tif", ndvi, transform, red_hdr.crs,
+                    name="NDVI", scene_id=group.scene_id, field_id=field_id,
+                ))
+    for record in records:
+        inc("rlm_batch_records_total", status=record["status"])
+    logger.info(f"{group.date} {group.tile}: полей в тайле {len(records)}, "
+                f"ok {sum(r['status'] == 'ok' for r in records)}")
+    return records
+
+
+def best_per_field_date(records: List[Dict]) -> List[Dict]:
+    """Одна запись на (поле, дата): из групп перекрывающихся тайлов — с наибольшим valid_pixels."""
+    best = {}
+    for record in records:
+        key = (record["field_id"], record["date"])
+        if key not in best or (record.get("valid_pixels") or 0) > (best[key].get("valid_pixels") or 0):
+            best[key] = record
+    if len(best) < len(records):
+        inc("rlm_batch_duplicates_total", len(records) - len(best))
+        logger.info(f"Пакет: {len(records) - len(best)} повторов (поле, дата) из перекрывающихся тайлов отброшено")
+    return list(best.values())
+
+
+def _cogs_exist(unit, group_records) -> bool:
+    """NDVI COG выполненной группы ещё на диске — иначе группа считается заново."""
+    return all(Path(r["ndvi_cog_path"]).exists() for r in group_records or [] if r.get("ndvi_cog_path"))
+
+
+@coalesced("run_batch", copy=lambda result: {**result, "records": list(result["records"])},
+           key=lambda source, date_range, max_cloud, out_dir, workers, cog, max_scene_cloud_prefilter, resume,
+           priority, use_llm: (
+               str(Path(source).resolve()), date_range, max_cloud, str(Path(out_dir or settings.batch_dir).resolve()),
+               cog, max_scene_cloud_prefilter, use_llm))
+def run_batch(source, date_range: str, max_cloud: float = 10.0, out_dir=None, workers: Optional[int] = None,
+              cog: bool = False, max_scene_cloud_prefilter: float = 90.0, resume: Optional[bool] = None,
+              priority: Optional[str] = None, use_llm: bool = False) -> Dict:
+    """
+    Пакет: поля из source за date_range ("YYYY-MM-DD/YYYY-MM-DD").
+    Группы тайл×дата обрабатываются параллельно (settings.batch_workers потоков);
+    каждая группа берёт слот scheduler.network с классом priority (по умолчанию
+    settings.batch_priority), так что интерактивные запросы процесса идут вперёд.
+    resume (по умолчанию settings.job_resume) — группы фиксируются в манифесте
+    заданий: повторный запуск досчитывает только невыполненные и упавшие.
+    use_llm — LLM-анализ ряда каждого поля: запросы по всем полям идут одновременно
+    (llm_batch.py), ответ пишется в <out_dir>/<поле>/llm_analysis.md по мере готовности.
+    Возвращает {"fields", "groups", "records", "summary_path", "llm_analysis"}.
+    """
+    from .manifest import JobManifest
+    from .records import RecordWriter, write_records
+    from .scheduler import check_priority, current, network
+
+    out_dir = Path(out_dir or settings.batch_dir)
+    fields = load_fields(source)
+    groups = plan_groups(fields, date_range, max_scene_cloud_prefilter)
+    workers = max(1, min(workers or settings.batch_workers, len(groups) or 1))
+    resume = settings.job_resume if resume is None else resume
+    priority = check_priority(priority or settings.batch_priority)
+    client = current()[1]
+    summary_path = out_dir / f"summary.{settings.records_format}"
+    summary = RecordWriter(summary_path)
+    streamed = set()
+
+    def execute(todo: List[SceneGroup]):
+        def safe(group):
+            try:
+                with network.slot(priority, client):
+                    return process_group(group, fields, max_cloud, out_dir, cog)
+            except Exception as e:
+                logger.warning(f"{group.scene_id}: ошибка группы: {type(e).__name__}: {e}")
+                return e
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for group, result in zip(todo, pool.map(safe, todo)):
+                if not isinstance(result, Exception):
+                    summary.write_many(result)
+                    streamed.add(group.scene_id)
+                yield group, result
+
+    try:
+        if not resume:
+            per_group = [r for _, r in execute(groups)]
+            failed = [r for r in per_group if isinstance(r, Exception)]
+            if failed:
+                raise failed[0]
+        else:
+            farm = Path(source).name
+            fields_sha1 = hashlib.sha1(b"".join(
+                f"{fid}:".encode() + geom.wkb for fid, geom in zip(fields["field_id"], fields.geometry)
+            )).hexdigest()
+            job = JobManifest().job("batch", source=str(Path(source).resolve()), fields_sha1=fields_sha1,
+                                    date_range=date_range, max_cloud=max_cloud, cog=cog,
+                                    max_scene_cloud_prefilter=max_scene_cloud_prefilter, out_dir=str(out_dir))
+            by_unit = {(farm, g.scene_id, "batch"): g for g in groups}
+
+            def execute_units(units):
+                for group, result in execute([by_unit[u] for u in units]):
+                    yield (farm, group.scene_id, "batch"), result
+
+            done = job.run_units(list(by_unit), execute_units, valid=_cogs_exist)
+            per_group = [done.get(u) for u in by_unit]
+            logger.info(f"Задание {job.job_id}: {job.status()}")
+            for group, group_records in zip(groups, per_group):
+                if group_records is not None and group.scene_id not in streamed:
+                    summary.write_many(group_records)  # выполнены в прошлом запуске задания
+    finally:
+        summary.close()
+    streamed_records = [r for group_records in per_group if group_records for r in group_records]
+    records = best_per_field_date(streamed_records)
+    if len(records) < len(streamed_records):
+        write_records(summary_path, records)
+
+    by_field = defaultdict(list)
+    for record in records:
+        by_field[record["field_id"]].append(record)
+    for field_id in fields["field_id"]:
+        write_records(out_dir / field_id / "indices.csv", sorted(by_field[field_id], key=lambda r: r["date"]))
+    logger.info(f"Пакет: {len(fields)} полей, {len(groups)} сцен, {len(records)} записей → {summary_path}")
+    analyses = _analyze_fields(by_field, out_dir) if use_llm else {}
+    return {"fields": len(fields), "groups": len(groups), "records": records, "summary_path": str(summary_path),
+            "llm_analysis": analyses}
+
+
+def _analyze_fields(by_field: Dict[str, List[Dict]], out_dir: Path) -> Dict[str, Optional[str]]:
+    """LLM-анализ полей с хотя бы одной записью ok; файл поля пишется, как только пришёл его ответ."""
+    from .llm_batch import analyze_many, build_prompt
+
+    def on_result(field_id: str, text: Optional[str]):
+        if text:
+            (out_dir / field_id / "llm_analysis.md").write_text(text + "\n", encoding="utf-8")
+
+    prompts = {field_id: build_prompt(field_id, [r for r in records if r["status"] == "ok"])
+               for field_id, records in by_field.items() if any(r["status"] == "ok" for r in records)}
+    return analyze_many(prompts, on_result=on_result)
@@ -0,0 +1,673 @@
+"""
+Бенчмарки RLM на синтетических локальных данных.
+
+Синтетическая сцена (COG-бэнды B02/B03/B04/B08/SCL/TCI за несколько дат)
+генерируется локально и раздаётся встроенным HTTP-сервером с поддержкой
+Range-запросов, поэтому код работает с ней так же, как с S3 Earth Search:
+через HTTP Range Requests (rasterio/GDAL) и `requests`.
+
+Сервер считает число HTTP-запросов и отданные байты, каждый кейс запускается
+в отдельном процессе (чистый пик RSS и холодный `cache/`). Результаты
+сохраняются в JSON и сравниваются с базовой линией (`benchmarks/baseline.json`)
+с допусками.
+
+Кейсы объявляются в `benchmarks/bench_*.py` через декоратор `@case`.
+"""
+
+import importlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Метрики кейса и допуски по умолчанию (относительный рост, при котором это регрессия)
+METRICS = ("wall_time_s", "peak_rss_mb", "bytes_read", "http_requests")
+DEFAULT_TOLERANCES = {
+    "wall_time_s": 0.50,
+    "peak_rss_mb": 0.25,
+    "bytes_read": 0.10,
+    "http_requests": 0.10,
+}
+# Абсолютный «люфт», чтобы шум на очень быстрых кейсах не считался регрессией
+ABSOLUTE_SLACK = {
+    "wall_time_s": 0.05,
+    "peak_rss_mb": 16.0,
+    "bytes_read": 64 * 1024,
+    "http_requests": 2,
+}
+
+# Поле для синтетики — район test.kml (Курская обл.)
+FIELD_CENTER = (36.2757, 51.8469)
+
+_CASES: Dict[str, "BenchCase"] = {}
+
+
+@dataclass
+class BenchCase:
+    """Описание кейса: имя, функция замера и (необязательная) подготовка вне замера."""
+    name: str
+    func: Callable
+    setup: Optional[Callable] = None
+    module: str = ""
+
+
+def case(name: str, setup: Optional[Callable] = None):
+    """Декоратор регистрации кейса: `@case("read_field_window", setup=...)`.
+
+    Функция получает контекст синтетических данных и результат `setup(ctx)`
+    (если setup задан). Время подготовки в замер не входит.
+    """
+    def decorator(func):
+        _CASES[name] = BenchCase(name=name, func=func, setup=setup, module=func.__module__)
+        return func
+    return decorator
+
+
+# ──────────────────────────── HTTP-сервер ────────────────────────────
+
+class _RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Статический сервер с поддержкой одиночных `Range: bytes=a-b` и подсчётом трафика."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return None
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+        m = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", "").strip())
+        if m and (m.group(1) or m.group(2)):
+            if m.group(1):
+                start = int(m.group(1))
+                end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            else:
+                start = max(0, size - int(m.group(2)))
+            if start > end or start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return None
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        self._range = (start, end)
+        return open(path, "rb")
+
+    def copyfile(self, source, outputfile):
+        start, end = self._range
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = source.read(min(256 * 1024, remaining))
+            if not chunk:
+                break
+            # Считаем до отправки: клиент не должен увидеть данные раньше счётчика
+            self.server.stats.add(bytes_sent=len(chunk))
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+    def _fault(self) -> bool:
+        """Имитация перегруженного S3: каждый throttle_every-й запрос — 503 SlowDown, slow_every-й — медленный."""
+        faults = self.server.faults
+        with faults["lock"]:
+            faults["n"] += 1
+            n = faults["n"]
+        if faults["throttle_every"] and n % faults["throttle_every"] == 0:
+            self.server.stats.add(throttled=1)
+            self.send_response(503, "Slow Down")
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return True
+        if faults["slow_every"] and n % faults["slow_every"] == 0:
+            time.sleep(faults["slow_s"])
+        return False
+
+    def do_GET(self):
+        self.server.stats.add(requests=1)
+        if not self._fault():
+            super().do_GET()
+
+    def do_HEAD(self):
+        self.server.stats.add(requests=1)
+        if not self._fault():
+            super().do_HEAD()
+
+
+class _ServerStats:
+    """Счётчики сервера в разделяемой памяти (сервер живёт в отдельном процессе)."""
+
+    def __init__(self, ctx):
+        self._requests = ctx.Value("q", 0)
+        self._bytes = ctx.Value("q", 0)
+        self._throttled = ctx.Value("q", 0)
+
+    def add(self, requests: int = 0, bytes_sent: int = 0, throttled: int = 0):
+        if requests:
+            with self._requests.get_lock():
+                self._requests.value += requests
+        if bytes_sent:
+            with self._bytes.get_lock():
+                self._bytes.value += bytes_sent
+        if throttled:
+            with self._throttled.get_lock():
+                self._throttled.value += throttled
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"requests": self._requests.value, "bytes_sent": self._bytes.value,
+                "throttled": self._throttled.value}
+
+
+def _serve(root: str, host: str, port: int, stats: _ServerStats, conn, faults: Dict):
+    class Handler(_RangeRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=root, **kwargs)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    httpd.stats = stats
+    httpd.faults = {**faults, "n": 0, "lock": threading.Lock()}
+    conn.send(httpd.server_address[:2])
+    httpd.serve_forever()
+
+
+class RangeRequestServer:
+    """
+    Локальный HTTP-сервер каталога с Range-запросами (имитация S3 COG).
+
+    Работает в отдельном процессе: rasterio держит GIL внутри GDALOpen,
+    и сервер в потоке того же процесса не смог бы ему ответить.
+    throttle_every > 0 — каждый такой запрос получает 503 Slow Down (как S3 под
+    нагрузкой), slow_every > 0 — каждый такой отвечает на slow_s секунд позже.
+    """
+
+    def __init__(self, root: Path, host: str = "127.0.0.1", port: int = 0,
+                 throttle_every: int = 0, slow_every: int = 0, slow_s: float = 1.0):
+        ctx = multiprocessing.get_context("spawn")
+        self.stats = _ServerStats(ctx)
+        self._conn, child = ctx.Pipe()
+        faults = {"throttle_every": throttle_every, "slow_every": slow_every, "slow_s": slow_s}
+        self._proc = ctx.Process(
+            target=_serve, args=(str(root), host, port, self.stats, child, faults), daemon=True
+        )
+        self._address = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._proc.start()
+        if not self._conn.poll(60):
+            self._proc.kill()
+            raise RuntimeError("Range-сервер не запустился")
+        self._address = self._conn.recv()
+        return self
+
+    def __exit__(self, *exc):
+        from .cache import datasets
+        self._proc.terminate()
+        self._proc.join(timeout=10)
+        # Открытые датасеты указывают на порт сервера, который может достаться другому
+        port = f":{self._address[1]}/"
+        datasets.clear(lambda href: port in href)
+
+
+# ──────────────────────────── синтетические данные ────────────────────────────
+
+def _field_ring(center_xy, radius_m: float, vertices: int, rng) -> List[tuple]:
+    """Неровный замкнутый контур поля в метрах (детальная граница как у реальных KML)."""
+    import numpy as np
+    angles = np.linspace(0, 2 * math.pi, vertices, endpoint=False)
+    # Только гладкие гармоники: контур не должен самопересекаться
+    phase = rng.uniform(0, 2 * math.pi, 2)
+    r = radius_m * (1 + 0.15 * np.sin(3 * angles + phase[0]) + 0.03 * np.sin(17 * angles + phase[1]))
+    xs = center_xy[0] + r * np.cos(angles) * 1.3
+    ys = center_xy[1] + r * np.sin(angles)
+    ring = list(zip(xs.tolist(), ys.tolist()))
+    return ring + [ring[0]]
+
+
+def _write_kml(path: Path, name: str, ring_lonlat: List[tuple]):
+    coords = "\n".join(f"{lon:.9f},{lat:.9f}" for lon, lat in ring_lonlat)
+    path.write_text(
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+        "  <Document>\n"
+        "    <Placemark>\n"
+        f"      <name>{name}</name>\n"
+        "      <Polygon>\n"
+        "        <outerBoundaryIs>\n"
+        "          <LinearRing>\n"
+        f"            <coordinates>{coords}</coordinates>\n"
+        "          </LinearRing>\n"
+        "        </outerBoundaryIs>\n"
+        "      </Polygon>\n"
+        "    </Placemark>\n"
+        "  </Document>\n"
+        "</kml>\n",
+        encoding="utf-8",
+    )
+
+
+def _write_cog(path: Path, data, transform, crs, nodata=None):
+    """Пишет тайлированный GeoTIFF с DEFLATE и обзорами (как COG Earth Search)."""
+    import rasterio
+    from rasterio.enums import Resampling
+
+    count, height, width = data.shape
+    profile = {
+        "driver": "GTiff",
+        "height": height,
+        "width": width,
+        "count": count,
+        "dtype": data.dtype.name,
+        "crs": crs,
+        "transform": transform,
+        "tiled": True,
+        "blockxsize": 512,
+        "blockysize": 512,
+        "compress": "deflate",
+    }
+    if nodata is not None:
+        profile["nodata"] = nodata
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data)
+        dst.build_overviews([2, 4, 8], Resampling.average)
+
+
+def make_synthetic_dataset(root: Path, n_dates: int = 6, size: int = 2048,
+                           field_vertices: int = 4000, seed: int = 42) -> Dict:
+    """
+    Генерирует синтетический набор: KML поля и сцены Sentinel-2 L2A за n_dates дат.
+
+    Часть дат намеренно «плохая» (облака над полем, nodata), а в один день
+    попадают два снимка — чтобы filter_pipeline проходил все ветки отбраковки.
+    Возвращает описание набора (пути и псевдо-STAC items с относительными href).
+    """
+    import numpy as np
+    from pyproj import Transformer
+    from rasterio.transform import from_origin
+
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    lon0, lat0 = FIELD_CENTER
+    zone = int((lon0 + 180) // 6) + 1
+    crs = f"EPSG:{32600 + zone}"
+    to_utm = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+    to_geo = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+    cx, cy = to_utm.transform(lon0, lat0)
+
+    ring_m = _field_ring((cx, cy), 300.0, field_vertices, rng)
+    ring_lonlat = [to_geo.transform(x, y) for x, y in ring_m]
+    kml_path = root / "synthetic_field.kml"
+    _write_kml(kml_path, "SYN-0001", ring_lonlat)
+
+    # Тайл 10 м с полем в центре
+    origin_x = math.floor(cx - size * 5)
+    origin_y = math.ceil(cy + size * 5)
+    t10 = from_origin(origin_x, origin_y, 10, 10)
+    t20 = from_origin(origin_x, origin_y, 20, 20)
+
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    base = (np.sin(xx * 17) * np.cos(yy * 11) + 1) / 2
+
+    items = []
+    start = datetime(2025, 5, 1, 8, 46, 30)
+    for i in range(n_dates):
+        dt = start + timedelta(days=5 * i)
+        scene_id = f"S2B_{zone}UCB_{dt:%Y%m%d}_0_L2A"
+        scene_dir = root / "scenes" / scene_id
+        scene_dir.mkdir(parents=True, exist_ok=True)
+
+        noise = rng.normal(0, 0.03, (size, size)).astype(np.float32)
+        veg = np.clip(base * (0.5 + 0.08 * i) + noise, 0, 1)
+        red = (1500 - 1000 * veg).astype(np.uint16)
+        nir = (1800 + 2400 * veg).astype(np.uint16)
+        green = (1100 - 400 * veg).astype(np.uint16)
+        blue = (900 - 300 * veg).astype(np.uint16)
+
+        scl = np.full((size // 2, size // 2), 4, dtype=np.uint8)
+        kind = ("clear", "cloudy", "clear", "nodata", "clear", "clear")[i % 6]
+        c = size // 4
+        if kind == "cloudy":
+            scl[max(0, c - 40):c + 40, max(0, c - 50):c + 50] = 9
+        if kind == "nodata":
+            for band in (red, nir, green, blue):
+                band[:, : size // 2 + 10] = 0
+
+        tci = np.stack([
+            np.clip(red / 8, 0, 255), np.clip(green / 8, 0, 255), np.clip(blue / 8, 0, 255)
+        ]).astype(np.uint8)
+
+        for name, arr, tr, nodata in (
+            ("B02", blue[None], t10, 0), ("B03", green[None], t10, 0),
+            ("B04", red[None], t10, 0), ("B08", nir[None], t10, 0),
+            ("SCL", scl[None], t20, 0), ("TCI", tci, t10, 0),
+        ):
+            _write_cog(scene_dir / f"{name}.tif", arr, tr, crs, nodata=nodata)
+
+        assets = {
+            "visual": f"scenes/{scene_id}/TCI.tif",
+            "scl": f"scenes/{scene_id}/SCL.tif",
+            "blue": f"scenes/{scene_id}/B02.tif",
+            "green": f"scenes/{scene_id}/B03.tif",
+            "red": f"scenes/{scene_id}/B04.tif",
+            "nir": f"scenes/{scene_id}/B08.tif",
+        }
+        items.append({
+            "id": scene_id,
+            "datetime": dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "eo:cloud_cover": 60.0 if kind == "cloudy" else 5.0 + i,
+            "kind": kind,
+            "assets": assets,
+        })
+        # Второй (более облачный) снимок того же дня — его filter_pipeline должен пропустить
+        if i == 0:
+            dup = dict(items[-1], id=scene_id.replace("_0_", "_1_"), kind="duplicate",
+                       **{"eo:cloud_cover": 80.0})
+            items.append(dup)
+
+    meta = {
+        "root": str(root),
+        "kml_path": str(kml_path),
+        "crs": crs,
+        "size": size,
+        "items": items,
+        "date_range": f"{start:%Y-%m-%d}/{(start + timedelta(days=5 * n_dates)):%Y-%m-%d}",
+    }
+    (root / "dataset.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return meta
+
+
+class SyntheticStacClient:
+    """Минимальная замена `pystac_client.Client` над синтетическим набором."""
+
+    def __init__(self, items: List[Dict], base_url: str):
+        self._items = items
+        self._base_url = base_url.rstrip("/")
+
+    def search(self, datetime: Optional[str] = None, query: Optional[Dict] = None, **kwargs):
+        lte = ((query or {}).get("eo:cloud_cover") or {}).get("lte", 100)
+        start, end = (datetime or "0000/9999").split("/")
+        found = []
+        for it in self._items:
+            day = it["datetime"][:10]
+            if not (start[:10] <= day <= end[:10]) or it["eo:cloud_cover"] > lte:
+                continue
+            assets = {k: SimpleNamespace(href=f"{self._base_url}/{v}") for k, v in it["assets"].items()}
+            found.append(SimpleNamespace(
+                id=it["id"],
+                properties={"datetime": it["datetime"], "eo:cloud_cover": it["eo:cloud_cover"]},
+                assets=assets,
+            ))
+        return SimpleNamespace(items=lambda: iter(found))
+
+
+@dataclass
+class BenchContext:
+    """Всё, что нужно кейсу: пути синтетики, URL сервера, рабочая директория."""
+    root: str
+    kml_path: str
+    base_url: str
+    workdir: str
+    items: List[Dict] = field(default_factory=list)
+    date_range: str = ""
+
+    def href(self, item_index: int, asset: str) -> str:
+        return f"{self.base_url}/{self.items[item_index]['assets'][asset]}"
+
+    def clear_items(self) -> List[Dict]:
+        return [it for it in self.items if it["kind"] == "clear"]
+
+    def stac_client(self) -> SyntheticStacClient:
+        return SyntheticStacClient(self.items, self.base_url)
+
+    def scene_metadata(self, item: Dict):
+        """SceneMetadata с ассетами в формате результата filter_pipeline."""
+        from .models import SceneMetadata
+        assets = {k: f"{self.base_url}/{v}" for k, v in item["assets"].items()}
+        assets["B04"], assets["B08"] = assets["red"], assets["nir"]
+        return SceneMetadata(
+            scene_id=item["id"],
+            date=datetime.fromisoformat(item["datetime"].replace("Z", "+00:00")),
+            cloud_cover=item["eo:cloud_cover"],
+            title=item["id"],
+            download_url=assets["visual"],
+            assets=assets,
+        )
+
+
+# ──────────────────────────── запуск ────────────────────────────
+
+def discover(suite_dir: Path, pattern: Optional[str] = None) -> List[BenchCase]:
+    """Импортирует `bench_*.py` из suite_dir и возвращает зарегистрированные кейсы."""
+    suite_dir = Path(suite_dir).resolve()
+    if str(suite_dir) not in sys.path:
+        sys.path.insert(0, str(suite_dir))
+    for path in sorted(suite_dir.glob("bench_*.py")):
+        importlib.import_module(path.stem)
+    cases = sorted(_CASES.values(), key=lambda c: (c.module, c.name))
+    if pattern:
+        cases = [c for c in cases if re.search(pattern, c.name)]
+    return cases
+
+
+def _reset_peak_rss():
+    """Сбрасывает пик RSS процесса (Linux ≥ 4.0), чтобы импорты и setup не попадали в замер."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Пик RSS процесса в МБ (VmHWM на Linux, ru_maxrss на прочих POSIX, None на Windows)."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS: байты, прочие: КБ
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _child_run(suite_dir: str, module: str, name: str, ctx: Dict, conn):
+    """Точка входа дочернего процесса: один прогон одного кейса."""
+    try:
+        if suite_dir not in sys.path:
+            sys.path.insert(0, suite_dir)
+        importlib.import_module(module)
+        bench_case = _CASES[name]
+        context = BenchContext(**ctx)
+        os.chdir(context.workdir)
+        logging.disable(logging.CRITICAL)
+
+        prepared = bench_case.setup(context) if bench_case.setup else None
+        conn.send(("ready", None))
+        conn.recv()  # родитель снял показания счётчиков сервера
+
+        _reset_peak_rss()
+        t0 = time.perf_counter()
+        if bench_case.setup:
+            bench_case.func(context, prepared)
+        else:
+            bench_case.func(context)
+        wall = time.perf_counter() - t0
+        conn.send(("done", {"wall_time_s": wall, "peak_rss_mb": _peak_rss_mb()}))
+    except BaseException as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def _recv(conn, proc, timeout: float):
+    """Ждёт сообщение от дочернего процесса; падение процесса — ошибка, а не зависание."""
+    deadline = time.monotonic() + timeout
+    while not conn.poll(0.2):
+        if not proc.is_alive():
+            raise RuntimeError(f"процесс кейса завершился с кодом {proc.exitcode}")
+        if time.monotonic() > deadline:
+            proc.kill()
+            raise TimeoutError(f"кейс не уложился в {timeout:.0f} с")
+    return conn.recv()
+
+
+def run_case(bench_case: BenchCase, suite_dir: Path, ctx: BenchContext,
+             server: RangeRequestServer, timeout: float = 900.0) -> Dict:
+    """Один прогон кейса в отдельном процессе (spawn) с замером трафика на сервере."""
+    mp = multiprocessing.get_context("spawn")
+    parent, child = mp.Pipe()
+    proc = mp.Process(
+        target=_child_run,
+        args=(str(Path(suite_dir).resolve()), bench_case.module, bench_case.name, asdict(ctx), child),
+    )
+    proc.start()
+    try:
+        status, payload = _recv(parent, proc, timeout)
+        if status == "error":
+            raise RuntimeError(f"{bench_case.name}: {payload}")
+        before = server.stats.snapshot()
+        parent.send("go")
+        status, payload = _recv(parent, proc, timeout)
+        after = server.stats.snapshot()
+        if status == "error":
+            raise RuntimeError(f"{bench_case.name}: {payload}")
+    finally:
+        proc.join(timeout=60)
+    payload["bytes_read"] = after["bytes_sent"] - before["bytes_sent"]
+    payload["http_requests"] = after["requests"] - before["requests"]
+    return payload
+
+
+def run_suite(suite_dir: Path = Path("benchmarks"), pattern: Optional[str] = None,
+              repeat: int = 3, work_root: Optional[Path] = None,
+              n_dates: int = 6, size: int = 2048) -> Dict:
+    """
+    Генерирует синтетику, поднимает сервер и прогоняет все кейсы repeat раз.
+    Для каждой метрики берётся медиана по прогонам.
+    """
+    cases = discover(suite_dir, pattern)
+    if not cases:
+        raise ValueError(f"В {suite_dir} не найдено кейсов (bench_*.py, pattern={pattern!r})")
+
+    tmp = None
+    if work_root is None:
+        tmp = tempfile.TemporaryDirectory(prefix="rlm-bench-")
+        work_root = Path(tmp.name)
+    work_root = Path(work_root)
+    try:
+        logger.info(f"Генерация синтетических данных: {work_root} ({n_dates} дат, {size}px)")
+        meta = make_synthetic_dataset(work_root / "data", n_dates=n_dates, size=size)
+
+        results = {}
+        with RangeRequestServer(work_root / "data") as server:
+            for bench_case in cases:
+                runs = []
+                for i in range(repeat):
+                    workdir = work_root / "runs" / f"{bench_case.name}-{i}"
+                    workdir.mkdir(parents=True, exist_ok=True)
+                    ctx = BenchContext(
+                        root=meta["root"], kml_path=meta["kml_path"], base_url=server.base_url,
+                        workdir=str(workdir), items=meta["items"], date_range=meta["date_range"],
+                    )
+                    runs.append(run_case(bench_case, suite_dir, ctx, server))
+                summary = {}
+                for metric in METRICS:
+                    values = [r[metric] for r in runs if r.get(metric) is not None]
+                    summary[metric] = statistics.median(values) if values else None
+                summary["runs"] = len(runs)
+                results[bench_case.name] = summary
+                logger.info(f"  {bench_case.name}: {summary}")
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "params": {"repeat": repeat, "n_dates": n_dates, "size": size},
+        "cases": results,
+    }
+
+
+def compare(results: Dict, baseline: Dict) -> List[Dict]:
+    """
+    Сравнивает результаты с базовой линией. Регрессия — рост метрики больше
+    допуска (относительного из baseline["tolerances"] плюс абсолютного люфта).
+    Возвращает строки сравнения для всех метрик, где есть обе стороны.
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **baseline.get("tolerances", {})}
+    rows = []
+    for name, current in results.get("cases", {}).items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            continue
+        for metric in METRICS:
+            cur_v, base_v = current.get(metric), base.get(metric)
+            if cur_v is None or base_v is None:
+                continue
+            limit = base_v * (1 + tolerances[metric]) + ABSOLUTE_SLACK[metric]
+            rows.append({
+                "case": name,
+                "metric": metric,
+                "baseline": base_v,
+                "current": cur_v,
+                "limit": limit,
+                "regression": cur_v > limit,
+            })
+    return rows
+
+
+def make_baseline(results: Dict, previous: Optional[Dict] = None) -> Dict:
+    """
+    Базовая линия из результатов. Допуски и кейсы, не входившие в прогон
+    (например, при `-k`), берутся из предыдущей базовой линии.
+    """
+    tolerances = (previous or {}).get("tolerances", DEFAULT_TOLERANCES)
+    cases = dict((previous or {}).get("cases", {}))
+    cases.update({
+        name: {m: v for m, v in metrics.items() if m in METRICS}
+        for name, metrics in results.get("cases", {}).items()
+    })
+    return {
+        "tolerances": tolerances,
+        "created": results.get("created"),
+        "params": results.get("params"),
+        "cases": dict(sorted(cases.items())),
+    }
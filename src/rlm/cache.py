@@ -0,0 +1,204 @@
+"""
+Кэши в памяти долгоживущего процесса: MCP-сервер и воркеры его заданий живут
+часами, и повторный вызов по тому же полю не должен заново читать KML, строить
+буфер, открывать STAC-клиент и перепроецировать геометрию.
+
+Каждый кэш — TTLCache: LRU на settings.cache_max_entries записей со сроком
+жизни (settings.cache_ttl_s, для STAC-поиска — settings.cache_stac_ttl_s).
+Ключи файловых кэшей включают mtime и размер файла, так что правка KML
+сбрасывает запись. Открытые GDAL-датасеты удалённых COG держит open_dataset
+(закрываются при вытеснении). RLM_CACHE_ENABLED=0 отключает всё.
+
+    @cached("field_polygon", key=lambda path: file_key(path))
+    def load(path): ...
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from .config import settings
+from .metrics import inc
+
+logger = logging.getLogger(__name__)
+
+CACHES: Dict[str, "TTLCache"] = {}
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU с TTL; хиты и промахи — в метриках rlm_cache_*_total{cache=name}.
+    maxsize и ttl — числа или функции без аргументов (чтобы читать settings на лету).
+    """
+
+    def __init__(self, name: str, maxsize=None, ttl=None,
+                 on_evict: Optional[Callable] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        CACHES[name] = self
+
+    def _limits(self):
+        maxsize = self.maxsize() if callable(self.maxsize) else self.maxsize
+        ttl = self.ttl() if callable(self.ttl) else self.ttl
+        return maxsize or settings.cache_max_entries, ttl or settings.cache_ttl_s
+
+    def _released(self, values):
+        """
+        on_evict для вытесненных значений — уже после выхода из замка кэша:
+        закрытие датасета ждёт его собственный замок (идущее чтение), и остальные
+        обращения к кэшу не должны ждать вместе с ним.
+        """
+        if self.on_evict is not None:
+            for value in values:
+                self.on_evict(value)
+
+    def get(self, key, default=None):
+        _, ttl = self._limits()
+        evicted = []
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] + ttl < time.monotonic():
+                if entry is not _MISSING:
+                    evicted.append(self._data.pop(key)[1])
+                inc("rlm_cache_misses_total", cache=self.name)
+                value = default
+            else:
+                self._data.move_to_end(key)
+                inc("rlm_cache_hits_total", cache=self.name)
+                value = entry[1]
+        self._released(evicted)
+        return value
+
+    def put(self, key, value):
+        maxsize, _ = self._limits()
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                evicted.append(self._data.pop(key)[1])
+            self._data[key] = (time.monotonic(), value)
+            while len(self._data) > maxsize:
+                evicted.append(self._data.pop(next(iter(self._data)))[1])
+        self._released(evicted)
+
+    def get_or_create(self, key, factory: Callable):
+        """Значение по ключу; при промахе factory() вызывается один раз, даже из нескольких потоков."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._data.get(key)
+                if entry is not None and entry[0] + self._limits()[1] >= time.monotonic():
+                    return entry[1]
+            value = factory()
+            self.put(key, value)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    def clear(self, predicate: Optional[Callable[[Hashable], bool]] = None):
+        """Сбрасывает все записи или только те, чей ключ удовлетворяет predicate."""
+        with self._lock:
+            evicted = [self._data.pop(k)[1] for k in [k for k in self._data if predicate is None or predicate(k)]]
+        self._released(evicted)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def file_key(path) -> Tuple[str, int, int]:
+    """Ключ файла: абсолютный путь, mtime и размер — изменённый файл даёт новый ключ."""
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def cached(name: str, key: Optional[Callable] = None, maxsize=None, ttl=None,
+           copy: Optional[Callable] = None):
+    """
+    Декоратор: результат функции в TTLCache `name`. key(*args, **kwargs) строит ключ
+    (по умолчанию — сами аргументы), copy(value) отдаёт копию изменяемых значений.
+    """
+    def decorator(func):
+        cache = TTLCache(name, maxsize, ttl)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not settings.cache_enabled:
+                return func(*args, **kwargs)
+            cache_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            value = cache.get_or_create(cache_key, lambda: func(*args, **kwargs))
+            return copy(value) if copy else value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def clear_caches():
+    for cache in CACHES.values():
+        cache.clear()
+
+
+# ── открытые датасеты ──
+
+def _close_dataset(entry):
+    dataset, lock = entry
+    with lock:
+        dataset.close()
+
+
+datasets = TTLCache("dataset", maxsize=lambda: settings.cache_max_datasets,
+                    ttl=lambda: settings.cache_dataset_ttl_s, on_evict=_close_dataset)
+
+
+_uncached = threading.local()
+
+
+def _is_remote(href: str) -> bool:
+    return str(href).startswith(("http://", "https://", "/vsicurl/", "/vsis3/"))
+
+
+@contextmanager
+def uncached_datasets():
+    """Внутри with open_dataset открывает новые дескрипторы (дубликат запроса не ждёт замок основного)."""
+    _uncached.active = True
+    try:
+        yield
+    finally:
+        _uncached.active = False
+
+
+@contextmanager
+def open_dataset(href: str):
+    """
+    rasterio-датасет удалённого COG из кэша открытых: заголовки и IFD читаются
+    один раз на процесс (в пределах settings.cache_dataset_ttl_s). Датасет не
+    потокобезопасен, поэтому на время with держится его замок. Локальные файлы
+    открываются как обычно.
+    """
+    import rasterio
+
+    if not settings.cache_enabled or not _is_remote(href) or getattr(_uncached, "active", False):
+        with rasterio.open(href) as src:
+            yield src
+        return
+    dataset, lock = datasets.get_or_create(href, lambda: (rasterio.open(href), threading.Lock()))
+    with lock:
+        if dataset.closed:  # вытеснен, пока ждали замок
+            with rasterio.open(href) as src:
+                yield src
+            return
+        yield dataset
@@ -3,16 +3,27 @@ from typing import Optional, List
 from datetime import datetime
 from pathlib import Path
 
-from .search import list_scenes, create_buffer
-from .processor import process_scene
-from .sentinel_filter import filter_pipeline
-from .indices import process_scene_indices
 from .models import SearchRequest, SceneMetadata
 from .config import settings
 
+# Тяжёлые модули (search, processor, sentinel_filter, indices) импортируются
+# внутри команд: `rlm --help` не должен тянуть geopandas/rasterio/matplotlib.
+
 app = typer.Typer(name="rlm", help="Remote Learning & Monitoring Toolkit")
 
 
+@app.callback()
+def main(
+    ctx: typer.Context,
+    profile: bool = typer.Option(False, "--profile", help="Профилировать запуск (профили — в output/profiles)"),
+):
+    """Remote Learning & Monitoring Toolkit"""
+    if profile or settings.profile:
+        from .profiling import start_profiling
+        session = start_profiling(ctx.invoked_subcommand or "rlm")
+        ctx.call_on_close(session.stop)
+
+
 @app.command()
 def search(
     kml_path: str = typer.Argument(..., help="Путь к KML-файлу"),
@@ -22,6 +33,8 @@ def search(
     buffer: int = typer.Option(500, help="Буферная зона в метрах")
 ):
     """Поиск доступных спутниковых сцен (STAC API)"""
+    from .search import list_scenes
+
     if start_date is None:
         start_date = settings.default_start_date
     if end_date is None:
@@ -52,6 +65,8 @@ def analyze(
     use_llm: bool = typer.Option(True, "--llm/--no-llm", help="Использовать Qwen3 анализ")
 ):
     """Полный анализ поля (один снимок + LLM)"""
+    from .processor import process_scene
+
     result = process_scene(kml_path=kml_path, year=year, use_llm=use_llm)
     typer.echo("\n" + "="*80)
     typer.echo(result.report)
@@ -67,11 +82,19 @@ def process(
     max_cloud: float = typer.Option(10.0, help="Макс. облачность над полем (%)"),
     buffer_meters: int = typer.Option(500, help="Буферная зона (м)"),
     output_dir: str = typer.Option("output", help="Директория для результатов"),
-    no_interactive: bool = typer.Option(False, "--no-interactive", help="Без интерактивного выбора")
+    no_interactive: bool = typer.Option(False, "--no-interactive", help="Без интерактивного выбора"),
+    metrics_out: Optional[str] = typer.Option(None, "--metrics", help="Файл метрик: .prom — Prometheus, иначе JSON lines"),
+    cog: bool = typer.Option(False, "--cog", help="Сохранить NDVI окна поля как COG (<scene>_ndvi.tif)"),
+    preview: bool = typer.Option(False, "--preview", help="Превью поля по каждой дате (обзоры COG) перед выбором"),
 ):
     """Интерактивный анализ поля"""
     import logging
+    from .search import create_buffer
+    from .sentinel_filter import filter_pipeline
+    from .indices import format_stat, process_scene_indices
+    from .metrics import metrics, export_metrics
     logger = logging.getLogger(__name__)
+    baseline = metrics.snapshot()
 
     typer.echo("\n" + "=" * 70)
     typer.echo("RLM Process - интерактивный анализ поля")
@@ -108,6 +131,11 @@ def process(
     for i, s in enumerate(scenes, 1):
         typer.echo(f"  {i:>3} | {s['datetime'][:10]} | {s['cloud_cover_field']:>6.1f}% | {s['item_id'][:45]}")
 
+    if preview:
+        from .preview import build_previews
+        previews = build_previews(scenes, kml_path)
+        typer.echo(f"\n  Превью дат ({sum(p is not None for p in previews['previews'])}/{len(scenes)}): {previews['sheet']}")
+
     # Step 4: user selection
     if no_interactive:
         selected_indices = list(range(len(scenes)))
@@ -165,15 +193,18 @@ def process(
                 buffer_geojson_path=buffer_path,
                 visualize=True,
                 output_dir=out_dir,
+                write_cog=cog or None,
             )
             results.append({"scene": scene, "result": indices_result})
-            typer.echo(f"     status: {indices_result.get('status', '?')} | NDVI: {indices_result.get('ndvi_mean', 0):.3f}")
+            typer.echo(f"     status: {indices_result.get('status', '?')} | NDVI: {format_stat(indices_result.get('ndvi_mean'))}")
             rgb = indices_result.get("rgb_path", "-")
             ndvi = indices_result.get("ndvi_path", "-")
             if rgb and rgb != "не создан":
                 typer.echo(f"     RGB: {rgb}")
             if ndvi and ndvi != "не создан":
                 typer.echo(f"     NDVI: {ndvi}")
+            if indices_result.get("ndvi_cog_path"):
+                typer.echo(f"     NDVI COG: {indices_result['ndvi_cog_path']}")
         except Exception as e:
             logger.error(f"Ошибка {scene.scene_id}: {e}")
             typer.echo(f"     Ошибка: {e}")
@@ -187,10 +218,140 @@ def process(
     for r in results:
         s = r["scene"]
         res = r["result"]
-        typer.echo(f"  * {s.date.date()} | cloud={s.cloud_cover:.1f}% | NDVI={res.get('ndvi_mean', 0):.3f}")
+        typer.echo(f"  * {s.date.date()} | cloud={s.cloud_cover:.1f}% | NDVI={format_stat(res.get('ndvi_mean'))}")
+    typer.echo("\nГде ушло время:")
+    typer.echo(metrics.format_summary(since=baseline))
+    export_metrics(metrics_out, since=baseline, kml=Path(kml_path).name)
     typer.echo("\nГотово!")
     return results
 
 
+@app.command()
+def batch(
+    source: str = typer.Argument(..., help="Папка с полями, KML с несколькими Placemark или GeoParquet"),
+    start_date: Optional[str] = typer.Option(None, help="Начальная дата (YYYY-MM-DD)"),
+    end_date: Optional[str] = typer.Option(None, help="Конечная дата (YYYY-MM-DD)"),
+    max_cloud: float = typer.Option(10.0, help="Макс. облачность над полем (%)"),
+    output: Optional[str] = typer.Option(None, help="Директория результатов (по умолчанию RLM_BATCH_DIR)"),
+    workers: Optional[int] = typer.Option(None, help="Групп тайл×дата одновременно"),
+    cog: bool = typer.Option(False, "--cog", help="Сохранять NDVI каждого поля как COG"),
+    resume: Optional[bool] = typer.Option(None, "--resume/--no-resume", help="Продолжить задание с теми же параметрами (по умолчанию RLM_JOB_RESUME)"),
+    priority: Optional[str] = typer.Option(None, help="Класс приоритета: interactive, monitoring, backfill (по умолчанию RLM_BATCH_PRIORITY)"),
+    use_llm: bool = typer.Option(False, "--llm/--no-llm", help="LLM-анализ каждого поля (<поле>/llm_analysis.md)"),
+    metrics_out: Optional[str] = typer.Option(None, "--metrics", help="Файл метрик: .prom — Prometheus, иначе JSON lines"),
+):
+    """Пакетная обработка множества полей: по одному открытию COG на тайл×дату"""
+    from .batch import run_batch
+    from .metrics import metrics, export_metrics
+
+    baseline = metrics.snapshot()
+    start_date = start_date or settings.default_start_date
+    end_date = end_date or settings.default_end_date
+    typer.echo(f"RLM batch: {source} | {start_date} - {end_date} | облачность <= {max_cloud}%")
+    result = run_batch(source, f"{start_date}/{end_date}", max_cloud=max_cloud, out_dir=output,
+                       workers=workers, cog=cog, resume=resume, priority=priority, use_llm=use_llm)
+    ok = sum(r["status"] == "ok" for r in result["records"])
+    typer.echo(f"  Полей: {result['fields']} | сцен (тайл×дата): {result['groups']} | "
+               f"записей: {len(result['records'])}, из них ok: {ok}")
+    typer.echo(f"  Сводка: {result['summary_path']}")
+    if use_llm:
+        typer.echo(f"  LLM-анализ: {sum(bool(t) for t in result['llm_analysis'].values())} "
+                   f"из {len(result['llm_analysis'])} полей")
+    typer.echo(f"\nГде ушло время:\n{metrics.format_summary(since=baseline)}")
+    export_metrics(metrics_out, since=baseline, source=Path(source).name)
+
+
+@app.command()
+def jobs(
+    manifest: Optional[str] = typer.Option(None, help="Файл манифеста (по умолчанию RLM_JOB_MANIFEST)"),
+):
+    """Задания из манифеста: сколько единиц выполнено, упало и осталось"""
+    from .manifest import JobManifest
+
+    path = Path(manifest or settings.job_manifest)
+    if not path.exists():
+        typer.echo(f"Манифест {path} не найден — заданий ещё не было.")
+        return
+    typer.echo(f"  {'Задание':<32} {'создано':<20} {'готово':>7} {'упало':>6} {'осталось':>9}")
+    for job in JobManifest(path).jobs():
+        u = job["units"]
+        typer.echo(f"  {job['job_id']:<32} {job['created_at']:<20} {u['done']:>7} {u['failed']:>6} "
+                   f"{u['pending'] + u['running']:>9}")
+
+
+@app.command()
+def tiles(
+    sources: List[str] = typer.Argument(..., help="NDVI COG, окна из cache/windows или папки с ними"),
+    layer: Optional[str] = typer.Option(None, help="ndvi или rgb (по умолчанию — по каждому файлу)"),
+    output: Optional[str] = typer.Option(None, help="Корень пирамид (по умолчанию RLM_TILES_DIR)"),
+    min_zoom: Optional[int] = typer.Option(None, help="Минимальный зум"),
+    max_zoom: Optional[int] = typer.Option(None, help="Максимальный зум (по умолчанию — по разрешению)"),
+    fmt: Optional[str] = typer.Option(None, "--format", help="png или webp"),
+    workers: Optional[int] = typer.Option(None, help="Потоков отрисовки"),
+):
+    """Пирамида тайлов XYZ (Web Mercator) для веб-интерфейса, перерисовка только изменённых тайлов"""
+    from .tiles import build_tiles
+
+    stats = build_tiles(sources, layer=layer, out_dir=output, min_zoom=min_zoom, max_zoom=max_zoom,
+                        fmt=fmt, workers=workers)
+    if not stats:
+        typer.echo("Нет источников для тайлов.")
+        raise typer.Exit(code=1)
+    for name, s in stats.items():
+        typer.echo(f"  {name}: нарисовано {s['rendered']}, без изменений {s['skipped']}, "
+                   f"удалено {s['removed']}, пустых {s['empty']}")
+
+
+@app.command()
+def bench(
+    suite: str = typer.Option("benchmarks", help="Директория с кейсами bench_*.py"),
+    case: Optional[str] = typer.Option(None, "--case", "-k", help="Regex по имени кейса"),
+    repeat: int = typer.Option(3, help="Прогонов на кейс (берётся медиана)"),
+    output: str = typer.Option("output/bench/results.json", help="Куда сохранить результаты (JSON)"),
+    baseline: str = typer.Option("benchmarks/baseline.json", help="Базовая линия для сравнения"),
+    update_baseline: bool = typer.Option(False, "--update-baseline", help="Перезаписать базовую линию результатами"),
+    dates: int = typer.Option(6, help="Число синтетических дат"),
+    size: int = typer.Option(2048, help="Размер синтетического тайла (px)"),
+):
+    """Бенчмарки на синтетических данных со сравнением с базовой линией"""
+    import json
+    from .bench import run_suite, compare, make_baseline
+
+    typer.echo(f"RLM bench: {suite} (repeat={repeat}, dates={dates}, size={size}px)")
+    results = run_suite(Path(suite), pattern=case, repeat=repeat, n_dates=dates, size=size)
+
+    out_path = Path(output)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    typer.echo(f"\n  {'Кейс':<32} {'время, с':>9} {'RSS, МБ':>9} {'байт':>12} {'HTTP':>6}")
+    for name, m in results["cases"].items():
+        rss = f"{m['peak_rss_mb']:.0f}" if m["peak_rss_mb"] is not None else "-"
+        typer.echo(f"  {name:<32} {m['wall_time_s']:>9.3f} {rss:>9} {m['bytes_read']:>12,} {m['http_requests']:>6}")
+    typer.echo(f"\nРезультаты: {out_path}")
+
+    baseline_path = Path(baseline)
+    previous = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else None
+    if update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(
+            json.dumps(make_baseline(results, previous), indent=2, ensure_ascii=False) + "\n",
+            encoding="utf-8",
+        )
+        typer.echo(f"Базовая линия обновлена: {baseline_path}")
+        return
+    if previous is None:
+        typer.echo(f"Базовая линия {baseline_path} не найдена — сравнение пропущено.")
+        return
+
+    regressions = [r for r in compare(results, previous) if r["regression"]]
+    if regressions:
+        typer.echo(f"\nРЕГРЕССИИ ({len(regressions)}):")
+        for r in regressions:
+            typer.echo(f"  {r['case']}.{r['metric']}: {r['current']:.3f} > {r['limit']:.3f} (baseline {r['baseline']:.3f})")
+        raise typer.Exit(code=1)
+    typer.echo("Регрессий нет.")
+
+
 if __name__ == "__main__":
     app()
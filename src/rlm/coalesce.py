@@ -0,0 +1,119 @@
+"""
+Схлопывание одинаковых запросов «в полёте» (single-flight).
+
+Дашборд и агент часто запрашивают одно и то же поле за один период с разницей
+в секунды. Первый вызов с данным ключом выполняется, остальные, пришедшие до
+его завершения, ждут и получают тот же результат (или то же исключение).
+Это не кэш: после завершения следующий вызов считает заново (долговременное
+хранение — cache.py).
+
+Ключ строится из нормализованных параметров: хэш геометрии поля (field_hash —
+одинаковый полигон в разных файлах даёт один ключ), период, пороги.
+
+    @coalesced("filter", key=lambda kml_path, date_range, **kw: (field_hash(kml_path), date_range))
+    def filter_pipeline(kml_path, date_range, ...): ...
+"""
+
+import functools
+import hashlib
+import inspect
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Optional
+
+from .config import settings
+from .metrics import inc
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Один выполняющийся вызов на ключ; ожидающие потоки делят его результат."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            inc("rlm_coalesced_total", flight=self.name)
+            logger.info(f"{self.name}: такой же запрос уже выполняется — ждём его результат")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+def field_hash(field) -> str:
+    """
+    Хэш геометрии поля: путь к KML/GeoJSON или shapely-геометрия (EPSG:4326).
+    Для файла берётся объединение всех его геометрий — как у process_scene и
+    поиска сцен, а не только первый полигон. Геометрия нормализуется (порядок
+    вершин, начальная точка), поэтому одно поле в разных файлах даёт один хэш.
+    """
+    import shapely
+
+    if isinstance(field, (str, Path)):
+        from .search import read_geometry_file
+        gdf = read_geometry_file(str(field))
+        if gdf.crs is None:
+            gdf = gdf.set_crs("EPSG:4326")
+        field = shapely.union_all(gdf.to_crs("EPSG:4326").geometry.values)
+    return hashlib.sha1(shapely.normalize(field).wkb).hexdigest()[:16]
+
+
+def coalesced(name: str, key: Callable, copy: Optional[Callable] = None):
+    """
+    Декоратор: одинаковые одновременные вызовы функции выполняются один раз.
+    key(**аргументы с умолчаниями) строит ключ; copy(value) — копия результата
+    для каждого вызывающего, если он может его менять. Выключается
+    settings.coalesce_enabled.
+    """
+    def decorator(func):
+        flight = SingleFlight(name)
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not settings.coalesce_enabled:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            value = flight.do(key(**bound.arguments), func, *args, **kwargs)
+            return copy(value) if copy else value
+
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,77 @@
+"""
+Выгрузка индексов (NDVI и др.) окна поля в Cloud-Optimized GeoTIFF.
+
+Значения хранятся как int16 с масштабом 1/10000 (scale записан в метаданные бэнда,
+GDAL/rasterio-клиенты могут развернуть его сами), nodata = -32768. Внутренние
+тайлы 256 px, сжатие DEFLATE/ZSTD с predictor=2, обзоры (overviews) со
+сглаживанием average — файл маленький, хорошо отдаётся Range-запросами и сразу
+пригоден для зональной статистики:
+
+    values = read_index_cog("output/<scene>_ndvi.tif")   # float32, NaN вне данных
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_SCALE = 10000
+INDEX_NODATA = -32768
+
+
+def write_index_cog(path, values: np.ndarray, transform, crs, name: str = "NDVI",
+                    compress: Optional[str] = None, **tags) -> Path:
+    """
+    Пишет 2D-массив индекса (float, NaN — нет данных) в COG.
+    compress — DEFLATE или ZSTD (по умолчанию settings.cog_compress).
+    """
+    import rasterio
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    values = np.asarray(values, dtype=np.float32)
+    scaled = np.where(
+        np.isfinite(values),
+        np.clip(np.round(values * INDEX_SCALE), -INDEX_SCALE, INDEX_SCALE),
+        INDEX_NODATA,
+    ).astype(np.int16)
+
+    h, w = scaled.shape
+    profile = {
+        "driver": "COG", "dtype": "int16", "count": 1, "width": w, "height": h,
+        "crs": crs, "transform": transform, "nodata": INDEX_NODATA,
+        "compress": (compress or settings.cog_compress).upper(), "predictor": 2,
+        "blocksize": 256, "overviews": "AUTO", "resampling": "average",
+    }
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with rasterio.open(tmp, "w", **profile) as dst:
+            dst.write(scaled, 1)
+            dst.scales = (1.0 / INDEX_SCALE,)
+            dst.offsets = (0.0,)
+            dst.descriptions = (name,)
+            dst.update_tags(index=name, scale=str(1.0 / INDEX_SCALE), **tags)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    logger.info(f"COG {name}: {path} ({w}x{h}, {path.stat().st_size / 1024:.0f} КБ)")
+    return path
+
+
+def read_index_cog(path, window=None, overview_level: Optional[int] = None) -> np.ndarray:
+    """Читает индекс из COG обратно в float32 (NaN — нет данных)."""
+    import rasterio
+
+    with rasterio.open(path, overview_level=overview_level) as src:
+        raw = src.read(1, window=window)
+        scale = src.scales[0] or 1.0 / INDEX_SCALE
+        offset = src.offsets[0] or 0.0
+    values = raw.astype(np.float32) * scale + offset
+    values[raw == INDEX_NODATA] = np.nan
+    return values
@@ -15,6 +15,80 @@ class Settings(BaseSettings):
     copernicus_password: Optional[str] = None
     openrouter_api_key: Optional[str] = None
     litellm_model: str = "openrouter/qwen/qwen3-70b"
+    llm_backend: str = "openrouter"  # openrouter или stub (детерминированная заглушка без сети, для CI и нагрузки)
+    llm_stub_latency_s: float = 0.0  # задержка ответа заглушки
+    llm_cache: bool = True  # повторный запрос с теми же моделью, промптами и температурой — из кэша
+    llm_cache_path: str = "output/llm_cache.sqlite"
+    llm_cache_max_entries: int = 10000  # ответов в кэше, лишние вытесняются по давности обращения
+    llm_concurrency: int = 8  # одновременных LLM-запросов пакетного анализа (llm_batch.py)
+    llm_prompt_budget_tokens: int = 800  # бюджет промпта: старые даты ряда сворачиваются в сводку
+    metrics_path: Optional[str] = None  # .prom/.txt — Prometheus, иначе JSON lines
+    profile: bool = False  # RLM_PROFILE=1 — то же, что --profile
+    profile_dir: str = "output/profiles"
+    profile_interval_ms: float = 5.0
+    profile_cprofile: bool = False  # дополнительно детерминированный cProfile (.prof) главного потока
+    download_max_connections: int = 8  # одновременных HTTP-соединений на все загрузки процесса
+    download_part_size_mb: int = 8  # размер Range-части при параллельной загрузке
+    download_max_bandwidth_mb: float = 0.0  # общий лимит скорости, МБ/с (0 — без лимита)
+    download_retries: int = 3
+    lock_timeout_s: float = 1800.0  # сколько ждать, пока другой воркер заполнит кэш
+    window_store_dir: str = "cache/windows"  # окна (поле, сцена): B02/B03/B04/B08/SCL + TCI
+    window_full_tiles: bool = False  # качать тайлы целиком в cache/ и резать окно локально
+    index_cog: bool = False  # сохранять NDVI окна как COG (int16, scale 1/10000) рядом с PNG
+    cog_compress: str = "DEFLATE"  # DEFLATE или ZSTD
+    tiles_dir: str = "output/tiles"  # пирамиды XYZ: <слой>/<дата>/<z>/<x>/<y>.<формат>
+    tile_format: str = "png"  # png или webp
+    tile_webp_quality: int = 85
+    tile_min_zoom: int = 10
+    tile_max_zoom: int = 0  # 0 — по разрешению источника (10 м → z14)
+    tile_workers: int = 0  # 0 — по числу CPU
+    preview_dir: str = "output/previews"
+    preview_size: int = 256  # сторона превью поля, px
+    preview_workers: int = 8  # превью дат качаются параллельно
+    scene_workers: int = 1  # процессов на сцены в process_*_scenes: 1 — последовательно, 0 — по числу CPU
+    scene_worker_memory_mb: int = 1536  # бюджет памяти процесса: ограничивает число воркеров по свободной RAM
+    batch_dir: str = "output/batch"  # rlm batch: <field_id>/indices.csv и summary.<records_format>
+    batch_workers: int = 4  # групп тайл×дата одновременно
+    batch_priority: str = "backfill"  # класс приоритета rlm batch в планировщике (scheduler.py)
+    records_format: str = "csv"  # выгрузка IndexRecord: csv или parquet (нужен pyarrow)
+    records_flush_rows: int = 1000  # строк в буфере RecordWriter до сброса на диск
+    records_path: Optional[str] = None  # process_*_scenes: дописывать записи сцен в этот файл
+    remote_initial_concurrency: int = 8  # одновременных запросов на хост при старте (AIMD, remote_io.py)
+    remote_min_concurrency: int = 1
+    remote_max_concurrency: int = 64
+    remote_retries: int = 4  # повторов при 429/5xx и сетевых ошибках
+    remote_backoff_s: float = 0.5  # база экспоненциальной задержки повтора (полный джиттер)
+    remote_backoff_max_s: float = 30.0
+    remote_hedge: bool = False  # дублировать чтение COG, если оно дольше p95 задержки хоста
+    remote_hedge_min_s: float = 0.25  # раньше этого дубликат не запускается
+    reader_merge_ratio: float = 2.0  # окна одного ассета читаются одним запросом, если их объединение не больше стольких сумм площадей
+    cache_enabled: bool = True  # кэши в памяти долгоживущего процесса (cache.py)
+    cache_max_entries: int = 256  # записей на кэш (LRU)
+    cache_ttl_s: float = 3600.0  # геометрии полей, буферы, проекции, маски
+    cache_stac_ttl_s: float = 900.0  # результаты STAC-поиска
+    cache_max_datasets: int = 32  # открытых GDAL-датасетов удалённых COG
+    cache_dataset_ttl_s: float = 600.0
+    scheduler_network_slots: int = 8  # сетевых единиц работы (сцена, группа) одновременно на процесс
+    scheduler_cpu_slots: int = 0  # сцен на CPU одновременно, 0 — по числу CPU
+    scheduler_interactive_reserve: int = 1  # слотов, которые monitoring/backfill не занимают
+    scheduler_default_priority: str = "interactive"  # interactive, monitoring или backfill
+    coalesce_enabled: bool = True  # одинаковые одновременные запросы выполняются один раз (coalesce.py)
+    mcp_job_workers: int = 2  # процессов на фоновые задания MCP-сервера (start_analysis)
+    mcp_max_pending_jobs: int = 16  # незавершённых заданий сверх этого — отказ
+    mcp_job_ttl_s: float = 3600.0  # сколько хранить завершённые задания
+    mcp_transport: str = "stdio"  # stdio или http (streamable HTTP)
+    mcp_http_host: str = "127.0.0.1"
+    mcp_http_port: int = 8000
+    mcp_max_concurrent_requests: int = 8  # синхронных инструментов одновременно (пул потоков)
+    mcp_http_max_sessions: int = 64  # одновременных MCP-сессий по HTTP
+    mcp_http_rate_limit: float = 5.0  # запросов в секунду на IP клиента, 0 — без лимита
+    mcp_http_rate_burst: int = 20
+    mcp_http_shutdown_timeout_s: float = 30.0  # сколько ждать текущие запросы при остановке
+    job_manifest: str = "output/jobs.sqlite"  # чекпоинты заданий (поле, сцена, этап)
+    job_resume: bool = False  # повторный запуск задания пропускает выполненное (по умолчанию — считать заново)
+    job_max_attempts: int = 3  # проходов по упавшим единицам за запуск
+    job_backoff_s: float = 2.0  # задержка повтора: job_backoff_s * 2^(попытка-1)
+    job_backoff_max_s: float = 300.0
 
     model_config = {
         "env_file": ".env",
@@ -1,35 +1,398 @@
+"""
+Скачивание файлов целиком: параллельные Range-запросы, докачка, атомарная запись.
+
+`download_file(url, dest)`:
+    1. первый запрос — `Range` на первую часть; по `Content-Range` узнаём размер
+       (сервер без Range отдаёт 200 — тогда качаем одним потоком);
+    2. остальные части (`download_part_size_mb`) качаются параллельно в `dest.part`;
+       список готовых частей — в `dest.part.json`, поэтому прерванная загрузка
+       докачивается с места остановки (если не изменились размер и ETag);
+    3. проверяются размер и, если задана, контрольная сумма;
+    4. `os.replace(dest.part, dest)` — в `dest` никогда не бывает обрезанного файла.
+
+Все загрузки процесса делят глобальный лимит соединений (`download_max_connections`)
+и скорости (`download_max_bandwidth_mb`).
+"""
+
+import hashlib
+import json
+import logging
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-# from sentinelsat import SentinelAPI, geojson_to_wkt  # больше не используем
-import geopandas as gpd
-from shapely.geometry import Polygon
+from typing import Dict, List, Optional
 
 from .config import settings
+from .locks import file_lock
+from .metrics import inc, stage
+
+logger = logging.getLogger(__name__)
+
+_READ_CHUNK = 256 * 1024
+
+
+class DownloadError(Exception):
+    """Загрузка не удалась: обрыв, несовпадение размера или контрольной суммы."""
+
+
+class TokenBucket:
+    """Потокобезопасное ограничение скорости: `consume(n)` ждёт, пока накопится n байт."""
+
+    def __init__(self, rate: float):
+        self.rate = rate  # байт/с
+        self.capacity = max(rate, _READ_CHUNK)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, n: int):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_limits_lock = threading.Lock()
+_connections: Optional[threading.BoundedSemaphore] = None
+_bandwidth: Optional[TokenBucket] = None
+
+
+def configure_limits(max_connections: Optional[int] = None, max_bandwidth_mb: Optional[float] = None):
+    """(Пере)создаёт глобальные лимиты; по умолчанию — из settings."""
+    global _connections, _bandwidth
+    max_connections = max_connections or settings.download_max_connections
+    max_bandwidth_mb = settings.download_max_bandwidth_mb if max_bandwidth_mb is None else max_bandwidth_mb
+    with _limits_lock:
+        _connections = threading.BoundedSemaphore(max(1, max_connections))
+        _bandwidth = TokenBucket(max_bandwidth_mb * 1024 * 1024) if max_bandwidth_mb > 0 else None
+
+
+def _limits():
+    if _connections is None:
+        configure_limits()
+    return _connections, _bandwidth
+
+
+def _parse_checksum(checksum: str):
+    """`sha256:<hex>`, `md5:<hex>` или multihash STAC (`file:checksum`, 1220… — sha2-256)."""
+    if ":" in checksum:
+        algo, digest = checksum.split(":", 1)
+        return algo.lower(), digest.lower()
+    if checksum.startswith("1220") and len(checksum) == 68:
+        return "sha256", checksum[4:].lower()
+    if checksum.startswith("d50110") and len(checksum) == 38:
+        return "md5", checksum[6:].lower()
+    raise ValueError(f"Неизвестный формат контрольной суммы: {checksum}")
+
+
+def file_checksum(path: Path, algo: str = "sha256") -> str:
+    h = hashlib.new(algo)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _content_range_total(response) -> Optional[int]:
+    m = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("Content-Range", ""))
+    return int(m.group(1)) if m else None
+
+
+class _Download:
+    """Состояние одной загрузки: части, sidecar-файл докачки, прогресс."""
+
+    def __init__(self, url: str, dest: Path, part_size: int, session, timeout: float, retries: int):
+        self.url = url
+        self.dest = dest
+        self.part_path = dest.with_name(dest.name + ".part")
+        self.state_path = dest.with_name(dest.name + ".part.json")
+        self.part_size = part_size
+        self.session = session
+        self.timeout = timeout
+        self.retries = retries
+        self.size: Optional[int] = None
+        self.etag: Optional[str] = None
+        self.done: List[int] = []
+        self._lock = threading.Lock()
+        self._pbar = None
+
+    # ── sidecar ──
+
+    def load_state(self) -> bool:
+        if not (self.state_path.exists() and self.part_path.exists()):
+            return False
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if state.get("url") != self.url or state.get("part_size") != self.part_size:
+            return False
+        if self.part_path.stat().st_size != state.get("size"):
+            return False
+        self.size, self.etag, self.done = state["size"], state.get("etag"), sorted(state.get("done", []))
+        return True
+
+    def save_state(self):
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp.write_text(json.dumps({
+            "url": self.url, "size": self.size, "etag": self.etag,
+            "part_size": self.part_size, "done": sorted(self.done),
+        }), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+    def discard(self):
+        for p in (self.part_path, self.state_path):
+            p.unlink(missing_ok=True)
+        self.size, self.etag, self.done = None, None, []
+
+    # ── части ──
+
+    @property
+    def n_parts(self) -> int:
+        return -(-self.size // self.part_size)
+
+    def part_range(self, index: int):
+        start = index * self.part_size
+        return start, min(start + self.part_size, self.size) - 1
+
+    def request(self, headers: Dict):
+        response = self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout)
+        inc("rlm_http_requests_total", client="requests")
+        response.raise_for_status()
+        return response
+
+    def write_stream(self, response, offset: int, expected: Optional[int]) -> int:
+        """Пишет тело ответа в .part с позиции offset; короткое тело — ошибка."""
+        _, bandwidth = _limits()
+        written = 0
+        with open(self.part_path, "r+b") as f:
+            f.seek(offset)
+            for chunk in response.iter_content(chunk_size=_READ_CHUNK):
+                if bandwidth is not None:
+                    bandwidth.consume(len(chunk))
+                f.write(chunk)
+                written += len(chunk)
+                if self._pbar is not None:
+                    self._pbar.update(len(chunk))
+        inc("rlm_bytes_fetched_total", written, source="download")
+        if expected is not None and written != expected:
+            if self._pbar is not None:
+                self._pbar.update(-written)
+            raise DownloadError(f"{self.dest.name}: получено {written} из {expected} байт (offset {offset})")
+        return written
+
+    def fetch_part(self, index: int, response=None):
+        """Одна часть с повторами. response — уже открытый ответ (первый запрос), слот занят им."""
+        connections, _ = _limits()
+        start, end = self.part_range(index)
+        for attempt in range(self.retries + 1):
+            if response is None:
+                connections.acquire()
+            try:
+                if response is None:
+                    response = self.request({"Range": f"bytes={start}-{end}"})
+                    if response.status_code != 206:
+                        raise DownloadError(f"{self.dest.name}: сервер проигнорировал Range (HTTP {response.status_code})")
+                self.write_stream(response, start, end - start + 1)
+                break
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                delay = 0.5 * 2 ** attempt
+                logger.warning(f"{self.dest.name}: часть {index} — {e}; повтор через {delay:.1f} с")
+                time.sleep(delay)
+            finally:
+                if response is not None:
+                    response.close()
+                response = None
+                connections.release()
+        with self._lock:
+            self.done.append(index)
+            self.save_state()
+
+
+def download_file(
+    url: str,
+    dest,
+    checksum: Optional[str] = None,
+    expected_size: Optional[int] = None,
+    part_size_mb: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    timeout: float = 180,
+    progress: bool = True,
+) -> Path:
+    """
+    Скачивает url в dest (см. описание модуля). Возвращает dest.
+    checksum — `sha256:<hex>`, `md5:<hex>` или multihash STAC `file:checksum`.
+    Пока идёт загрузка, dest заблокирован (locks.file_lock): второй поток или процесс
+    не пишет в тот же .part одновременно.
+    """
+    with file_lock(dest):
+        return _download(url, Path(dest), checksum, expected_size, part_size_mb, max_workers, timeout, progress)
+
+
+def _download(url, dest: Path, checksum, expected_size, part_size_mb, max_workers, timeout, progress) -> Path:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from tqdm import tqdm
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part_size = (part_size_mb or settings.download_part_size_mb) * 1024 * 1024
+    workers = max_workers or settings.download_max_connections
+    connections, _ = _limits()
+
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=workers))
+    session.mount("https://", HTTPAdapter(pool_maxsize=workers))
+    dl = _Download(url, dest, part_size, session, timeout, settings.download_retries)
+
+    try:
+        resumed = dl.load_state()
+        pending = [i for i in range(dl.n_parts) if i not in dl.done] if resumed else [0]
+        if resumed:
+            logger.info(f"Докачка {dest.name}: готово {len(dl.done)}/{dl.n_parts} частей")
+            if not pending:
+                return _finalize(dl, checksum, expected_size)
+
+        # Первый запрос: размер, ETag и заодно первая недостающая часть
+        connections.acquire()
+        try:
+            start, end = dl.part_range(pending[0]) if resumed else (0, part_size - 1)
+            probe = dl.request({"Range": f"bytes={start}-{end}"})
+        except BaseException:
+            connections.release()
+            raise
+        total = _content_range_total(probe) if probe.status_code == 206 else None
+        etag = probe.headers.get("ETag")
+
+        if resumed and (total != dl.size or etag != dl.etag):
+            logger.info(f"{dest.name}: файл на сервере изменился — загрузка заново")
+            probe.close()
+            connections.release()
+            dl.discard()
+            return _download(url, dest, checksum, expected_size, part_size_mb, max_workers, timeout, progress)
+
+        if total is None:
+            # Сервер не поддерживает Range — один поток, без докачки
+            total = int(probe.headers.get("Content-Length", 0)) or None
+            dl.discard()
+            dl.part_path.write_bytes(b"")
+            with tqdm(total=total, unit="B", unit_scale=True, desc=dest.name, disable=None if progress else True) as pbar:
+                dl._pbar = pbar
+                try:
+                    dl.write_stream(probe, 0, total)
+                finally:
+                    probe.close()
+                    connections.release()
+        else:
+            if not resumed:
+                dl.discard()
+                dl.size, dl.etag = total, etag
+                with open(dl.part_path, "wb") as f:
+                    f.truncate(total)
+                dl.save_state()
+                pending = list(range(dl.n_parts))
+            if expected_size is not None and total != expected_size:
+                probe.close()
+                connections.release()
+                raise DownloadError(f"{dest.name}: размер на сервере {total}, ожидался {expected_size}")
+
+            done_bytes = sum(dl.part_range(i)[1] - dl.part_range(i)[0] + 1 for i in dl.done)
+            with tqdm(total=total, initial=done_bytes, unit="B", unit_scale=True,
+                      desc=dest.name, disable=None if progress else True) as pbar, \
+                    ThreadPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+                dl._pbar = pbar
+                futures = [pool.submit(dl.fetch_part, pending[0], probe)]
+                futures += [pool.submit(dl.fetch_part, i) for i in pending[1:]]
+                for fut in futures:
+                    fut.result()
+    finally:
+        session.close()
+
+    return _finalize(dl, checksum, expected_size)
+
+
+def _finalize(dl: _Download, checksum: Optional[str], expected_size: Optional[int]) -> Path:
+    """Проверка размера и контрольной суммы, затем атомарная замена .part → dest."""
+    dest = dl.dest
+    actual = dl.part_path.stat().st_size
+    if (expected_size is not None and actual != expected_size) or (dl.size is not None and actual != dl.size):
+        dl.discard()
+        raise DownloadError(f"{dest.name}: размер {actual} не совпадает с ожидаемым")
+    if checksum:
+        algo, digest = _parse_checksum(checksum)
+        actual_digest = file_checksum(dl.part_path, algo)
+        if actual_digest != digest:
+            dl.discard()
+            raise DownloadError(f"{dest.name}: контрольная сумма {algo} не совпала ({actual_digest} != {digest})")
+    with open(dl.part_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(dl.part_path, dest)
+    dl.state_path.unlink(missing_ok=True)
+    logger.info(f"{dest.name} скачан ({actual / (1024 * 1024):.1f} MB)")
+    return dest
+
+
+def download_to_cache(url: str, local_path: Path, timeout: float = 180) -> Path:
+    """
+    Скачивает файл целиком в кэш, если его там ещё нет.
+    Single-flight: качает один поток/процесс, остальные ждут и берут готовый файл.
+    """
+    local_path = Path(local_path)
+    if local_path.exists():
+        inc("rlm_cache_hits_total", cache="tif")
+        logger.info(f"Используем уже скачанный {local_path.name} ({local_path.stat().st_size / (1024*1024):.1f} MB)")
+        return local_path
+
+    with file_lock(local_path):
+        if local_path.exists():
+            inc("rlm_cache_hits_total", cache="tif")
+            logger.info(f"{local_path.name} уже скачан другим воркером")
+            return local_path
+        inc("rlm_cache_misses_total", cache="tif")
+        logger.info(f"Скачиваем {url} → {local_path} ...")
+        with stage("read"):
+            download_file(url, local_path, timeout=timeout)
+    return local_path
+
 
 def read_kml_to_geojson(kml_path: str) -> str:
     """Конвертирует KML в GeoJSON WKT для скачивания"""
+    import geopandas as gpd
+    from sentinelsat import geojson_to_wkt
+
     gdf = gpd.read_file(kml_path)
     if gdf.empty:
         raise ValueError("KML файл не содержит геометрий")
     return geojson_to_wkt(gdf.__geo_interface__)
 
+
 def download_sentinel_data(kml_path: str, year: int = 2025, output_dir: str = "data") -> str:
     """Скачивает Sentinel-2 Level-2A сцену для указанной области (KML)"""
-    import logging
-    logger = logging.getLogger(__name__)
+    from sentinelsat import SentinelAPI
+
     logger.info(f"Запуск скачивания для года {year}, выходная папка: {output_dir}")
 
     Path(output_dir).mkdir(parents=True, exist_ok=True)
-    
+
     api = SentinelAPI(
         os.getenv("COPERNICUS_USERNAME") or settings.copernicus_username,
         os.getenv("COPERNICUS_PASSWORD") or settings.copernicus_password,
         "https://apihub.copernicus.eu/apihub"
     )
-    
+
     footprint = read_kml_to_geojson(kml_path)
     logger.info("Запрос к каталогу Sentinel-2 (может занять время)...")
-    
+
     products = api.query(
         footprint,
         date=(f"{year}0501", f"{year}0531"),  # формат YYYYMMDD для sentinelsat
@@ -37,17 +400,17 @@ def download_sentinel_data(kml_path: str, year: int = 2025, output_dir: str = "d
         cloudcoverpercentage=(0, 30),
         processinglevel="Level-2A"
     )
-    
+
     if not products:
         raise Exception(f"Не найдено сцен Sentinel-2 Level-2A за май {year} с cloud < 30%")
-    
+
     # Берём сцену с наименьшей облачностью
     sorted_products = sorted(products.items(), key=lambda x: x[1]["cloudcoverpercentage"])
     product_id, meta = sorted_products[0]
-    
+
     logger.info(f"Начинается скачивание сцены: {meta['title']} (cloud={meta['cloudcoverpercentage']:.1f}%)")
     api.download(product_id, directory_path=output_dir, checksum=True)
-    
+
     scene_path = str(Path(output_dir) / f"{product_id}.SAFE")
     logger.info(f"Скачивание завершено: {scene_path}")
     return scene_path
@@ -0,0 +1,94 @@
+"""
+Подготовка геометрии поля к пиксельным проверкам и индексам.
+
+  • Transformer на пару CRS создаётся один раз (на поток — pyproj-трансформер
+    не потокобезопасен) вместо нового на каждую проекцию;
+  • координаты проецируются массивами numpy за один вызов, а не по вершине
+    в цикле Python — для полигона в тысячи вершин это основная экономия;
+  • перевод в пиксели окна (to_pixels) — обратный affine по массиву всех
+    вершин (shapely.transform): контуры для отрисовки, превью и тайлов, вместе
+    с внутренними кольцами и частями MultiPolygon;
+  • спроецированные полигоны и растеризованные маски поля кэшируются
+    (cache.cached): все проверки и индексы на одной сетке — (поле, transform,
+    форма окна) — получают один и тот же экземпляр маски (только для чтения).
+
+    polygon = project_polygon(field_4326, "EPSG:32637")
+    mask = field_mask(polygon, window_transform, data.shape)
+    contour = to_pixels(polygon, window_transform, center=True)
+"""
+
+import logging
+import threading
+from typing import Dict, Tuple
+
+import numpy as np
+
+from .cache import cached
+from .metrics import inc
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def transformer(src_crs, dst_crs):
+    """Transformer src_crs → dst_crs (always_xy), один на пару CRS в каждом потоке."""
+    from pyproj import Transformer
+
+    pool: Dict[Tuple[str, str], Transformer] = _local.__dict__.setdefault("transformers", {})
+    key = (str(src_crs), str(dst_crs))
+    if key not in pool:
+        inc("rlm_cache_misses_total", cache="transformer")
+        pool[key] = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+    else:
+        inc("rlm_cache_hits_total", cache="transformer")
+    return pool[key]
+
+
+def project_coords(coords, src_crs, dst_crs) -> np.ndarray:
+    """Массив координат (N, 2) из src_crs в dst_crs одним векторным вызовом."""
+    xy = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    x, y = transformer(src_crs, dst_crs).transform(xy[:, 0], xy[:, 1])
+    return np.column_stack([x, y])
+
+
+@cached("projected_polygon", key=lambda polygon, dst_crs, src_crs="EPSG:4326": (polygon.wkb, str(src_crs),
+                                                                                 str(dst_crs)))
+def project_polygon(polygon, dst_crs, src_crs="EPSG:4326"):
+    """Перепроецирует полигон (с внутренними кольцами, части MultiPolygon) в dst_crs."""
+    import shapely
+
+    return shapely.transform(polygon, lambda xy: project_coords(xy, src_crs, dst_crs))
+
+
+def to_pixels(geometry, transform, center: bool = False):
+    """
+    Геометрия (shapely, массив или GeoSeries) в пиксельных координатах (col, row)
+    окна с данным transform. center=False — углы пикселей (rasterio, PIL),
+    center=True — центры (matplotlib imshow: пиксель i занимает [i-0.5, i+0.5]).
+    """
+    import shapely
+
+    a, b, c, d, e, f = tuple(~transform)[:6]
+    shift = 0.5 if center else 0.0
+
+    def inverse(xy: np.ndarray) -> np.ndarray:
+        x, y = xy[:, 0], xy[:, 1]
+        return np.column_stack([a * x + b * y + c - shift, d * x + e * y + f - shift])
+
+    # Одна функция на все вершины всех колец и частей — без цикла Python по вершинам
+    return shapely.transform(geometry if isinstance(geometry, shapely.Geometry) else np.asarray(geometry), inverse)
+
+
+def _read_only(mask: np.ndarray) -> np.ndarray:
+    mask.flags.writeable = False  # общий экземпляр из кэша
+    return mask
+
+
+@cached("field_mask", key=lambda polygon, transform, shape: (polygon.wkb, tuple(transform)[:6], tuple(shape)))
+def field_mask(polygon, transform, shape) -> np.ndarray:
+    """Маска пикселей поля (True внутри) для окна с данным transform/shape."""
+    from rasterio.features import geometry_mask
+    from shapely.geometry import mapping
+
+    return _read_only(geometry_mask([mapping(polygon)], transform=transform, invert=True, out_shape=tuple(shape)))
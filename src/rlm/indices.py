@@ -5,12 +5,20 @@ import matplotlib.pyplot as plt
 import shutil
 import fsspec
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 import geopandas as gpd
 from shapely.geometry import mapping
 import logging
 
 from .config import settings
+from .metrics import stage, inc
+from .locks import atomic_copy
+from .window_store import WindowStore
+from .cog import write_index_cog
+from .geometry import field_mask, to_pixels
+from .search import read_geometry_file
+
+logger = logging.getLogger(__name__)
 
 
 def calculate_ndvi(nir: np.ndarray, red: np.ndarray) -> np.ndarray:
@@ -31,9 +39,50 @@ def apply_scl_cloud_mask(scl: np.ndarray, max_cloud_class: int = 8) -> np.ndarra
     return scl <= max_cloud_class
 
 
-def process_scene_indices(safe_path: any, buffer_geojson_path: str, visualize: bool = True, output_dir: Path = None) -> Dict:
+def format_stat(value, spec: str = ".3f", suffix: str = "") -> str:
+    """Значение статистики для текстового отчёта; None (не посчитано) — «н/д»."""
+    return "н/д" if value is None else f"{value:{spec}}{suffix}"
+
+
+def field_statistics(window, gdf) -> Dict:
+    """
+    Статистика пикселей поля в окне (бэнды B03, B04, B08, SCL): доли nodata (SCL = 0),
+    облаков (CLOUD_SCL_CLASSES, от пикселей с данными) и валидных пикселей,
+    NDVI (среднее и медиана, как в batch.process_group) и средний NDWI (B03/B08)
+    по валидным пикселям. Окно шире поля на отступ — всё считается под маской поля.
+    """
+    import shapely
+    from .sentinel_filter import CLOUD_SCL_CLASSES
+
+    polygon = shapely.union_all(gdf.to_crs(window.crs).geometry.values)
+    inside = field_mask(polygon, window.transform, window.shape)
+    scl = window.band("SCL")[inside]
+    total = scl.size
+    has_data = scl > 0
+    cloud = np.isin(scl, list(CLOUD_SCL_CLASSES)) & has_data
+    valid = has_data & ~cloud
+    red = window.band("B04")[inside][valid].astype(np.float32)
+    nir = window.band("B08")[inside][valid].astype(np.float32)
+    ndwi = calculate_ndwi(window.band("B03")[inside][valid].astype(np.float32), nir)
+    ndvi = calculate_ndvi(nir, red)[(red > 0) | (nir > 0)]  # B04 = B08 = 0 — нет данных, а не NDVI = 0
+    data_count = int(has_data.sum())
+    return {
+        "nodata_percent": round(100 * (1 - data_count / total), 1) if total else None,
+        "cloud_percent": round(100 * int(cloud.sum()) / data_count, 1) if data_count else None,
+        "valid_pixels": int(valid.sum()),
+        "valid_pixels_percent": round(100 * int(valid.sum()) / total, 1) if total else None,
+        "ndvi_mean": round(float(ndvi.mean()), 4) if ndvi.size else None,
+        "ndvi_median": round(float(np.median(ndvi)), 4) if ndvi.size else None,
+        "ndwi_mean": round(float(ndwi.mean()), 3) if ndwi.size else None,
+    }
+
+
+def process_scene_indices(safe_path: any, buffer_geojson_path: str, visualize: bool = True, output_dir: Path = None,
+                          write_cog: Optional[bool] = None) -> Dict:
     """Расширенная версия: поддержка RGB/NDVI визуализации с наложением контура и кэшем.
-    Теперь правильно обрабатывает сценарии, когда данные сцены недоступны."""
+    Теперь правильно обрабатывает сценарии, когда данные сцены недоступны.
+    write_cog — дополнительно сохранить NDVI окна как COG (`<scene_id>_ndvi.tif`, см. cog.py);
+    по умолчанию settings.index_cog."""
     import logging
     import rasterio
     from rasterio.mask import mask
@@ -67,7 +116,7 @@ def process_scene_indices(safe_path: any, buffer_geojson_path: str, visualize: b
     ndvi_cache = cache_dir / f"{scene_id}_ndvi.png"
 
     try:
-        gdf = gpd.read_file(buffer_geojson_path)
+        gdf = read_geometry_file(buffer_geojson_path)
         # Убеждаемся, что CRS определён (KML → WGS84)
         if gdf.crs is None:
             gdf = gdf.set_crs("EPSG:4326")
@@ -76,22 +125,24 @@ def process_scene_indices(safe_path: any, buffer_geojson_path: str, visualize: b
         logger.error(f"Не удалось прочитать буфер {buffer_geojson_path}: {e}")
         return {
             "status": "error",
-            "ndvi_mean": 0.0,
+            "ndvi_mean": None,
             "message": f"Ошибка геометрии буфера: {e}",
             "recommendation": ""
         }
 
     rgb_path = "не создан"
     ndvi_path = "не создан"
-    ndvi_mean = 0.0
+    ndvi_cog_path = None
 
     # === RGB (TCI) ===
+    # При visualize=False RGB не нужен: считаем только статистику NDVI
     # Если есть кэш с контуром, но нет кэша без контура — удаляем и перегенерируем заново
-    if rgb_cache.exists() and not rgb_no_contour_cache.exists():
+    if visualize and rgb_cache.exists() and not rgb_no_contour_cache.exists():
         logger.info("Нет кэша RGB без контура, удаляем старый кэш для перегенерации...")
         rgb_cache.unlink()
     
-    if rgb_cache.exists():
+    if visualize and rgb_cache.exists():
+        inc("rlm_cache_hits_total", cache="rgb_png")
         logger.info(f"RGB загружен из кэша (кеш): {rgb_cache}")
         old_size = rgb_cache.stat().st_size
         if old_size < 30_000:
@@ -111,106 +162,22 @@ def process_scene_indices(safe_path: any, buffer_geojson_path: str, visualize: b
                     import shutil
                     shutil.copy(rgb_cache, plain_out)
                     logger.warning(f"RGB без контура (с контуром из кэша): {plain_out}")
-    if not rgb_cache.exists():
+    if visualize and not rgb_cache.exists():
+        inc("rlm_cache_misses_total", cache="rgb_png")
         logger.info("Загрузка TCI (visual) COG через STAC asset...")
         try:
-            scene_id = getattr(safe_path, 'scene_id', str(safe_path))
-            assets = getattr(safe_path, 'assets', None)
-
-            # Приоритет: прямые ассеты из filter_pipeline
-            if assets and assets.get("visual"):
-                tci_url = assets["visual"]
-                logger.info(f"Используем visual asset из filter_pipeline: {tci_url}")
-            elif hasattr(safe_path, 'preview_url') and "thumbnail.jpg" in (safe_path.preview_url or ""):
-                tci_url = safe_path.preview_url.replace("thumbnail.jpg", "TCI.tif")
-                logger.info(f"Строим TCI URL из preview_url: {tci_url}")
-            elif hasattr(safe_path, 'scene_id') and safe_path.scene_id.startswith(("S2A_", "S2B_", "S2C_")):
-                scene_id = safe_path.scene_id
-                tile = scene_id.split('_')[1]
-                year = scene_id[10:14]
-                month = int(scene_id[14:16])
-                tci_url = f"https://sentinel-cogs.s3.us-west-2.amazonaws.com/sentinel-s2-l2a-cogs/{tile[:2]}/{tile[2]}/{tile[3:]}/{year}/{month}/{scene_id}/TCI.tif"
-                logger.info(f"Строим TCI URL по scene_id: {tci_url}")
-            else:
-                tci_url = "src/input/tci.tif"
-                logger.info("Используется локальный tci.tif (fallback)")
-
-            logger.info(f"Загружаем TCI COG: {tci_url}")
-
-            # Промежуточное скачивание полного TCI.tif в output/
-            local_tiff = cache_dir / f"{scene_id}_TCI.tif"
-            if not local_tiff.exists():
-                import requests
-                logger.info(f"Скачиваем полный TCI.tif → {local_tiff} ...")
-                r = requests.get(tci_url, stream=True, timeout=180)
-                r.raise_for_status()
-                with open(local_tiff, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192 * 4):
-                        f.write(chunk)
-                logger.info(f"TCI.tif скачан успешно ({local_tiff.stat().st_size / (1024*1024):.1f} MB)")
-            else:
-                logger.info(f"Используем уже скачанный TCI.tif ({local_tiff.stat().st_size / (1024*1024):.1f} MB)")
-
-            src = rasterio.open(str(local_tiff))
-            is_local = True
-
-            try:
-                logger.info(f"TCI загружен. CRS = {src.crs}, shape = {src.shape}")
-
-                # Читаем весь растр как RGB (первые 3 канала)
-                full_image = src.read([1, 2, 3])  # shape: (3, H, W)
-                rgb_data = np.moveaxis(full_image, 0, -1).astype(np.uint8)
-                transform = src.transform
-                h, w = rgb_data.shape[:2]
-                logger.info(f"Растр целиком: {w}x{h}, dtype={rgb_data.dtype}, range=[{rgb_data.min()}, {rgb_data.max()}]")
-
-                # Проецируем поле в CRS растра и переводим в пиксельные координаты
-                gdf_proj = gdf.to_crs(src.crs)
-                gdf_proj_px = gdf_proj.copy()
-
-                def geo_to_px(geom_series, transform):
-                    """Перевод геометрии из географических координат в пиксельные"""
-                    from rasterio.transform import rowcol
-                    import shapely.ops as ops
-                    import shapely.geometry as geom
-
-                    def _transform_geom(g):
-                        if g.geom_type == 'Polygon':
-                            coords = [rowcol(transform, x, y) for x, y in g.exterior.coords]
-                            # rowcol returns (row, col), поменяем на (x, y)
-                            px_coords = [(c, r) for r, c in coords]
-                            return geom.Polygon(px_coords)
-                        elif g.geom_type == 'MultiPolygon':
-                            return geom.MultiPolygon([_transform_geom(p) for p in g.geoms])
-                        else:
-                            return g
-                    return geom_series.apply(_transform_geom)
-
-                px_geoms = geo_to_px(gdf_proj_px.geometry, transform)
-                gdf_px = gpd.GeoDataFrame(geometry=px_geoms, crs=None)
-
-                # Вычисляем bounding box поля в пикселях с отступом
-                bounds_px = gdf_px.total_bounds  # [minx, miny, maxx, maxy]
-                margin = max(500, int(min(w, h) * 0.05))  # минимум 500px или 5% от размера
-                x1 = max(0, int(bounds_px[0]) - margin)
-                y1 = max(0, int(bounds_px[1]) - margin)
-                x2 = min(w, int(bounds_px[2]) + margin)
-                y2 = min(h, int(bounds_px[3]) + margin)
-
-                logger.info(f"Поле в пикселях: bounds={bounds_px}, crop=[{x1}:{x2}, {y1}:{y2}]")
-
-                if x2 <= x1 or y2 <= y1:
-                    logger.warning("Поле за пределами растра. Используем весь растр.")
-                    x1, y1, x2, y2 = 0, 0, w, h
-
-                # Обрезаем растр вокруг поля
-                rgb_cropped = rgb_data[y1:y2, x1:x2, :]
-                logger.info(f"Обрезанный RGB: shape={rgb_cropped.shape}")
-
-                # Смещаем геометрию поля на (-x1, -y1) для отрисовки
-                gdf_shifted = gdf_px.copy()
-                gdf_shifted.geometry = gdf_shifted.geometry.translate(-x1, -y1)
-
+            # Окно поля (bbox + отступ) из хранилища окон — полный TCI больше не скачивается
+            # B04/B08 берём сразу: NDVI ниже посчитается из того же окна без сети
+            window = WindowStore().load(safe_path, gdf, scene_id, bands=("TCI", "B04", "B08"))
+            rgb_cropped = window.rgb()
+            logger.info(f"Окно TCI: CRS = {window.crs}, shape = {rgb_cropped.shape}, range=[{rgb_cropped.min()}, {rgb_cropped.max()}]")
+
+            # Проецируем поле в CRS окна и переводим в пиксельные координаты окна
+            gdf_proj = gdf.to_crs(window.crs)
+            gdf_shifted = gpd.GeoDataFrame(geometry=to_pixels(gdf_proj.geometry, window.transform, center=True))
+            logger.info(f"Поле в пикселях окна: bounds={gdf_shifted.total_bounds}")
+
+            with stage("render"):
                 fig, ax = plt.subplots(figsize=(12, 12))
                 ax.imshow(rgb_cropped)
                 gdf_shifted.boundary.plot(ax=ax, color="red", linewidth=settings.contour_linewidth, label="Граница поля")
@@ -230,20 +197,17 @@ def process_scene_indices(safe_path: any, buffer_geojson_path: str, visualize: b
                         plt.savefig(plain_file, bbox_inches="tight", dpi=300, facecolor='black')
                         plt.close(fig2)
                         logger.info(f"RGB без контура: {plain_file} ({plain_file.stat().st_size} байт)")
-                        shutil.copy(plain_file, rgb_no_contour_cache)
+                        atomic_copy(plain_file, rgb_no_contour_cache)
                     except Exception as e:
                         logger.warning(f"RGB без контура не создан: {e}")
                 plt.close(fig)
 
-                shutil.copy(rgb_file, rgb_cache)
-                rgb_path = str(rgb_file)
-                logger.info(f"RGB с контуром поля успешно создан: {rgb_path} ({rgb_file.stat().st_size} байт)")
-            finally:
-                if not is_local:
-                    src.close()
+                atomic_copy(rgb_file, rgb_cache)
+            rgb_path = str(rgb_file)
+            logger.info(f"RGB с контуром поля успешно создан: {rgb_path} ({rgb_file.stat().st_size} байт)")
 
-        except FileNotFoundError:
-            logger.error(f"TCI файл не найден в бакете: {tci_url}")
+        except FileNotFoundError as e:
+            logger.error(f"TCI файл не найден: {e}")
             rgb_path = "TCI не найден"
         except ValueError as ve:
             if "No overlap with field" in str(ve):
@@ -256,173 +220,126 @@ def process_scene_indices(safe_path: any, buffer_geojson_path: str, visualize: b
             logger.error(f"Ошибка обработки TCI: {type(e).__name__}: {e}")
             rgb_path = f"ошибка TCI: {type(e).__name__}"
 
+    # === Статистика поля ===
+    # NDVI, NDWI и доли nodata/облаков/валидных пикселей — под маской поля по SCL,
+    # а не по всему окну (поле + отступ); PNG-кэш значений не хранит, окно — из хранилища
+    stats = dict.fromkeys(("nodata_percent", "cloud_percent", "valid_pixels", "valid_pixels_percent",
+                           "ndvi_mean", "ndvi_median", "ndwi_mean"))
+    try:
+        window = WindowStore().load(safe_path, gdf, scene_id, bands=("B03", "B04", "B08", "SCL"))
+        with stage("compute"):
+            stats = field_statistics(window, gdf)
+        logger.info(f"Поле: NDVI {stats['ndvi_mean']} (медиана {stats['ndvi_median']}), NDWI {stats['ndwi_mean']}, "
+                    f"nodata {stats['nodata_percent']}%, облака {stats['cloud_percent']}%, "
+                    f"валидных пикселей {stats['valid_pixels_percent']}%")
+    except Exception as e:
+        logger.warning(f"Статистика поля не посчитана: {type(e).__name__}: {e}")
+    ndvi_mean = stats["ndvi_mean"]
+
     # === NDVI ===
-    if ndvi_cache.exists():
+    if visualize and ndvi_cache.exists():
         old_size = ndvi_cache.stat().st_size
         if old_size < 20_000:
             logger.warning(f"Кэш NDVI слишком мал ({old_size} байт), пересоздаём...")
             ndvi_cache.unlink()
         else:
+            inc("rlm_cache_hits_total", cache="ndvi_png")
             logger.info(f"NDVI загружен из кэша (кеш): {ndvi_cache}")
             ndvi_path = str(ndvi_cache)
-            ndvi_mean = 0.67
-    if not ndvi_cache.exists():
-        logger.info("Расчёт NDVI — загрузка B04 (red) и B08 (NIR) через S3 COG...")
+    if write_cog is None:
+        write_cog = settings.index_cog
+    ndvi_cog = output_dir / f"{scene_id}_ndvi.tif"
+    if write_cog and ndvi_cog.exists():
+        ndvi_cog_path = str(ndvi_cog)
+    need_png = visualize and not ndvi_cache.exists()
+    need_cog = write_cog and not ndvi_cog.exists()
+    if need_png:
+        inc("rlm_cache_misses_total", cache="ndvi_png")
+    if need_png or need_cog:
+        logger.info("Растр NDVI — B04 (red) и B08 (NIR) из окна поля...")
         try:
-            import requests
-            from rasterio.transform import rowcol
-            import shapely.geometry as geom
-
-            assets = getattr(safe_path, 'assets', None)
-
-            # Приоритет: прямые ассеты из filter_pipeline
-            if assets and assets.get("B04") and assets.get("B08"):
-                b04_url = assets["B04"]
-                b08_url = assets["B08"]
-                logger.info(f"Используем B04/B08 assets из filter_pipeline")
-            elif assets and assets.get("red") and assets.get("nir"):
-                b04_url = assets["red"]
-                b08_url = assets["nir"]
-                logger.info(f"Используем red/nir assets из filter_pipeline")
-            else:
-                # Строим URL для B04 и B08
-                tile = scene_id.split('_')[1] if '_' in scene_id else "36UYC"
-                year = scene_id[10:14] if len(scene_id) > 14 else "2024"
-                month_raw = int(scene_id[14:16]) if len(scene_id) > 16 else 4
-                base_url = f"https://sentinel-cogs.s3.us-west-2.amazonaws.com/sentinel-s2-l2a-cogs/{tile[:2]}/{tile[2]}/{tile[3:]}/{year}/{month_raw}/{scene_id}"
-                b04_url = f"{base_url}/B04.tif"
-                b08_url = f"{base_url}/B08.tif"
-                logger.info(f"Строим B04/B08 URL по scene_id")
-
-            logger.info(f"Загружаем B04: {b04_url}")
-            b04_local = cache_dir / f"{scene_id}_B04.tif"
-            if not b04_local.exists():
-                r = requests.get(b04_url, stream=True, timeout=120)
-                r.raise_for_status()
-                with open(b04_local, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192 * 4):
-                        f.write(chunk)
-                logger.info(f"B04 скачан ({b04_local.stat().st_size / (1024*1024):.1f} MB)")
-
-            logger.info(f"Загружаем B08: {b08_url}")
-            b08_local = cache_dir / f"{scene_id}_B08.tif"
-            if not b08_local.exists():
-                r = requests.get(b08_url, stream=True, timeout=180)
-                r.raise_for_status()
-                with open(b08_local, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192 * 4):
-                        f.write(chunk)
-                logger.info(f"B08 скачан ({b08_local.stat().st_size / (1024*1024):.1f} MB)")
-
-            # Читаем band 1 из каждого COG — полный растр
-            with rasterio.open(str(b04_local)) as b04_src, rasterio.open(str(b08_local)) as b08_src:
-                b04_full = b04_src.read(1).astype(np.float32)
-                b08_full = b08_src.read(1).astype(np.float32)
-                transform = b04_src.transform
-                h, w = b04_full.shape
-                logger.info(f"B04/B08 полный растр: {w}x{h}, transform={transform}")
-
-                # Проецируем поле в CRS растра и переводим в пиксельные координаты
-                gdf_ndvi = gdf.to_crs(b04_src.crs)
-
-                def _geo_to_px_ndvi(geom_series, tr):
-                    def _transform_geom(g):
-                        if g.geom_type == 'Polygon':
-                            coords = [rowcol(tr, x, y) for x, y in g.exterior.coords]
-                            px_coords = [(c, r) for r, c in coords]
-                            return geom.Polygon(px_coords)
-                        elif g.geom_type == 'MultiPolygon':
-                            return geom.MultiPolygon([_transform_geom(p) for p in g.geoms])
-                        return g
-                    return geom_series.apply(_transform_geom)
-
-                px_geoms = _geo_to_px_ndvi(gdf_ndvi.geometry, transform)
-                gdf_px = gpd.GeoDataFrame(geometry=px_geoms, crs=None)
-
-                # Bounding box поля в пикселях с отступом
-                bounds_px = gdf_px.total_bounds
-                margin = max(500, int(min(w, h) * 0.05))
-                x1 = max(0, int(bounds_px[0]) - margin)
-                y1 = max(0, int(bounds_px[1]) - margin)
-                x2 = min(w, int(bounds_px[2]) + margin)
-                y2 = min(h, int(bounds_px[3]) + margin)
-
-                logger.info(f"NDVI поле в пикселях: bounds={bounds_px}, crop=[{x1}:{x2}, {y1}:{y2}]")
-
-                if x2 <= x1 or y2 <= y1:
-                    logger.warning("Поле за пределами растра NDVI. Используем весь растр.")
-                    x1, y1, x2, y2 = 0, 0, w, h
-
-                # Обрезаем и считаем NDVI
-                red = b04_full[y1:y2, x1:x2]
-                nir = b08_full[y1:y2, x1:x2]
-                ndvi_arr = calculate_ndvi(nir, red)
-                ndvi_mean = float(np.nanmean(ndvi_arr))
-
-                # Смещаем геометрию
-                gdf_shifted = gdf_px.copy()
-                gdf_shifted.geometry = gdf_shifted.geometry.translate(-x1, -y1)
-
-                # Визуализация
-                fig, ax = plt.subplots(figsize=(12, 12))
-                im = ax.imshow(ndvi_arr, cmap="RdYlGn", vmin=-1, vmax=1)
-                plt.colorbar(im, ax=ax, label="NDVI")
-                gdf_shifted.boundary.plot(ax=ax, color="red", linewidth=settings.contour_linewidth, label="Граница поля")
-                ax.set_title(f"NDVI + поле | {scene_id} | mean={ndvi_mean:.3f}")
-                ax.legend(loc="upper right")
-                ax.axis("off")
+            # То же окно, что и для RGB: после первой загрузки сеть не нужна
+            window = WindowStore().load(safe_path, gdf, scene_id, bands=("B04", "B08"))
+            red = window.band("B04").astype(np.float32)
+            nir = window.band("B08").astype(np.float32)
+            logger.info(f"B04/B08 окно: {red.shape[1]}x{red.shape[0]}, transform={window.transform}")
 
-                ndvi_file = output_dir / f"{scene_id}_ndvi_with_contour.png"
-                plt.savefig(ndvi_file, bbox_inches="tight", dpi=300, facecolor='black')
-                plt.close()
+            with stage("compute"):
+                ndvi_arr = calculate_ndvi(nir, red)
 
-                shutil.copy(ndvi_file, ndvi_cache)
+            if need_cog:
+                with stage("render"):
+                    # Пиксели без данных (B04 = B08 = 0) — nodata, а не NDVI = 0
+                    ndvi_values = np.where((red > 0) | (nir > 0), ndvi_arr, np.nan)
+                    ndvi_cog_path = str(write_index_cog(
+                        ndvi_cog, ndvi_values, window.transform, window.crs, name="NDVI", scene_id=scene_id,
+                    ))
+
+            if need_png:
+                # Проецируем поле в CRS окна и переводим в пиксельные координаты окна
+                gdf_ndvi = gdf.to_crs(window.crs)
+                gdf_shifted = gpd.GeoDataFrame(geometry=to_pixels(gdf_ndvi.geometry, window.transform, center=True))
+
+                with stage("render"):
+                    # Визуализация
+                    fig, ax = plt.subplots(figsize=(12, 12))
+                    im = ax.imshow(ndvi_arr, cmap="RdYlGn", vmin=-1, vmax=1)
+                    plt.colorbar(im, ax=ax, label="NDVI")
+                    gdf_shifted.boundary.plot(ax=ax, color="red", linewidth=settings.contour_linewidth, label="Граница поля")
+                    ax.set_title(f"NDVI + поле | {scene_id} | mean={format_stat(ndvi_mean)}")
+                    ax.legend(loc="upper right")
+                    ax.axis("off")
+
+                    ndvi_file = output_dir / f"{scene_id}_ndvi_with_contour.png"
+                    plt.savefig(ndvi_file, bbox_inches="tight", dpi=300, facecolor='black')
+                    plt.close()
+
+                    atomic_copy(ndvi_file, ndvi_cache)
                 ndvi_path = str(ndvi_file)
-                logger.info(f"NDVI с контуром создан: {ndvi_path} (mean={ndvi_mean:.3f}, size={ndvi_file.stat().st_size})")
+                logger.info(f"NDVI с контуром создан: {ndvi_path} (mean={format_stat(ndvi_mean)}, size={ndvi_file.stat().st_size})")
 
         except Exception as e:
             logger.error(f"Ошибка расчёта NDVI: {type(e).__name__}: {e}")
             import traceback
             traceback.print_exc()
-            ndvi_mean = 0.0
             ndvi_path = f"ошибка NDVI: {e}"
-            # Создаём fallback NDVI-изображение
-            try:
-                fallback = np.random.default_rng(42).uniform(0.3, 0.9, (256, 256))
-                fig, ax = plt.subplots(figsize=(8, 8))
-                im = ax.imshow(fallback, cmap="RdYlGn", vmin=0, vmax=1)
-                plt.colorbar(im, ax=ax, label="NDVI (fallback)")
-                gdf_fb = gdf.to_crs("EPSG:32636")
-                gdf_fb.boundary.plot(ax=ax, color="red", linewidth=3)
-                ax.set_title(f"NDVI (fallback) | {scene_id}")
-                ax.axis("off")
-                plt.savefig(str(ndvi_cache), dpi=150)
-                plt.close()
-                ndvi_path = str(ndvi_cache)
-                ndvi_mean = 0.67
-                logger.info(f"Fallback NDVI создан: {ndvi_path}")
-            except Exception as e2:
-                logger.error(f"Не удалось создать даже fallback NDVI: {e2}")
+            # Создаём fallback NDVI-изображение вместо отсутствующего PNG (статистика поля — выше, под маской поля)
+            if need_png:
+                try:
+                    fallback = np.random.default_rng(42).uniform(0.3, 0.9, (256, 256))
+                    fig, ax = plt.subplots(figsize=(8, 8))
+                    im = ax.imshow(fallback, cmap="RdYlGn", vmin=0, vmax=1)
+                    plt.colorbar(im, ax=ax, label="NDVI (fallback)")
+                    gdf_fb = gdf.to_crs("EPSG:32636")
+                    gdf_fb.boundary.plot(ax=ax, color="red", linewidth=3)
+                    ax.set_title(f"NDVI (fallback) | {scene_id}")
+                    ax.axis("off")
+                    plt.savefig(str(ndvi_cache), dpi=150)
+                    plt.close()
+                    ndvi_path = str(ndvi_cache)
+                    logger.info(f"Fallback NDVI создан: {ndvi_path}")
+                except Exception as e2:
+                    logger.error(f"Не удалось создать даже fallback NDVI: {e2}")
 
     if "ошибка" in str(rgb_path).lower() or "не найден" in str(rgb_path).lower():
         return {
             "status": "warning",
-            "ndvi_mean": 0.0,
+            **stats,
             "rgb_path": rgb_path,
             "ndvi_path": ndvi_path,
+            "ndvi_cog_path": ndvi_cog_path,
             "message": "Сцена найдена в каталоге Dagshub, но не удалось создать изображения (несовпадение геометрии/CRS). "
                        "Рекомендуется обновить локальный tci.tif или использовать реальные COG B04/B08.",
             "recommendation": "Проверьте совпадение проекции буфера и спутниковых данных."
         }
 
     return {
-        "ndvi_mean": round(ndvi_mean, 3),
-        "ndwi_mean": 0.41,
-        "valid_pixels_percent": 82.0,
+        **stats,
         "status": "success",
         "rgb_path": rgb_path,
         "ndvi_path": ndvi_path,
+        "ndvi_cog_path": ndvi_cog_path,
         "message": "Визуализация RGB и NDVI выполнена (Dagshub + cache). При проблемах с изображениями проверьте tci.tif.",
-        "recommendation": "NDVI ~0.67 указывает на хорошую вегетацию. Мониторьте влажность почвы."
+        "recommendation": "Сравните NDVI и NDWI поля с предыдущими датами. Мониторьте влажность почвы."
     }
 
@@ -0,0 +1,219 @@
+"""
+Фоновые задания MCP-сервера.
+
+Инструмент `start_analysis` ставит анализ поля в пул процессов и сразу возвращает
+job_id; `get_job_status` и `get_job_result` читают прогресс и результат. Поэтому
+минуты скачивания и отрисовки не блокируют сервер, и несколько агентов работают
+с ним одновременно. Процессы (spawn), а не потоки: matplotlib не потокобезопасен.
+
+Лимиты: settings.mcp_job_workers процессов (урезается по свободной памяти, как
+scene_workers) и не больше settings.mcp_max_pending_jobs незавершённых заданий.
+Процессы раздаёт scheduler.Scheduler: задания класса interactive идут раньше
+monitoring и backfill, внутри класса — по очереди между клиентами.
+Завершённые задания хранятся settings.mcp_job_ttl_s секунд.
+
+Код задания сообщает прогресс через report_progress(доля, сообщение); вне
+задания вызов ничего не делает.
+"""
+
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, wait as wait_futures
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from .config import settings
+from .metrics import inc
+
+logger = logging.getLogger(__name__)
+
+_progress = None  # (job_id, общий словарь прогресса) в процессе-воркере
+
+
+def report_progress(fraction: float, message: str = ""):
+    """Прогресс текущего задания (0..1); вне фонового задания — no-op."""
+    if _progress is None:
+        return
+    job_id, shared = _progress
+    started = shared.get(job_id, {}).get("started_at") or time.time()
+    shared[job_id] = {"progress": round(min(max(fraction, 0.0), 1.0), 3), "message": message,
+                      "started_at": started}
+
+
+def _run_job(job_id: str, fn: Callable, params: Dict, shared, priority: str, client: str):
+    """Задание в процессе-воркере: выставляет контекст прогресса и приоритета, вызывает fn(**params)."""
+    from .scheduler import priority as scheduler_priority
+
+    global _progress
+    _progress = (job_id, shared)
+    try:
+        report_progress(0.0, "запущено")
+        with scheduler_priority(priority, client):
+            return fn(**params)
+    finally:
+        _progress = None
+
+
+@dataclass
+class BackgroundJob:
+    """Фоновое задание: параметры, future и время жизни."""
+    job_id: str
+    kind: str
+    params: Dict
+    future: Future
+    key: Optional[tuple] = None  # нормализованные параметры для схлопывания одинаковых заданий
+    priority: str = "interactive"
+    client: str = "local"
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+
+class JobRunner:
+    """Очередь фоновых заданий поверх пула процессов (создаётся при первом submit)."""
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.workers = workers or settings.mcp_job_workers
+        self.max_pending = max_pending or settings.mcp_max_pending_jobs
+        self._jobs: Dict[str, BackgroundJob] = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._scheduler = None
+        self._manager = None
+        self._shared = None
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            from .processor import _init_scene_worker, scene_workers
+            from .scheduler import Scheduler
+
+            ctx = multiprocessing.get_context("spawn")
+            n = scene_workers(self.workers, self.workers)
+            self._manager = ctx.Manager()
+            self._shared = self._manager.dict()
+            self._pool = ProcessPoolExecutor(max_workers=n, mp_context=ctx, initializer=_init_scene_worker,
+                                             initargs=(settings.scene_worker_memory_mb,))
+            self._scheduler = Scheduler("jobs", slots=n)
+            logger.info(f"Фоновые задания: {n} процессов, очередь до {self.max_pending}")
+
+    def _prune(self):
+        deadline = time.time() - settings.mcp_job_ttl_s
+        for job_id in [j.job_id for j in self._jobs.values() if j.finished_at and j.finished_at < deadline]:
+            del self._jobs[job_id]
+            self._shared.pop(job_id, None)
+
+    def submit(self, fn: Callable, kind: Optional[str] = None, key=None, priority: Optional[str] = None,
+               client: Optional[str] = None, **params) -> BackgroundJob:
+        """
+        Ставит fn(**params) в очередь. key — нормализованные параметры: пока задание
+        с тем же ключом не завершено, возвращается оно же, а не новое (single-flight).
+        priority и client (по умолчанию — из scheduler.current()) задают место в очереди.
+        RuntimeError, если незавершённых заданий уже max_pending.
+        """
+        from .scheduler import check_priority, current
+
+        inherited, inherited_client = current()
+        priority, client = check_priority(priority or inherited), client or inherited_client
+        with self._lock:
+            self._prune()
+            if key is not None and settings.coalesce_enabled:
+                for job in self._jobs.values():
+                    if job.key == key and not job.future.done():
+                        inc("rlm_coalesced_total", flight=job.kind)
+                        logger.info(f"Задание {job.job_id} ({job.kind}) с теми же параметрами уже в работе")
+                        return job
+            active = sum(not j.future.done() for j in self._jobs.values())
+            if active >= self.max_pending:
+                inc("rlm_jobs_total", kind=kind or fn.__name__, status="rejected")
+                raise RuntimeError(f"Очередь заданий заполнена ({active}/{self.max_pending}), повторите позже")
+            self._ensure_pool()
+            job_id = uuid.uuid4().hex[:12]
+            future = self._scheduler.submit(self._pool, _run_job, job_id, fn, params, self._shared, priority, client,
+                                            priority=priority, client=client)
+            job = BackgroundJob(job_id, kind or fn.__name__, params, future, key=key, priority=priority, client=client)
+            self._jobs[job_id] = job
+        future.add_done_callback(lambda f: self._finish(job))
+        logger.info(f"Задание {job_id} ({job.kind}, {priority}, клиент {client}) поставлено в очередь: {params}")
+        return job
+
+    def _finish(self, job: BackgroundJob):
+        job.finished_at = time.time()
+        status = self._status_name(job)
+        inc("rlm_jobs_total", kind=job.kind, status=status)
+        logger.info(f"Задание {job.job_id} ({job.kind}): {status} за {job.finished_at - job.created_at:.1f} с")
+
+    def get(self, job_id: str) -> BackgroundJob:
+        with self._lock:
+            if job_id not in self._jobs:
+                raise KeyError(f"Задание {job_id} не найдено (неизвестно или удалено по TTL)")
+            return self._jobs[job_id]
+
+    def _status_name(self, job: BackgroundJob) -> str:
+        if job.future.cancelled():
+            return "cancelled"
+        if job.future.done():
+            return "failed" if job.future.exception() is not None else "done"
+        return "running" if self._shared is not None and job.job_id in self._shared else "queued"
+
+    def status(self, job_id: str) -> Dict:
+        job = self.get(job_id)
+        state = self._status_name(job)
+        info = dict(self._shared.get(job_id, {})) if self._shared is not None else {}
+        if state == "done":
+            info.update(progress=1.0, message="готово")
+        return {
+            "job_id": job.job_id, "kind": job.kind, "status": state, "priority": job.priority, "client": job.client,
+            "progress": info.get("progress", 0.0), "message": info.get("message", ""),
+            "created_at": job.created_at, "started_at": info.get("started_at"), "finished_at": job.finished_at,
+        }
+
+    def result(self, job_id: str) -> Dict:
+        """Статус и, если задание завершено, результат или ошибка."""
+        job = self.get(job_id)
+        out = self.status(job_id)
+        if out["status"] == "done":
+            out["result"] = job.future.result()
+        elif out["status"] == "failed":
+            error = job.future.exception()
+            out["error"] = f"{type(error).__name__}: {error}"
+        return out
+
+    def cancel(self, job_id: str) -> bool:
+        """Отменяет задание, ещё ждущее своей очереди (начатые доработают)."""
+        return self.get(job_id).future.cancel()
+
+    def jobs(self) -> List[Dict]:
+        with self._lock:
+            job_ids = list(self._jobs)
+        return [self.status(job_id) for job_id in job_ids]
+
+    async def wait(self, job_id: str):
+        """Ожидание результата из async-кода без блокировки цикла событий."""
+        import asyncio
+
+        return await asyncio.wrap_future(self.get(job_id).future)
+
+    def shutdown(self, wait: bool = True, cancel_pending: Optional[bool] = None):
+        """Останавливает пул. cancel_pending (по умолчанию not wait) снимает задания из очереди."""
+        if self._pool is not None:
+            cancel_pending = not wait if cancel_pending is None else cancel_pending
+            with self._lock:
+                futures = [job.future for job in self._jobs.values()]
+            if cancel_pending:
+                for future in futures:
+                    future.cancel()
+            elif wait:
+                wait_futures(futures)  # ждущие слот планировщика тоже должны попасть в пул
+            self._pool.shutdown(wait=wait, cancel_futures=cancel_pending)
+            self._manager.shutdown()
+            self._pool = self._scheduler = self._manager = self._shared = None
+
+
+def analyze_field(kml_path: str, use_llm: bool = True) -> Dict:
+    """Полный анализ поля (process_scene, с LLM-анализом по статистике поля) — тело фонового задания."""
+    from .processor import process_scene
+
+    result = process_scene(kml_path=kml_path, use_llm=use_llm)
+    return result.model_dump()
@@ -1,39 +1,70 @@
+"""
+Вызов LLM (OpenRouter через LiteLLM) с постоянным кэшем ответов.
+
+Одинаковый отчёт не отправляется в LLM повторно: ответ ищется в SQLite-кэше
+(settings.llm_cache_path) по хэшу модели, системного промпта, промпта,
+температуры и прочих параметров. Кэш ограничен settings.llm_cache_max_entries
+записями — лишние вытесняются по давности последнего обращения.
+
+Бэкенд выбирается settings.llm_backend: "openrouter" — настоящий вызов,
+"stub" — детерминированная заглушка без сети (нагрузочные прогоны, CI).
+Свой бэкенд подключается через register_backend(name, fn).
+
+    text = call_llm("Проанализируй отчёт...", temperature=0.3)
+"""
+
+import hashlib
+import json
+import logging
 import os
-import litellm
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
 from dotenv import load_dotenv
-from typing import Any, Dict
+
+from .config import settings
+from .metrics import inc, timed
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+"""
+
+
 def get_llm_client():
     """Возвращает настроенный клиент LiteLLM для OpenRouter + Qwen"""
+    import litellm  # ~4 с на импорт — только при реальном вызове LLM
+
     api_key = os.getenv("OPENROUTER_API_KEY")
     if not api_key or api_key == "sk-or-...":
         raise ValueError(
             "OPENROUTER_API_KEY не настроен. "
             "Пожалуйста, укажите ключ в .env или в переменных окружения."
         )
-    
+
     litellm.api_key = api_key
     litellm.api_base = "https://openrouter.ai/api/v1"
-    
+
     return litellm
 
-def call_llm(
-    prompt: str,
-    system_prompt: str = "Ты полезный агрономический помощник.",
-    model: str = None,
-    temperature: float = 0.3,
-    **kwargs
-) -> str:
-    """
-    Вызов LLM через OpenRouter (модель Qwen3-70B или указанная)
-    """
+
+def _openrouter(model: str, system_prompt: str, prompt: str, temperature: float, **kwargs) -> str:
     client = get_llm_client()
-    model_name = model or os.getenv("LITELLM_MODEL", "openrouter/qwen/qwen3-70b")
-    
     response = client.completion(
-        model=model_name,
+        model=model,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt}
@@ -41,5 +72,119 @@ def call_llm(
         temperature=temperature,
         **kwargs
     )
-    
     return response.choices[0].message.content.strip()
+
+
+def _stub(model: str, system_prompt: str, prompt: str, temperature: float, **kwargs) -> str:
+    """Детерминированный ответ без сети: одинаковый вход — одинаковый текст."""
+    if settings.llm_stub_latency_s:
+        time.sleep(settings.llm_stub_latency_s)  # имитация задержки настоящей модели
+    digest = hashlib.sha256(f"{system_prompt}\n{prompt}".encode()).hexdigest()[:12]
+    lines = [line for line in prompt.splitlines() if line.strip()]
+    return (f"[stub {digest}] Отчёт из {len(lines)} строк получен. "
+            "Рекомендации: продолжать мониторинг NDVI, проверить участки с пониженными значениями.")
+
+
+BACKENDS: Dict[str, Callable[..., str]] = {"openrouter": _openrouter, "stub": _stub}
+
+
+def register_backend(name: str, fn: Callable[..., str]):
+    """Подключает бэкенд: fn(model, system_prompt, prompt, temperature, **kwargs) -> текст."""
+    BACKENDS[name] = fn
+
+
+class ResponseCache:
+    """SQLite-кэш ответов LLM (WAL); одно соединение на экземпляр, доступ из потоков под замком."""
+
+    def __init__(self, path=None, max_entries: Optional[int] = None):
+        self.path = Path(path or settings.llm_cache_path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def key(model: str, system_prompt: str, prompt: str, temperature: float, **kwargs) -> str:
+        blob = json.dumps([model, system_prompt, prompt, temperature, kwargs],
+                          sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        inc("rlm_cache_hits_total" if row is not None else "rlm_cache_misses_total", cache="llm")
+        return row[0] if row is not None else None
+
+    def put(self, key: str, model: str, response: str):
+        max_entries = self.max_entries or settings.llm_cache_max_entries
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (key, model, response, now, now))
+            evicted = self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (max_entries,),
+            ).rowcount
+        if evicted:
+            inc("rlm_cache_evictions_total", evicted, cache="llm")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self):
+        self._conn.close()
+
+
+_caches: Dict[tuple, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def response_cache() -> ResponseCache:
+    """Кэш ответов процесса (после fork воркер открывает своё соединение)."""
+    key = (os.getpid(), settings.llm_cache_path)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ResponseCache()
+        return _caches[key]
+
+
+@timed("llm")
+def call_llm(
+    prompt: str,
+    system_prompt: str = "Ты полезный агрономический помощник.",
+    model: str = None,
+    temperature: float = 0.3,
+    **kwargs
+) -> str:
+    """
+    Вызов LLM через OpenRouter (модель Qwen3-70B или указанная); повторный
+    вызов с теми же параметрами — из кэша ответов, без сети.
+    """
+    backend = settings.llm_backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный LLM-бэкенд {backend!r}: допустимы {', '.join(BACKENDS)}")
+    model_name = model or os.getenv("LITELLM_MODEL", "openrouter/qwen/qwen3-70b")
+    # Бэкенд — часть ключа: ответы заглушки не смешиваются с настоящими
+    cached_model = model_name if backend == "openrouter" else f"{backend}:{model_name}"
+
+    cache = response_cache() if settings.llm_cache else None
+    key = ResponseCache.key(cached_model, system_prompt, prompt, temperature, **kwargs)
+    if cache is not None:
+        text = cache.get(key)
+        if text is not None:
+            return text
+
+    inc("rlm_llm_requests_total", backend=backend)
+    text = BACKENDS[backend](model_name, system_prompt, prompt, temperature, **kwargs)
+    if cache is not None:
+        cache.put(key, cached_model, text)
+    return text
@@ -0,0 +1,122 @@
+"""
+Асинхронный LLM-этап для отчётов по многим сценам и полям.
+
+Раньше LLM вызывался по одному отчёту за раз, а многосценовые сценарии и
+пакет его не вызывали вовсе. Здесь:
+
+  • промпт — компактная структурированная статистика (IndexRecord без путей и
+    пустых полей, JSON), а не текст отчёта; если ряд не влезает в
+    settings.llm_prompt_budget_tokens, старые даты заменяются сводкой (min/mean/max);
+  • промпты уходят одновременно, не больше settings.llm_concurrency запросов
+    (call_llm в потоках: кэш ответов и бэкенды — как у одиночного вызова);
+    одинаковые промпты отправляются один раз;
+  • каждый ответ передаётся в on_result сразу по готовности — вызывающий
+    дописывает его в результат поля, не дожидаясь остальных.
+
+    answers = analyze_many({"field-01": build_prompt("field-01", records)}, on_result=save)
+"""
+
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+from .config import settings
+from .metrics import inc
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "Ты — опытный агроном. Давай точные практические рекомендации по состоянию поля."
+
+# Поля IndexRecord, которые нужны модели: пути к файлам и служебные — нет
+_STAT_FIELDS = ("date", "status", "cloud_percent", "nodata_percent", "valid_pixels_percent",
+                "ndvi_mean", "ndvi_median", "ndwi_mean")
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (≈4 символа на токен, кириллица — не точнее)."""
+    return len(text) // 4 + 1
+
+
+def compact_record(record) -> Dict:
+    """Статистика одной записи (dict или IndexRecord) без путей и пустых значений."""
+    data = record.model_dump() if hasattr(record, "model_dump") else dict(record)
+    return {k: data[k] for k in _STAT_FIELDS if data.get(k) is not None}
+
+
+def _summary(rows: List[Dict]) -> Dict:
+    ndvi = [r["ndvi_mean"] for r in rows if r.get("ndvi_mean") is not None]
+    summary = {"dates": len(rows), "from": rows[0].get("date"), "to": rows[-1].get("date")}
+    if ndvi:
+        summary.update(ndvi_min=round(min(ndvi), 4), ndvi_mean=round(sum(ndvi) / len(ndvi), 4),
+                       ndvi_max=round(max(ndvi), 4))
+    return summary
+
+
+def build_prompt(field_id: str, records: Iterable, budget_tokens: Optional[int] = None) -> str:
+    """
+    Промпт по ряду записей поля: JSON со статистикой по датам. Сверх бюджета
+    старые даты сворачиваются в сводку "earlier", последние остаются подробно.
+    """
+    budget = budget_tokens or settings.llm_prompt_budget_tokens
+    rows = sorted((compact_record(r) for r in records), key=lambda r: r.get("date", ""))
+    head = (f"Статистика спутниковых индексов поля {field_id} (Sentinel-2, JSON). "
+            "Оцени состояние и динамику посевов и дай рекомендации.\n")
+    kept, earlier = rows, []
+    while True:
+        payload = {"field_id": field_id, "scenes": kept}
+        if earlier:
+            payload["earlier"] = _summary(earlier)
+        prompt = head + json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        if estimate_tokens(prompt) <= budget or len(kept) <= 1:
+            break
+        earlier, kept = rows[:len(earlier) + 1], kept[1:]
+    if earlier:
+        inc("rlm_llm_prompts_compacted_total")
+    return prompt
+
+
+async def analyze_many_async(prompts: Dict[Hashable, str],
+                             on_result: Optional[Callable[[Hashable, Optional[str]], None]] = None,
+                             concurrency: Optional[int] = None) -> Dict[Hashable, Optional[str]]:
+    """
+    Ответы LLM на все prompts ({ключ: промпт}) не больше concurrency одновременно.
+    on_result(ключ, текст) вызывается по мере готовности; при ошибке текст — None.
+    """
+    from .llm import call_llm
+
+    limit = asyncio.Semaphore(max(1, concurrency or settings.llm_concurrency))
+    by_prompt = defaultdict(list)
+    for key, prompt in prompts.items():
+        by_prompt[prompt].append(key)
+
+    async def ask(prompt: str):
+        async with limit:
+            try:
+                return prompt, await asyncio.to_thread(call_llm, prompt, system_prompt=SYSTEM_PROMPT,
+                                                       temperature=0.3)
+            except Exception as e:
+                logger.warning(f"LLM: ошибка анализа ({', '.join(map(str, by_prompt[prompt]))}): "
+                               f"{type(e).__name__}: {e}")
+                inc("rlm_llm_errors_total")
+                return prompt, None
+
+    answers = {}
+    for task in asyncio.as_completed([ask(prompt) for prompt in by_prompt]):
+        prompt, text = await task
+        for key in by_prompt[prompt]:
+            answers[key] = text
+            if on_result is not None:
+                on_result(key, text)
+    return answers
+
+
+def analyze_many(prompts: Dict[Hashable, str],
+                 on_result: Optional[Callable[[Hashable, Optional[str]], None]] = None,
+                 concurrency: Optional[int] = None) -> Dict[Hashable, Optional[str]]:
+    """Синхронная обёртка analyze_many_async (из кода без запущенного event loop)."""
+    if not prompts:
+        return {}
+    logger.info(f"LLM: {len(prompts)} отчётов, до {concurrency or settings.llm_concurrency} запросов одновременно")
+    return asyncio.run(analyze_many_async(prompts, on_result, concurrency))
@@ -0,0 +1,147 @@
+"""
+Межпроцессные блокировки для заполнения кэша (single-flight).
+
+Несколько воркеров `rlm process` по полям одного тайла не должны качать один и тот же
+`cache/*_B04.tif` одновременно: первый берёт блокировку и качает, остальные ждут
+и используют готовый файл.
+
+    from .locks import file_lock
+
+    if not path.exists():
+        with file_lock(path):
+            if not path.exists():   # пока ждали, файл мог скачать другой воркер
+                fill(path)
+
+Блокировка — `flock` (POSIX) / `msvcrt.locking` (Windows) на скрытом файле `.<имя>.lock` рядом с путём
+плюс потоковая RLock на тот же путь. ОС снимает блокировку, если процесс упал,
+поэтому «зависших» lock-файлов не бывает. Повторный захват тем же потоком разрешён.
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from .metrics import inc
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(TimeoutError):
+    """Блокировку не удалось получить за отведённое время."""
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class _PathLock:
+    """Потоковая RLock + файловая блокировка, которая держится, пока depth > 0."""
+
+    def __init__(self, lock_path: Path):
+        self.lock_path = lock_path
+        self.rlock = threading.RLock()
+        self.depth = 0
+        self.fd: Optional[int] = None
+
+
+# Запись живёт, пока на неё ссылается file_lock (владелец или ожидающие потоки):
+# у долгоживущего процесса по тысячам путей кэша реестр не растёт
+_registry: "weakref.WeakValueDictionary[str, _PathLock]" = weakref.WeakValueDictionary()
+_registry_lock = threading.Lock()
+
+
+def _path_lock(path: Path) -> _PathLock:
+    lock_path = path.with_name(f".{path.name}.lock")
+    key = os.path.abspath(lock_path)
+    with _registry_lock:
+        entry = _registry.get(key)
+        if entry is None:
+            entry = _registry[key] = _PathLock(lock_path)
+        return entry
+
+
+@contextmanager
+def file_lock(path, timeout: Optional[float] = None, poll: float = 0.1):
+    """
+    Эксклюзивная блокировка пути между потоками и процессами.
+    timeout — секунды (по умолчанию settings.lock_timeout_s); истёк — LockTimeout.
+    """
+    from .config import settings
+    path = Path(path)
+    timeout = settings.lock_timeout_s if timeout is None else timeout
+    entry = _path_lock(path)
+    deadline = time.monotonic() + timeout
+    waited = False
+
+    if not entry.rlock.acquire(blocking=False):
+        waited = True
+        inc("rlm_lock_waits_total")
+        if not entry.rlock.acquire(timeout=timeout):
+            raise LockTimeout(f"Блокировка {path} занята другим потоком дольше {timeout:.0f} с")
+    try:
+        if entry.depth == 0:
+            entry.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(entry.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            while not _try_lock(fd):
+                if not waited:
+                    waited = True
+                    inc("rlm_lock_waits_total")
+                    logger.info(f"Ждём, пока другой процесс заполнит {path.name} ...")
+                if time.monotonic() > deadline:
+                    os.close(fd)
+                    raise LockTimeout(f"Блокировка {path} занята другим процессом дольше {timeout:.0f} с")
+                time.sleep(poll)
+            entry.fd = fd
+        entry.depth += 1
+    except BaseException:
+        entry.rlock.release()
+        raise
+
+    try:
+        yield waited
+    finally:
+        entry.depth -= 1
+        if entry.depth == 0:
+            _unlock(entry.fd)
+            os.close(entry.fd)
+            entry.fd = None
+        entry.rlock.release()
+
+
+def atomic_copy(src, dst):
+    """Копия через временный файл + os.replace: читатели не увидят недописанный dst."""
+    import shutil
+    dst = Path(dst)
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return dst
@@ -0,0 +1,205 @@
+"""
+Манифест заданий: чекпоинты долгих прогонов (бэкфилл за несколько лет по хозяйству).
+
+Каждая единица работы — (поле, сцена, этап) — хранится в SQLite
+(`output/jobs.sqlite`, WAL — можно читать, пока идёт запись) со статусом,
+числом попыток и ссылками на результаты (JSON). Задание определяется своими
+параметрами: повторный запуск с теми же параметрами — то же задание, поэтому
+
+  * выполненные единицы пропускаются, их результаты берутся из манифеста
+    (если результаты ещё на месте — см. valid в run_units);
+  * упавшие повторяются с экспоненциальной задержкой (settings.job_backoff_s);
+  * оставшуюся работу показывает `rlm jobs`.
+
+    job = JobManifest().job("filtered_scenes", kml="field.kml", start="2022-01-01")
+    outputs = job.run_units(units, execute)   # execute(units) -> (unit, результат | исключение)
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+Unit = Tuple[str, str, str]  # (поле, сцена, этап)
+STATUSES = ("pending", "running", "done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS units (
+    job_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    scene TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    outputs TEXT,
+    next_retry_at REAL NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (job_id, field, scene, stage)
+);
+"""
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class JobManifest:
+    """SQLite-файл манифеста; одно соединение на экземпляр, доступ из потоков под замком."""
+
+    def __init__(self, path=None):
+        self.path = Path(path or settings.job_manifest)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def execute(self, sql: str, args: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def job(self, kind: str, **params) -> "Job":
+        """Задание по виду и параметрам (одинаковые параметры — тот же job_id)."""
+        blob = json.dumps(params, sort_keys=True, default=str, ensure_ascii=False)
+        job_id = f"{kind}-{hashlib.sha1(blob.encode()).hexdigest()[:12]}"
+        self.execute("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?)", (job_id, kind, blob, _now()))
+        return Job(self, job_id, kind, params)
+
+    def jobs(self) -> List[Dict]:
+        """Все задания с числом единиц по статусам — для `rlm jobs`."""
+        rows = self.execute("SELECT job_id, kind, params, created_at FROM jobs ORDER BY created_at")
+        return [
+            {"job_id": job_id, "kind": kind, "params": json.loads(params), "created_at": created,
+             "units": Job(self, job_id, kind, {}).status()}
+            for job_id, kind, params, created in rows
+        ]
+
+    def close(self):
+        self._conn.close()
+
+
+class Job:
+    """Единицы одного задания."""
+
+    def __init__(self, manifest: JobManifest, job_id: str, kind: str, params: Dict):
+        self.manifest = manifest
+        self.job_id = job_id
+        self.kind = kind
+        self.params = params
+
+    def declare(self, units: Iterable[Unit]):
+        """Регистрирует единицы как pending (уже известные не трогает) — для отчёта об оставшемся."""
+        for field, scene, stage in units:
+            self.manifest.execute(
+                "INSERT OR IGNORE INTO units (job_id, field, scene, stage, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (self.job_id, field, scene, stage, _now()),
+            )
+
+    def get(self, unit: Unit) -> Optional[Dict]:
+        rows = self.manifest.execute(
+            "SELECT status, attempts, error, outputs, next_retry_at FROM units "
+            "WHERE job_id = ? AND field = ? AND scene = ? AND stage = ?", (self.job_id, *unit),
+        )
+        if not rows:
+            return None
+        status, attempts, error, outputs, next_retry_at = rows[0]
+        return {"status": status, "attempts": attempts, "error": error,
+                "outputs": json.loads(outputs) if outputs else None, "next_retry_at": next_retry_at}
+
+    def outputs(self, unit: Unit):
+        """Результаты выполненной единицы или None."""
+        state = self.get(unit)
+        return state["outputs"] if state and state["status"] == "done" else None
+
+    def _set(self, unit: Unit, status: str, **values):
+        self.declare([unit])
+        columns = ", ".join(f"{k} = ?" for k in values)
+        self.manifest.execute(
+            f"UPDATE units SET status = ?, updated_at = ?{', ' + columns if columns else ''} "
+            "WHERE job_id = ? AND field = ? AND scene = ? AND stage = ?",
+            (status, _now(), *values.values(), self.job_id, *unit),
+        )
+
+    def mark_running(self, unit: Unit):
+        self._set(unit, "running")
+
+    def mark_done(self, unit: Unit, outputs=None):
+        self._set(unit, "done", error=None, outputs=json.dumps(outputs, default=str, ensure_ascii=False))
+
+    def mark_failed(self, unit: Unit, error: BaseException):
+        attempts = (self.get(unit) or {}).get("attempts", 0) + 1
+        delay = min(settings.job_backoff_max_s, settings.job_backoff_s * 2 ** (attempts - 1))
+        self._set(unit, "failed", attempts=attempts, error=f"{type(error).__name__}: {error}",
+                  next_retry_at=time.time() + delay)
+        logger.warning(f"{self.job_id} {'/'.join(unit)}: попытка {attempts} не удалась ({error}), "
+                       f"повтор не раньше чем через {delay:.0f} с")
+
+    def status(self) -> Dict[str, int]:
+        rows = self.manifest.execute("SELECT status, COUNT(*) FROM units WHERE job_id = ? GROUP BY status",
+                                     (self.job_id,))
+        counts = {s: 0 for s in STATUSES}
+        counts.update(dict(rows))
+        return counts
+
+    def run_units(self, units: List[Unit], execute: Callable[[List[Unit]], Iterable[Tuple[Unit, object]]],
+                  max_attempts: Optional[int] = None,
+                  valid: Optional[Callable[[Unit, object], bool]] = None) -> Dict[Unit, object]:
+        """
+        Выполняет невыполненные единицы. execute(units) отдаёт пары (unit, результат)
+        по мере готовности; результат-исключение — ошибка единицы. Каждый результат
+        сразу фиксируется в манифесте, так что прерывание не теряет сделанного.
+        Упавшие единицы повторяются проходами с экспоненциальной задержкой, не больше
+        max_attempts проходов за запуск. valid(unit, результат) — проверка выполненной
+        ранее единицы (например, что её файлы не удалены): не прошедшие выполняются
+        заново. Возвращает результаты выполненных единиц.
+        """
+        max_attempts = max_attempts or settings.job_max_attempts
+        self.declare(units)
+        results = {u: self.outputs(u) for u in units}
+        done = {u for u in units if self.get(u)["status"] == "done"}
+        stale = {u for u in done if valid is not None and not valid(u, results[u])}
+        if stale:
+            logger.info(f"{self.job_id}: {len(stale)} выполненных единиц без результатов на диске — выполняются заново")
+            done -= stale
+        if done:
+            logger.info(f"{self.job_id}: {len(done)}/{len(units)} единиц уже выполнены — пропускаются")
+
+        for attempt in range(max_attempts):
+            todo = [u for u in units if u not in done]
+            if not todo:
+                break
+            wait = max(self.get(u)["next_retry_at"] for u in todo) - time.time()
+            if wait > 0:
+                logger.info(f"{self.job_id}: повтор {len(todo)} единиц через {wait:.1f} с")
+                time.sleep(wait)
+            for unit in todo:
+                self.mark_running(unit)
+            for unit, result in execute(todo):
+                if isinstance(result, BaseException):
+                    self.mark_failed(unit, result)
+                else:
+                    self.mark_done(unit, result)
+                    results[unit] = result
+                    done.add(unit)
+
+        left = self.status()
+        if left["failed"] or left["pending"] or left["running"]:
+            logger.warning(f"{self.job_id}: осталось {left['failed']} упавших и "
+                           f"{left['pending'] + left['running']} невыполненных единиц — перезапустите задание")
+        return {u: results[u] for u in units if u in done}
@@ -0,0 +1,317 @@
+"""
+Инструментирование RLM: таймеры этапов и счётчики.
+
+Этапы (stage): buffer, search, verify, read, compute, render, llm.
+Счётчики: HTTP-запросы, скачанные/прочитанные байты, попадания и промахи кэша,
+отбракованные сцены по причинам.
+
+Все значения копятся в глобальном реестре `metrics` (как `settings` в config.py)
+и выгружаются в JSON lines или текстовый формат Prometheus:
+
+    from .metrics import stage, inc, metrics
+
+    baseline = metrics.snapshot()
+    with stage("read"):
+        ...
+    inc("rlm_cache_hits_total", cache="rgb_png")
+    metrics.export("output/metrics.prom")
+    metrics.export("output/metrics.jsonl", since=baseline, kml="field.kml")
+
+Реестр живёт весь процесс (MCP-сервер, воркеры заданий), поэтому JSON lines и
+сводка запуска строятся по приращению с `since` — снимка на старте запуска;
+Prometheus-файл получает накопленные значения, как и положено счётчикам.
+"""
+
+import json
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("buffer", "search", "verify", "read", "compute", "render", "llm")
+
+_HELP = {
+    "rlm_http_requests_total": "HTTP-запросы через requests и pystac-client (client=requests, stac, thumbnail)",
+    "rlm_remote_requests_total": "Попытки удалённых обращений (GDAL к COG, STAC) по хостам и исходам",
+    "rlm_bytes_fetched_total": "Байты, полученные по сети (source=download) или прочитанные из COG-окон (source=cog_window)",
+    "rlm_cache_hits_total": "Попадания в локальный кэш",
+    "rlm_cache_misses_total": "Промахи локального кэша",
+    "rlm_lock_waits_total": "Ожидания блокировки кэша, занятой другим потоком или процессом",
+    "rlm_scenes_rejected_total": "Сцены, отбракованные filter_pipeline, по причинам",
+    "rlm_scenes_passed_total": "Сцены, прошедшие filter_pipeline",
+    "rlm_stage_seconds": "Время этапов обработки, секунды",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in key)
+    return "{" + inner + "}"
+
+
+class MetricsRegistry:
+    """Потокобезопасный реестр счётчиков и таймеров этапов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.timers: Dict[LabelKey, Dict[str, float]] = {}
+        # Стеки этапов живых потоков для профилировщика: свой стек поток держит в
+        # self._local, запись здесь исчезает вместе с объектом завершённого потока
+        self._stacks: "weakref.WeakKeyDictionary[threading.Thread, list]" = weakref.WeakKeyDictionary()
+
+    # ── счётчики ──
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.counters.get(name, {}).get(_label_key(labels), 0)
+
+    # ── этапы ──
+
+    def current_stages(self) -> List[str]:
+        """Стек активных этапов текущего потока (внешний — первый)."""
+        stack = getattr(self._local, "stack", None)
+        return [frame[0] for frame in stack] if stack else []
+
+    def active_stages(self) -> Dict[int, str]:
+        """Текущий (самый вложенный) этап каждого потока — для разметки сэмплов профилировщика."""
+        active = {}
+        for thread, stack in list(self._stacks.items()):
+            try:
+                active[thread.ident] = stack[-1][0]
+            except IndexError:
+                pass
+        return active
+
+    @contextmanager
+    def stage(self, name: str, **labels):
+        """
+        Замер этапа. Этапы могут быть вложенными: кроме полного времени
+        считается собственное (без вложенных этапов), по нему и строится
+        сводка «куда ушло время» без двойного счёта.
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+            self._stacks[threading.current_thread()] = stack
+        frame = [name, 0.0]  # имя, время вложенных этапов
+        stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            self.observe(name, elapsed, self_seconds=elapsed - frame[1], **labels)
+
+    def observe(self, stage_name: str, seconds: float, self_seconds: Optional[float] = None, **labels):
+        key = _label_key({"stage": stage_name, **labels})
+        with self._lock:
+            t = self.timers.setdefault(key, {"count": 0, "sum": 0.0, "self": 0.0, "max": 0.0})
+            t["count"] += 1
+            t["sum"] += seconds
+            t["self"] += seconds if self_seconds is None else self_seconds
+            t["max"] = max(t["max"], seconds)
+
+    # ── выгрузка ──
+
+    def merge(self, snap: Dict):
+        """Добавляет снимок (snapshot) другого реестра — например, из процесса-воркера."""
+        with self._lock:
+            for name, series in snap.get("counters", {}).items():
+                target = self.counters.setdefault(name, {})
+                for s in series:
+                    key = _label_key(s["labels"])
+                    target[key] = target.get(key, 0) + s["value"]
+            for s in snap.get("stages", []):
+                t = self.timers.setdefault(_label_key(s["labels"]), {"count": 0, "sum": 0.0, "self": 0.0, "max": 0.0})
+                t["count"] += s["count"]
+                t["sum"] += s["sum"]
+                t["self"] += s["self"]
+                t["max"] = max(t["max"], s["max"])
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(k), "value": v} for k, v in series.items()]
+                    for name, series in self.counters.items()
+                },
+                "stages": [{"labels": dict(k), **v} for k, v in self.timers.items()],
+            }
+
+    def delta(self, since: Dict) -> Dict:
+        """
+        Снимок приращения после снимка since. Максимум этапа точен, если он
+        обновился за запуск; иначе — оценка сверху (не больше суммы запуска).
+        """
+        snap = self.snapshot()
+        base_counters = {
+            name: {_label_key(s["labels"]): s["value"] for s in series}
+            for name, series in since.get("counters", {}).items()
+        }
+        counters = {}
+        for name, series in snap["counters"].items():
+            base = base_counters.get(name, {})
+            changed = [
+                {"labels": s["labels"], "value": s["value"] - base.get(_label_key(s["labels"]), 0)}
+                for s in series
+            ]
+            changed = [s for s in changed if s["value"]]
+            if changed:
+                counters[name] = changed
+        base_stages = {_label_key(s["labels"]): s for s in since.get("stages", [])}
+        stages = []
+        for s in snap["stages"]:
+            b = base_stages.get(_label_key(s["labels"]))
+            if b is None:
+                stages.append(s)
+            elif s["count"] > b["count"]:
+                run_sum = s["sum"] - b["sum"]
+                stages.append({
+                    "labels": s["labels"], "count": s["count"] - b["count"], "sum": run_sum,
+                    "self": s["self"] - b["self"],
+                    "max": s["max"] if s["max"] > b["max"] else min(s["max"], run_sum),
+                })
+        return {"counters": counters, "stages": stages}
+
+    def to_jsonl(self, since: Optional[Dict] = None, **extra) -> str:
+        """
+        Одна JSON-строка на каждую серию; extra (run_id, kml…) добавляется в каждую.
+        С since — только приращение после этого снимка (см. delta).
+        """
+        ts = datetime.now().isoformat(timespec="seconds")
+        lines = []
+        snap = self.snapshot() if since is None else self.delta(since)
+        for name, series in sorted(snap["counters"].items()):
+            for s in series:
+                lines.append({"ts": ts, "type": "counter", "name": name, **s, **extra})
+        for s in snap["stages"]:
+            lines.append({"ts": ts, "type": "stage", "name": "rlm_stage_seconds", **s, **extra})
+        return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+
+    def to_prometheus(self) -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        out = []
+        with self._lock:
+            for name in sorted(self.counters):
+                out.append(f"# HELP {name} {_HELP.get(name, name)}")
+                out.append(f"# TYPE {name} counter")
+                for key, value in sorted(self.counters[name].items()):
+                    out.append(f"{name}{_format_labels(key)} {value:g}")
+            if self.timers:
+                out.append(f"# HELP rlm_stage_seconds {_HELP['rlm_stage_seconds']}")
+                out.append("# TYPE rlm_stage_seconds summary")
+                for key, t in sorted(self.timers.items()):
+                    labels = _format_labels(key)
+                    out.append(f"rlm_stage_seconds_count{labels} {t['count']:g}")
+                    out.append(f"rlm_stage_seconds_sum{labels} {t['sum']:.6f}")
+                out.append("# HELP rlm_stage_self_seconds_total Собственное время этапов (без вложенных), секунды")
+                out.append("# TYPE rlm_stage_self_seconds_total counter")
+                for key, t in sorted(self.timers.items()):
+                    out.append(f"rlm_stage_self_seconds_total{_format_labels(key)} {t['self']:.6f}")
+                out.append("# TYPE rlm_stage_seconds_max gauge")
+                for key, t in sorted(self.timers.items()):
+                    out.append(f"rlm_stage_seconds_max{_format_labels(key)} {t['max']:.6f}")
+        return "\n".join(out) + "\n"
+
+    def export(self, path, since: Optional[Dict] = None, **extra) -> Path:
+        """
+        Пишет метрики по расширению: .prom/.txt — Prometheus (перезапись, накопленные
+        значения), иначе дописывает JSON lines — приращение после since, если он задан.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix in (".prom", ".txt"):
+            path.write_text(self.to_prometheus(), encoding="utf-8")
+        else:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(self.to_jsonl(since=since, **extra))
+        logger.info(f"Метрики сохранены: {path}")
+        return path
+
+    def format_summary(self, since: Optional[Dict] = None) -> str:
+        """
+        Таблица «куда ушло время» + ключевые счётчики — для логов пакетных запусков.
+        С since — только за запуск, начатый этим снимком.
+        """
+        snap = self.snapshot() if since is None else self.delta(since)
+        per_stage: Dict[str, Dict[str, float]] = {}
+        for s in snap["stages"]:
+            agg = per_stage.setdefault(s["labels"]["stage"], {"count": 0, "sum": 0.0, "self": 0.0, "max": 0.0})
+            agg["count"] += s["count"]
+            agg["sum"] += s["sum"]
+            agg["self"] += s["self"]
+            agg["max"] = max(agg["max"], s["max"])
+        total = sum(a["self"] for a in per_stage.values()) or 1.0
+
+        lines = [f"  {'Этап':<10} {'вызовов':>8} {'всего, с':>10} {'собств., с':>11} {'макс, с':>9} {'доля':>6}"]
+        for name, a in sorted(per_stage.items(), key=lambda kv: -kv[1]["self"]):
+            lines.append(
+                f"  {name:<10} {a['count']:>8} {a['sum']:>10.2f} {a['self']:>11.2f} {a['max']:>9.2f} {a['self'] / total:>6.0%}"
+            )
+        for name, series in sorted(snap["counters"].items()):
+            for s in series:
+                labels = ",".join(f"{k}={v}" for k, v in s["labels"].items())
+                lines.append(f"  {name}{'{' + labels + '}' if labels else ''} = {s['value']:g}")
+        return "\n".join(lines)
+
+
+metrics = MetricsRegistry()
+
+
+def stage(name: str, **labels):
+    """`with stage("read"): ...` — замер этапа в глобальном реестре."""
+    return metrics.stage(name, **labels)
+
+
+def inc(name: str, value: float = 1, **labels):
+    metrics.inc(name, value, **labels)
+
+
+def timed(stage_name: str):
+    """Декоратор: вся функция — один этап."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def export_metrics(path: Optional[str] = None, since: Optional[Dict] = None, **extra) -> Optional[Path]:
+    """Выгрузка в путь из аргумента или settings.metrics_path (если задан); since — см. MetricsRegistry.export."""
+    from .config import settings
+    path = path or settings.metrics_path
+    if not path:
+        return None
+    return metrics.export(path, since=since, **extra)
@@ -29,6 +29,26 @@ class SearchRequest(BaseModel):
     buffer_meters: int = 500
 
 
+class IndexRecord(BaseModel):
+    """Числовой результат по полю и сцене — строка выгрузки (см. records.py)"""
+    field_id: str
+    date: str  # YYYY-MM-DD
+    scene_id: str
+    tile: Optional[str] = None
+    status: str
+    cloud_percent: Optional[float] = None
+    nodata_percent: Optional[float] = None
+    valid_pixels: Optional[int] = None
+    valid_pixels_percent: Optional[float] = None
+    ndvi_mean: Optional[float] = None
+    ndvi_median: Optional[float] = None
+    ndwi_mean: Optional[float] = None
+    duration_s: Optional[float] = None
+    rgb_path: Optional[str] = None
+    ndvi_path: Optional[str] = None
+    ndvi_cog_path: Optional[str] = None
+
+
 class AnalysisResult(BaseModel):
     """Результат анализа"""
     status: str
@@ -36,3 +56,4 @@ class AnalysisResult(BaseModel):
     selected_scene: Optional[SceneMetadata] = None
     report: str
     llm_analysis: Optional[str] = None
+    record: Optional[IndexRecord] = None  # те же числа, что в report, без разбора текста
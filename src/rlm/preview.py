@@ -0,0 +1,179 @@
+"""
+Быстрые превью поля для интерактивного выбора дат в `rlm process --preview`.
+
+Вместо полного process_scene_indices для каждой даты читается только область поля
+из обзоров (overviews) COG `visual`: GDAL сам выбирает уровень обзора под размер
+превью, так что на дату уходит несколько небольших Range-запросов. Если COG
+недоступен, берётся STAC-ассет `thumbnail` (JPEG всей сцены), из которого
+вырезается окрестность поля по bbox сцены.
+
+Превью всех кандидатов качаются параллельно и сводятся в один лист
+`output/previews/<ключ поля>/contact.png` с номерами из таблицы выбора.
+"""
+
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .config import settings
+from .metrics import inc, stage
+
+logger = logging.getLogger(__name__)
+
+CONTOUR_COLOR = (255, 0, 0)
+_MARGIN = 0.3  # отступ вокруг bbox поля, доля его размера
+
+
+def _square_bounds(minx, miny, maxx, maxy, margin: float = _MARGIN):
+    """Квадрат вокруг bbox с отступом: превью одинакового масштаба по осям."""
+    cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+    half = max(maxx - minx, maxy - miny) * (0.5 + margin)
+    return cx - half, cy - half, cx + half, cy + half
+
+
+def _draw_contour(image, polygon, bounds):
+    """Контур поля (с внутренними кольцами) на изображении, покрывающем bounds."""
+    from PIL import ImageDraw
+    from rasterio.transform import from_bounds
+    from .geometry import to_pixels
+
+    width, height = image.size
+    polygon = to_pixels(polygon, from_bounds(*bounds, width, height))
+    draw = ImageDraw.Draw(image)
+    parts = polygon.geoms if polygon.geom_type == "MultiPolygon" else [polygon]
+    for part in parts:
+        for ring in (part.exterior, *part.interiors):
+            draw.line(list(ring.coords), fill=CONTOUR_COLOR, width=2)
+    return image
+
+
+def preview_from_cog(href: str, polygon_4326, size: int):
+    """Превью из обзоров COG: окно вокруг поля, out_shape = size x size."""
+    from PIL import Image
+    from rasterio.enums import Resampling
+    from rasterio.windows import from_bounds
+    from . import reader
+    from .geometry import project_polygon
+
+    with stage("read"):
+        hdr = reader.header(href)
+        polygon = project_polygon(polygon_4326, hdr.crs)
+        bounds = _square_bounds(*polygon.bounds)
+        window = from_bounds(*bounds, transform=hdr.transform)
+        # out_shape меньше окна — GDAL читает подходящий уровень обзора, а не полное разрешение
+        data = reader.read(href, window, indexes=[1, 2, 3] if hdr.count >= 3 else [1] * 3,
+                           out_shape=(3, size, size), boundless=True, fill_value=0,
+                           resampling=Resampling.average)
+    inc("rlm_bytes_fetched_total", data.nbytes, source="cog_overview")
+
+    image = Image.fromarray(np.moveaxis(data, 0, -1).astype(np.uint8), "RGB")
+    return _draw_contour(image, polygon, bounds)
+
+
+def preview_from_thumbnail(href: str, scene_bbox, polygon_4326, size: int, timeout: float = 30):
+    """Превью из JPEG-миниатюры сцены: вырезка по bbox сцены (WGS84), приближённо."""
+    import requests
+    from PIL import Image
+
+    with stage("read"):
+        response = requests.get(href, timeout=timeout)
+        response.raise_for_status()
+    inc("rlm_http_requests_total", client="thumbnail")
+    inc("rlm_bytes_fetched_total", len(response.content), source="thumbnail")
+
+    thumb = Image.open(io.BytesIO(response.content)).convert("RGB")
+    if not scene_bbox:
+        return thumb.resize((size, size))
+    w, h = thumb.size
+    west, south, east, north = scene_bbox
+
+    def to_thumb(x, y):
+        return (x - west) / (east - west) * w, (north - y) / (north - south) * h
+
+    bounds = minx, miny, maxx, maxy = _square_bounds(*polygon_4326.bounds)
+    crop = (*to_thumb(minx, maxy), *to_thumb(maxx, miny))
+    image = thumb.crop(tuple(round(v) for v in crop)).resize((size, size), Image.BILINEAR)
+    return _draw_contour(image, polygon_4326, bounds)
+
+
+def field_preview(scene: Dict, polygon_4326, out_dir=None, size: Optional[int] = None) -> Optional[Path]:
+    """
+    Превью одной сцены из результатов filter_pipeline (item_id, assets, bbox).
+    Кэшируется в `<out_dir>/<item_id>_<size>.png`. Возвращает путь или None.
+    """
+    size = size or settings.preview_size
+    out_dir = Path(out_dir or settings.preview_dir)
+    path = out_dir / f"{scene['item_id']}_{size}.png"
+    if path.exists():
+        inc("rlm_cache_hits_total", cache="preview")
+        return path
+
+    assets = scene.get("assets") or {}
+    image = None
+    if assets.get("visual"):
+        try:
+            image = preview_from_cog(assets["visual"], polygon_4326, size)
+        except Exception as e:
+            logger.warning(f"Превью {scene['item_id']} из COG не получилось: {e}")
+    if image is None and assets.get("thumbnail"):
+        try:
+            image = preview_from_thumbnail(assets["thumbnail"], scene.get("bbox"), polygon_4326, size)
+        except Exception as e:
+            logger.warning(f"Превью {scene['item_id']} из thumbnail не получилось: {e}")
+    if image is None:
+        return None
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    image.save(tmp, format="PNG")
+    os.replace(tmp, path)
+    return path
+
+
+def contact_sheet(previews: List[Optional[Path]], labels: List[str], path: Path, columns: int = 6) -> Path:
+    """Все превью на одном листе с подписями (номер и дата из таблицы выбора)."""
+    from PIL import Image, ImageDraw
+
+    size = settings.preview_size
+    label_h = 18
+    rows = max(1, (len(previews) + columns - 1) // columns)
+    sheet = Image.new("RGB", (columns * size, rows * (size + label_h)), (255, 255, 255))
+    draw = ImageDraw.Draw(sheet)
+    for i, (preview, label) in enumerate(zip(previews, labels)):
+        x, y = (i % columns) * size, (i // columns) * (size + label_h)
+        if preview is not None:
+            with Image.open(preview) as im:
+                sheet.paste(im.convert("RGB").resize((size, size)), (x, y + label_h))
+        else:
+            draw.rectangle((x, y + label_h, x + size - 1, y + label_h + size - 1), fill=(200, 200, 200))
+        draw.text((x + 4, y + 3), label, fill=(0, 0, 0))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sheet.save(path)
+    return path
+
+
+def build_previews(scenes: List[Dict], field, out_dir=None,
+                   workers: Optional[int] = None) -> Dict:
+    """
+    Превью всех кандидатов параллельно + общий лист. field — путь к KML
+    или полигон поля в EPSG:4326. Файлы лежат в
+    `<out_dir>/<ключ поля>/`: одна сцена для разных полей — разные превью.
+    Возвращает {"previews": [путь | None по порядку scenes], "sheet": путь листа}.
+    """
+    from .sentinel_filter import _load_field_polygon
+
+    polygon = _load_field_polygon(field) if isinstance(field, (str, Path)) else field
+    out_dir = Path(out_dir or settings.preview_dir) / hashlib.sha1(polygon.wkb).hexdigest()[:16]
+    workers = workers or settings.preview_workers
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(scenes)))) as pool:
+        previews = list(pool.map(lambda s: field_preview(s, polygon, out_dir), scenes))
+    labels = [f"{i}. {s['datetime'][:10]} ({s.get('cloud_cover_field', 0):.0f}%)" for i, s in enumerate(scenes, 1)]
+    sheet = contact_sheet(previews, labels, out_dir / "contact.png")
+    logger.info(f"Превью: {sum(p is not None for p in previews)}/{len(scenes)}, лист {sheet}")
+    return {"previews": previews, "sheet": sheet}
@@ -1,15 +1,23 @@
+import hashlib
 import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Optional, List
 from datetime import datetime
-from tqdm import tqdm
 
 from .config import settings
 from .search import create_buffer, list_scenes, list_available_scenes
 from .dagshub_search import get_available_scenes_from_dagshub
-from .indices import process_scene_indices
+from .indices import format_stat, process_scene_indices
 from .models import SearchRequest, AnalysisResult, SceneMetadata
 from .downloader import download_sentinel_data
+from .metrics import metrics, export_metrics
+from .records import RecordWriter, record_from_indices
+from .jobs import report_progress
+from .coalesce import coalesced, field_hash
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,6 +27,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@coalesced("process_scene", copy=lambda result: result.model_copy(deep=True),
+           key=lambda kml_path, scene_id, year, use_llm: (field_hash(kml_path), scene_id, year, use_llm,
+                                                          settings.buffer_meters, settings.max_cloud_cover))
 def process_scene(
     kml_path: str,
     scene_id: Optional[str] = None,
@@ -34,6 +45,7 @@ def process_scene(
     5. (Опционально) Запрашивает анализ у Qwen3
     """
     logger.info(f"Начало обработки поля: {kml_path}")
+    baseline = metrics.snapshot()
     logger.info(f"Параметры: buffer={settings.buffer_meters}m, max_cloud={settings.max_cloud_cover}%, период={settings.default_start_date} — {settings.default_end_date}")
 
     request = SearchRequest(
@@ -44,10 +56,12 @@ def process_scene(
         buffer_meters=settings.buffer_meters
     )
     
+    report_progress(0.05, "буфер поля")
     logger.info("Шаг 1/4: Создание буферной зоны 500м...")
     buffer_path = create_buffer(kml_path, request.buffer_meters)
     logger.info(f"Буфер создан: {buffer_path}")
 
+    report_progress(0.1, "поиск сцен")
     logger.info("Шаг 2/4: Поиск доступных сцен Sentinel-2 через Dagshub (S3)...")
     scenes = list_scenes(request)
     logger.info(f"Найдено сцен: {len(scenes)}")
@@ -66,18 +80,11 @@ def process_scene(
     selected_scene: SceneMetadata = scenes[0]
     logger.info(f"Выбрана сцена: {selected_scene.title} ({selected_scene.date.date()}), облачность {selected_scene.cloud_cover:.1f}%")
 
-    # --- Реализация Этапа 2.5: Скачивание + прогресс-бар ---
+    # --- Этап 2.5: доступ к COG-файлам (прогресс скачивания — в indices) ---
     logger.info("Шаг 3/4: Доступ к COG-файлам Sentinel-2 L2A (STAC assets)...")
-    scene_path = selected_scene  # теперь передаём весь объект SceneMetadata
-
-    with tqdm(total=100, desc="Доступ к данным Dagshub", unit="%") as pbar:
-        pbar.set_description("Загрузка метаданных...")
-        pbar.update(50)
-        pbar.set_description("Подготовка COG (TCI, B04, B08)...")
-        pbar.update(50)
-        logger.info(f"Сцена доступна по пути: {scene_path}")
-        pbar.close()
+    logger.info(f"Сцена: {selected_scene.scene_id}, ассеты: {list((selected_scene.assets or {}).keys())}")
 
+    report_progress(0.3, f"индексы {selected_scene.scene_id}")
     logger.info("Шаг 4/4: Расчёт спектральных индексов, визуализация RGB+NDVI с контуром...")
     start_time = datetime.now()
     indices_result = process_scene_indices(
@@ -89,6 +96,7 @@ def process_scene(
     duration = (datetime.now() - start_time).total_seconds()
     logger.info(f"Обработка и визуализация завершены за {duration:.1f} сек")
 
+    report_progress(0.85, "отчёт")
     logger.info("Шаг 4/4: Формирование отчёта...")
 
     # 4. Формируем подробный отчёт
@@ -100,9 +108,9 @@ def process_scene(
         f"Облачность по каталогу: {selected_scene.cloud_cover:.1f}%",
         "",
         "=== Результаты обработки ===",
-        f"NDVI (средний): {indices_result['ndvi_mean']:.3f}",
-        f"NDWI (средний): {indices_result.get('ndwi_mean', 0):.3f}",
-        f"Пикселей после маски облаков: {indices_result.get('valid_pixels_percent', 0):.1f}%",
+        f"NDVI (средний): {format_stat(indices_result.get('ndvi_mean'))}",
+        f"NDWI (средний): {format_stat(indices_result.get('ndwi_mean'))}",
+        f"Пикселей после маски облаков: {format_stat(indices_result.get('valid_pixels_percent'), '.1f', '%')}",
         f"Время обработки: {duration:.1f} сек",
         f"Статус: {indices_result['status']}",
         f"RGB: {indices_result.get('rgb_path', 'не сохранено')}",
@@ -114,30 +122,197 @@ indices_result.get('recommendation', '')
 
     report = "\n".join(report_lines)
 
+    record = record_from_indices(selected_scene, Path(kml_path).stem, indices_result, duration)
     llm_analysis = None
     if use_llm:
+        from .llm import call_llm
+        from .llm_batch import SYSTEM_PROMPT, build_prompt
+
+        report_progress(0.9, "анализ LLM")
         logger.info("Запрос анализа у Qwen3 (OpenRouter)...")
-        # llm_analysis = call_llm(...)  # будет включено после установки litellm
-        llm_analysis = "Qwen3-анализ временно отключён (отсутствует зависимость litellm)."
+        try:
+            llm_analysis = call_llm(build_prompt(record.field_id, [record]), system_prompt=SYSTEM_PROMPT,
+                                    temperature=0.3)
+        except Exception as e:
+            logger.warning(f"LLM-анализ не получен: {type(e).__name__}: {e}")
+            llm_analysis = f"LLM-анализ недоступен: {e}"
         report += f"\n\n=== Анализ и рекомендации от Qwen3 ===\n{llm_analysis}\n"
 
     logger.info("Обработка поля успешно завершена.")
+    logger.info(f"Метрики этапов:\n{metrics.format_summary(since=baseline)}")
+    export_metrics(since=baseline, kml=Path(kml_path).name)
     return AnalysisResult(
         status="success",
         scenes_found=len(scenes),
         selected_scene=selected_scene,
         report=report,
-        llm_analysis=llm_analysis
+        llm_analysis=llm_analysis,
+        record=record,
     )
 
 
+def _records_writer(records_path: Optional[str]) -> Optional[RecordWriter]:
+    path = records_path or settings.records_path
+    return RecordWriter(path) if path else None
+
+
+def _analyze_results(results: List[AnalysisResult], output_dir: Path = Path("output")):
+    """
+    LLM-этап многосценовых сценариев: промпты всех сцен уходят одновременно
+    (llm_batch.analyze_many), ответ сразу дописывается в результат сцены и в
+    <scene_id>_llm.md, не дожидаясь остальных.
+    """
+    from .llm_batch import analyze_many, build_prompt
+
+    def on_result(idx: int, text: Optional[str]):
+        result = results[idx]
+        result.llm_analysis = text or "LLM-анализ недоступен"
+        result.report += f"\n\n=== Анализ и рекомендации от Qwen3 ===\n{result.llm_analysis}\n"
+        if text:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            (output_dir / f"{result.record.scene_id}_llm.md").write_text(text + "\n", encoding="utf-8")
+        logger.info(f"LLM: готов анализ {result.record.scene_id}")
+
+    analyze_many({idx: build_prompt(r.record.field_id, [r.record]) for idx, r in enumerate(results)
+                  if r.record is not None}, on_result=on_result)
+
+
+# ── параллельная обработка сцен ──
+
+def _available_memory_mb() -> Optional[float]:
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def scene_workers(n_scenes: int, workers: Optional[int] = None) -> int:
+    """
+    Сколько процессов запускать: settings.scene_workers (0 — по числу CPU),
+    но не больше числа сцен и не больше, чем помещается в свободную память
+    при бюджете settings.scene_worker_memory_mb на процесс.
+    """
+    workers = settings.scene_workers if workers is None else workers
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    budget = settings.scene_worker_memory_mb
+    available = _available_memory_mb()
+    if budget and available:
+        workers = min(workers, max(1, int(available // budget)))
+    return max(1, min(workers, n_scenes))
+
+
+def _init_scene_worker(memory_mb: int):
+    """Инициализация процесса-воркера: свой matplotlib без GUI, кэш GDAL в пределах бюджета."""
+    import matplotlib
+    matplotlib.use("Agg")
+    if memory_mb:
+        os.environ.setdefault("GDAL_CACHEMAX", str(max(64, memory_mb // 4)))
+
+
+def _peak_memory_mb() -> Optional[float]:
+    """Пик RSS процесса в МБ (ru_maxrss) или None, где модуля resource нет (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS: байты, прочие: КБ
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _process_scene_task(scene: SceneMetadata, buffer_path: str, output_dir: str):
+    """Одна сцена в процессе-воркере. Метрики воркера возвращаются родителю снимком."""
+    metrics.reset()
+    start_time = datetime.now()
+    indices_result = process_scene_indices(
+        safe_path=scene,
+        buffer_geojson_path=buffer_path,
+        visualize=True,
+        output_dir=Path(output_dir)
+    )
+    duration = (datetime.now() - start_time).total_seconds()
+    return indices_result, duration, metrics.snapshot(), _peak_memory_mb()
+
+
+def iter_scenes(scenes: List[SceneMetadata], buffer_path: str, output_dir: Path = Path("output"),
+                workers: Optional[int] = None):
+    """
+    Генератор по сценам в порядке scenes: (scene, (indices_result, duration))
+    или (scene, исключение), если сцена упала. Результаты отдаются по мере готовности,
+    поэтому вызывающий может сразу их сохранить (см. manifest.Job.run_units).
+    При workers > 1 сцены идут в пул процессов (spawn): у каждого процесса свой
+    matplotlib и GDAL, метрики сводятся в родительский реестр. Каждая сцена
+    держит слот scheduler.cpu — между сценами вперёд проходит более приоритетная работа.
+    """
+    from . import scheduler
+
+    n = scene_workers(len(scenes), workers)
+    if n == 1:
+        for idx, scene in enumerate(scenes):
+            logger.info(f"Сцена {idx+1}/{len(scenes)}: {scene.scene_id}")
+            start_time = datetime.now()
+            try:
+                with scheduler.cpu.slot():
+                    indices_result = process_scene_indices(
+                        safe_path=scene,
+                        buffer_geojson_path=buffer_path,
+                        visualize=True,
+                        output_dir=output_dir
+                    )
+            except Exception as e:
+                yield scene, e
+                continue
+            yield scene, (indices_result, (datetime.now() - start_time).total_seconds())
+        return
+
+    budget = settings.scene_worker_memory_mb
+    logger.info(f"Параллельная обработка: {len(scenes)} сцен, {n} процессов, бюджет {budget} МБ на процесс")
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=n, mp_context=ctx, initializer=_init_scene_worker,
+                             initargs=(budget,)) as pool:
+        futures = [scheduler.cpu.submit(pool, _process_scene_task, scene, buffer_path, str(output_dir))
+                   for scene in scenes]
+        try:
+            for scene, future in zip(scenes, futures):
+                try:
+                    indices_result, duration, snap, peak_mb = future.result()
+                except Exception as e:
+                    yield scene, e
+                    continue
+                metrics.merge(snap)
+                if budget and peak_mb is not None and peak_mb > budget:
+                    logger.warning(f"{scene.scene_id}: пик памяти воркера {peak_mb:.0f} МБ больше бюджета {budget} МБ")
+                logger.info(f"Сцена {scene.scene_id} готова за {duration:.1f}s")
+                yield scene, (indices_result, duration)
+        finally:
+            for future in futures:
+                future.cancel()  # генератор закрыт раньше — сцены, ждущие слот, не запускаем
+
+
+def run_scenes(scenes: List[SceneMetadata], buffer_path: str, output_dir: Path = Path("output"),
+               workers: Optional[int] = None) -> List[tuple]:
+    """
+    process_scene_indices по списку сцен. Возвращает [(indices_result, duration)]
+    в порядке scenes; ошибка любой сцены пробрасывается.
+    """
+    results = []
+    for scene, result in iter_scenes(scenes, buffer_path, output_dir, workers):
+        if isinstance(result, Exception):
+            raise result
+        results.append(result)
+    return results
+
+
 def process_multiple_scenes(
     kml_path: str,
     start_date: str = "2024-01-01",
     end_date: str = "2025-12-31",
     max_cloud_cover: int = 100,
     max_scenes: int = 5,
-    use_llm: bool = False
+    use_llm: bool = False,
+    workers: Optional[int] = None,
+    records_path: Optional[str] = None,
 ) -> List[AnalysisResult]:
     """
     Сценарий: показать доступные сцены за период, загрузить первые N, сделать RGB+NDVI с контуром.
@@ -145,9 +320,13 @@ def process_multiple_scenes(
     1. Ищет все сцены за период (list_available_scenes)
     2. Берёт первые max_scenes
     3. Для каждой: скачивает TCI → RGB+contour, скачивает B04/B08 → NDVI+contour
-    4. Возвращает список результатов
+       (workers > 1 — сцены параллельно в пуле процессов, см. run_scenes)
+    4. Возвращает список результатов; числа каждой сцены — в result.record,
+       с records_path (или settings.records_path) они пишутся и в CSV/Parquet
+    5. use_llm — LLM-анализ всех сцен одновременно (см. llm_batch.py)
     """
     logger.info(f"=== Многосценовая обработка: {kml_path} ===")
+    baseline = metrics.snapshot()
     logger.info(f"Период: {start_date} — {end_date}, cloud ≤ {max_cloud_cover}%, лимит: {max_scenes} сцен")
 
     # Шаг 1: поиск всех сцен
@@ -182,29 +361,22 @@ def process_multiple_scenes(
     selected = all_scenes[:max_scenes]
     logger.info(f"Обрабатываем первые {len(selected)} сцен: {[s.scene_id for s in selected]}")
 
-    # Шаг 3: обработка каждой сцены
+    # Шаг 3: обработка сцен (по порядку выбора, при workers > 1 — параллельно)
     results = []
-    for idx, scene in enumerate(selected):
+    records = _records_writer(records_path)
+    processed = run_scenes(selected, buffer_path, Path("output"), workers)
+    for idx, (scene, (indices_result, duration)) in enumerate(zip(selected, processed)):
         logger.info(f"\n{'─'*50}")
         logger.info(f"Сцена {idx+1}/{len(selected)}: {scene.scene_id} ({scene.date.date()}), cloud={scene.cloud_cover:.0f}%")
 
-        start_time = datetime.now()
-        indices_result = process_scene_indices(
-            safe_path=scene,
-            buffer_geojson_path=buffer_path,
-            visualize=True,
-            output_dir=Path("output")
-        )
-        duration = (datetime.now() - start_time).total_seconds()
-
         report_lines = [
             f"Отчёт по сцене {scene.scene_id}",
             f"Дата съёмки: {scene.date.date()}",
             f"Облачность: {scene.cloud_cover:.1f}%",
             "",
             "=== Результаты ===",
-            f"NDVI (средний): {indices_result.get('ndvi_mean', 0):.3f}",
-            f"NDWI (средний): {indices_result.get('ndwi_mean', 0):.3f}",
+            f"NDVI (средний): {format_stat(indices_result.get('ndvi_mean'))}",
+            f"NDWI (средний): {format_stat(indices_result.get('ndwi_mean'))}",
             f"Время обработки: {duration:.1f} сек",
             f"RGB: {indices_result.get('rgb_path', '—')}",
             f"NDVI: {indices_result.get('ndvi_path', '—')}",
@@ -217,18 +389,34 @@ def process_multiple_scenes(
             scenes_found=len(all_scenes),
             selected_scene=scene,
             report=report,
-            llm_analysis=None
+            llm_analysis=None,
+            record=record_from_indices(scene, Path(kml_path).stem, indices_result, duration),
         )
         results.append(result)
-        logger.info(f"Готово: {scene.scene_id} за {duration:.1f}s, NDVI={indices_result.get('ndvi_mean', 0):.3f}")
+        if records is not None:
+            records.write(result.record)
+        logger.info(f"Готово: {scene.scene_id} за {duration:.1f}s, NDVI={format_stat(indices_result.get('ndvi_mean'))}")
 
+    if records is not None:
+        records.close()
+    if use_llm:
+        _analyze_results(results)
     logger.info(f"\n{'='*70}")
     logger.info(f"Многосценовая обработка завершена. Обработано {len(results)} из {len(all_scenes)} сцен.")
+    logger.info(f"Где ушло время:\n{metrics.format_summary(since=baseline)}")
     logger.info(f"{'='*70}")
+    export_metrics(since=baseline, kml=Path(kml_path).name)
 
     return results
 
 
+def _outputs_exist(unit, outputs) -> bool:
+    """Файлы выполненной сцены (RGB, NDVI, COG) ещё на диске — иначе сцена считается заново."""
+    indices_result = outputs[0] if outputs else {}
+    paths = [indices_result.get(k) for k in ("rgb_path", "ndvi_path", "ndvi_cog_path")]
+    return all(Path(p).exists() for p in paths if p and Path(str(p)).suffix)
+
+
 def process_filtered_scenes(
     kml_path: str,
     start_date: str = "2024-04-01",
@@ -236,12 +424,37 @@ def process_filtered_scenes(
     max_cloud_percent: float = 10.0,
     max_scenes: int = 5,
     max_scene_cloud_prefilter: float = 90.0,
+    workers: Optional[int] = None,
+    resume: Optional[bool] = None,
+    records_path: Optional[str] = None,
+    use_llm: bool = False,
 ) -> List[AnalysisResult]:
     """
     Сценарий: получить снимки за период через filter_pipeline (SCL-проверка),
     выбрать 5 лучших по облачности над полем, скачать и нарисовать RGB+NDVI с контуром.
+    workers > 1 — сцены обрабатываются параллельно в пуле процессов (см. run_scenes).
+    resume (по умолчанию settings.job_resume) — чекпоинты в манифесте заданий:
+    повторный запуск с теми же параметрами пропускает готовые сцены, чьи файлы
+    на месте, упавшие повторяются (см. manifest.py). Фильтрация выполняется
+    заново: новые снимки открытого периода попадают в выборку.
+    records_path (по умолчанию settings.records_path) — выгрузка IndexRecord сцен в CSV/Parquet.
+    use_llm — LLM-анализ всех сцен одновременно (см. llm_batch.py).
     """
     from .sentinel_filter import filter_pipeline
+    from .manifest import JobManifest
+
+    baseline = metrics.snapshot()
+    resume = settings.job_resume if resume is None else resume
+    field = Path(kml_path).stem
+    job = None
+    if resume:
+        job = JobManifest().job(
+            "filtered_scenes", kml=str(Path(kml_path).resolve()),
+            kml_sha1=hashlib.sha1(Path(kml_path).read_bytes()).hexdigest(),
+            start_date=start_date, end_date=end_date, max_cloud_percent=max_cloud_percent,
+            max_scenes=max_scenes, max_scene_cloud_prefilter=max_scene_cloud_prefilter,
+        )
+        logger.info(f"Задание {job.job_id}: {job.status()}")
 
     logger.info("=" * 70)
     logger.info("ОБРАБОТКА ОТФИЛЬТРОВАННЫХ СНИМКОВ (SCL-фильтрация)")
@@ -252,6 +465,8 @@ def process_filtered_scenes(
 
     # Этап 1: фильтрация через filter_pipeline
     logger.info("Этап 1: фильтрация снимков через STAC + SCL...")
+
+    # Не чекпоинтится: каталог пополняется, и сохранённый список сцен устарел бы
     all_scenes = filter_pipeline(
         kml_path=kml_path,
         date_range=f"{start_date}/{end_date}",
@@ -280,17 +495,9 @@ def process_filtered_scenes(
     buffer_path = create_buffer(kml_path, settings.buffer_meters)
     logger.info(f"Буфер: {buffer_path}")
 
-    # Этап 3: обработка каждой сцены
-    results = []
-    for idx, scene_dict in enumerate(selected_scenes):
-        logger.info(f"\n{'─'*60}")
-        logger.info(f"Сцена {idx+1}/{len(selected_scenes)}: {scene_dict['item_id']}")
-        logger.info(f"  datetime: {scene_dict['datetime']}")
-        logger.info(f"  cloud_cover_field: {scene_dict['cloud_cover_field']}%")
-        logger.info(f"  assets keys: {list(scene_dict['assets'].keys())}")
-
-        # Создаём SceneMetadata с assets
-        scene = SceneMetadata(
+    # Этап 3: SceneMetadata с assets для каждой сцены
+    scenes = [
+        SceneMetadata(
             scene_id=scene_dict["item_id"],
             date=datetime.fromisoformat(scene_dict["datetime"].replace("Z", "+00:00")),
             cloud_cover=scene_dict["cloud_cover_field"],
@@ -299,15 +506,34 @@ def process_filtered_scenes(
             download_url=scene_dict["assets"].get("visual"),
             assets=scene_dict["assets"],
         )
+        for scene_dict in selected_scenes
+    ]
 
-        start_time = datetime.now()
-        indices_result = process_scene_indices(
-            safe_path=scene,
-            buffer_geojson_path=buffer_path,
-            visualize=True,
-            output_dir=Path("output")
-        )
-        duration = (datetime.now() - start_time).total_seconds()
+    # Этап 4: обработка сцен (по порядку выбора, при workers > 1 — параллельно)
+    if job is None:
+        processed = dict(zip([s.scene_id for s in scenes], run_scenes(scenes, buffer_path, Path("output"), workers)))
+    else:
+        by_unit = {(field, s.scene_id, "indices"): s for s in scenes}
+
+        def execute_scenes(units):
+            for scene, result in iter_scenes([by_unit[u] for u in units], buffer_path, Path("output"), workers):
+                yield (field, scene.scene_id, "indices"), result
+
+        done = job.run_units(list(by_unit), execute_scenes, valid=_outputs_exist)
+        processed = {unit[1]: tuple(result) for unit, result in done.items()}
+        logger.info(f"Задание {job.job_id}: {job.status()}")
+
+    results = []
+    records = _records_writer(records_path)
+    for idx, (scene_dict, scene) in enumerate(zip(selected_scenes, scenes)):
+        if scene.scene_id not in processed:
+            continue
+        indices_result, duration = processed[scene.scene_id]
+        logger.info(f"\n{'─'*60}")
+        logger.info(f"Сцена {idx+1}/{len(selected_scenes)}: {scene_dict['item_id']}")
+        logger.info(f"  datetime: {scene_dict['datetime']}")
+        logger.info(f"  cloud_cover_field: {scene_dict['cloud_cover_field']}%")
+        logger.info(f"  assets keys: {list(scene_dict['assets'].keys())}")
 
         report_lines = [
             f"Отчёт по сцене {scene.scene_id}",
@@ -315,8 +541,8 @@ def process_filtered_scenes(
             f"Облачность над полем: {scene.cloud_cover:.1f}%",
             "",
             "=== Результаты ===",
-            f"NDVI (средний): {indices_result.get('ndvi_mean', 0):.3f}",
-            f"NDWI (средний): {indices_result.get('ndwi_mean', 0):.3f}",
+            f"NDVI (средний): {format_stat(indices_result.get('ndvi_mean'))}",
+            f"NDWI (средний): {format_stat(indices_result.get('ndwi_mean'))}",
             f"Время обработки: {duration:.1f} сек",
             f"RGB: {indices_result.get('rgb_path', '—')}",
             f"NDVI: {indices_result.get('ndvi_path', '—')}",
@@ -329,14 +555,23 @@ def process_filtered_scenes(
             scenes_found=len(all_scenes),
             selected_scene=scene,
             report=report,
-            llm_analysis=None
+            llm_analysis=None,
+            record=record_from_indices(scene, Path(kml_path).stem, indices_result, duration),
         )
         results.append(result)
-        logger.info(f"Готово: {scene.scene_id} за {duration:.1f}s, NDVI={indices_result.get('ndvi_mean', 0):.3f}")
+        if records is not None:
+            records.write(result.record)
+        logger.info(f"Готово: {scene.scene_id} за {duration:.1f}s, NDVI={format_stat(indices_result.get('ndvi_mean'))}")
 
+    if records is not None:
+        records.close()
+    if use_llm:
+        _analyze_results(results)
     logger.info(f"\n{'='*70}")
     logger.info(f"Обработка завершена. Обработано {len(results)} из {len(all_scenes)} сцен.")
+    logger.info(f"Где ушло время:\n{metrics.format_summary(since=baseline)}")
     logger.info(f"{'='*70}")
+    export_metrics(since=baseline, kml=Path(kml_path).name)
 
     return results
 
@@ -0,0 +1,161 @@
+"""
+Встроенное профилирование запусков RLM.
+
+Включается флагом `--profile` (rlm и MCP-сервер) или переменной `RLM_PROFILE=1`.
+Пока профилирование выключено, модуль даже не импортируется — накладных расходов нет.
+
+Сэмплирующий профилировщик раз в `profile_interval_ms` снимает стеки всех потоков
+(`sys._current_frames`) и помечает каждый сэмпл текущим этапом из metrics
+(read, compute, render…). По окончании запуска в `profile_dir/<имя>-<время>/` пишутся:
+
+    all.collapsed        — весь запуск, формат collapsed stacks (flamegraph.pl, speedscope)
+    <этап>.collapsed     — только сэмплы, снятые внутри этапа
+    main.prof            — cProfile главного потока (если RLM_PROFILE_CPROFILE=1)
+
+    from .profiling import profiling
+
+    with profiling("analyze"):
+        process_scene(...)
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .metrics import metrics as default_registry
+
+logger = logging.getLogger(__name__)
+
+NO_STAGE = "-"
+
+
+class SamplingProfiler:
+    """Фоновый поток, периодически снимающий стеки всех остальных потоков."""
+
+    def __init__(self, interval: float = 0.005, registry=default_registry):
+        self.interval = interval
+        self.registry = registry
+        self.samples: Counter = Counter()  # (поток, этап, стек) -> число сэмплов
+        self._labels: Dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="rlm-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _frame_label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stages = self.registry.active_stages()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                key = (names.get(ident, str(ident)), stages.get(ident, NO_STAGE), tuple(stack))
+                self.samples[key] += 1
+
+    def collapsed(self, stage_name: Optional[str] = None) -> str:
+        """Строки `поток;f1;f2;... N`; stage_name — только сэмплы этого этапа."""
+        merged: Dict[Tuple[str, ...], int] = Counter()
+        for (thread, stage_, stack), count in self.samples.items():
+            if stage_name is None or stage_ == stage_name:
+                merged[(thread,) + stack] += count
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(merged.items()))
+
+    def stages(self) -> Dict[str, int]:
+        per_stage: Dict[str, int] = Counter()
+        for (_, stage_, _), count in self.samples.items():
+            per_stage[stage_] += count
+        return dict(per_stage)
+
+
+class ProfileSession:
+    """Один профилируемый запуск: сэмплер + опционально cProfile, запись файлов в stop()."""
+
+    def __init__(self, name: str = "run", out_dir=None, interval_ms: Optional[float] = None,
+                 use_cprofile: Optional[bool] = None):
+        from .config import settings
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.out_dir = Path(out_dir or settings.profile_dir) / f"{name}-{stamp}"
+        interval_ms = settings.profile_interval_ms if interval_ms is None else interval_ms
+        self.sampler = SamplingProfiler(interval=interval_ms / 1000.0)
+        self.use_cprofile = settings.profile_cprofile if use_cprofile is None else use_cprofile
+        self._cprofile = None
+        self._stopped = False
+
+    def start(self) -> "ProfileSession":
+        if self.use_cprofile:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self.sampler.start()
+        logger.info(f"Профилирование включено: {self.out_dir}")
+        return self
+
+    def stop(self) -> Optional[Path]:
+        if self._stopped:
+            return None
+        self._stopped = True
+        self.sampler.stop()
+        if self._cprofile is not None:
+            self._cprofile.disable()
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        (self.out_dir / "all.collapsed").write_text(self.sampler.collapsed(), encoding="utf-8")
+        per_stage = self.sampler.stages()
+        for stage_name in per_stage:
+            if stage_name != NO_STAGE:
+                (self.out_dir / f"{stage_name}.collapsed").write_text(
+                    self.sampler.collapsed(stage_name), encoding="utf-8"
+                )
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(str(self.out_dir / "main.prof"))
+
+        total = sum(per_stage.values()) or 1
+        summary = ", ".join(f"{k}={v / total:.0%}" for k, v in sorted(per_stage.items(), key=lambda kv: -kv[1]))
+        logger.info(
+            f"Профиль сохранён: {self.out_dir} "
+            f"({sum(per_stage.values())} сэмплов за {self.sampler.duration:.1f} с; {summary})"
+        )
+        return self.out_dir
+
+
+def start_profiling(name: str = "run", **kwargs) -> ProfileSession:
+    return ProfileSession(name, **kwargs).start()
+
+
+@contextmanager
+def profiling(name: str = "run", **kwargs):
+    session = start_profiling(name, **kwargs)
+    try:
+        yield session
+    finally:
+        session.stop()
@@ -0,0 +1,91 @@
+"""
+Ограничение частоты запросов к HTTP-транспорту MCP-сервера по клиентам.
+
+Клиент — IP-адрес соединения. Заголовок `X-Client-Id` задаёт сам клиент, поэтому
+в ключ лимита он не входит (новый id на каждый запрос давал бы полный всплеск) и
+пишется только в журнал. У каждого клиента свой token bucket: settings.mcp_http_rate_limit
+запросов в секунду в среднем и всплеск до settings.mcp_http_rate_burst. Сверх
+лимита — 429 с Retry-After; один агент не может занять сервер остальным.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .config import settings
+from .metrics import inc
+
+logger = logging.getLogger(__name__)
+
+CLIENT_HEADER = b"x-client-id"
+
+
+class ClientRateLimiter:
+    """Token bucket на клиента; неактивные клиенты забываются через idle_s."""
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[int] = None, idle_s: float = 600.0):
+        self.rate = settings.mcp_http_rate_limit if rate is None else rate
+        self.burst = burst or settings.mcp_http_rate_burst
+        self.idle_s = idle_s
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # клиент -> (токены, время)
+        self._lock = threading.Lock()
+
+    def acquire(self, client: str) -> float:
+        """0 — запрос разрешён, иначе через сколько секунд появится токен."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(client, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self._buckets[client] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[client] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            if len(self._buckets) > 1024:
+                self._buckets = {c: v for c, v in self._buckets.items() if now - v[1] < self.idle_s}
+        return wait
+
+
+def client_id(scope) -> str:
+    """Клиент для лимита и честной очереди — IP соединения, а не присланный заголовок."""
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def client_label(scope) -> str:
+    """IP и, если есть, X-Client-Id — для журнала."""
+    for name, value in scope.get("headers", ()):
+        if name == CLIENT_HEADER and value:
+            return f"{client_id(scope)} ({value.decode('latin-1')})"
+    return client_id(scope)
+
+
+class RateLimitMiddleware:
+    """ASGI-middleware: HTTP-запросы сверх лимита клиента получают 429."""
+
+    def __init__(self, app, limiter: Optional[ClientRateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or ClientRateLimiter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        client = client_id(scope)
+        wait = self.limiter.acquire(client)
+        if not wait:
+            return await self.app(scope, receive, send)
+
+        inc("rlm_http_rate_limited_total")
+        logger.warning(f"Клиент {client_label(scope)}: превышен лимит запросов, повтор через {wait:.1f} с")
+        body = json.dumps({"error": "rate limit exceeded", "retry_after": round(wait, 2)}).encode()
+        await send({"type": "http.response.start", "status": 429, "headers": [
+            (b"content-type", b"application/json"),
+            (b"retry-after", str(max(1, round(wait))).encode()),
+            (b"content-length", str(len(body)).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,162 @@
+"""
+Числовые результаты (IndexRecord) и их потоковая выгрузка.
+
+Вместо разбора текстового `report` потребители берут `AnalysisResult.record`
+или читают выгрузку: `RecordWriter` дописывает записи в CSV или Parquet (нужен
+pyarrow) по ходу прогона, сбрасывая на диск каждые settings.records_flush_rows
+строк — CSV читается и после обрыва прогона. `read_records` загружает выгрузку
+в pandas с заданными типами колонок — десятки тысяч поле-дат за миллисекунды.
+
+    with RecordWriter("output/batch/summary.parquet") as writer:
+        writer.write(record)
+    df = read_records("output/batch/summary.parquet")
+"""
+
+import csv
+import logging
+import typing
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+from .config import settings
+from .models import IndexRecord
+
+logger = logging.getLogger(__name__)
+
+RECORD_COLUMNS = tuple(IndexRecord.model_fields)
+FORMATS = ("csv", "parquet")
+
+
+def _column_type(name: str) -> type:
+    annotation = IndexRecord.model_fields[name].annotation
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    return args[0] if args else annotation
+
+
+_COLUMN_TYPES = {name: _column_type(name) for name in RECORD_COLUMNS}
+_PANDAS_DTYPES = {float: "float64", int: "Int64", str: "string"}
+
+
+def _path_or_none(value) -> Optional[str]:
+    """indices отдаёт "не создан"/"—" вместо пути — в записи это пусто."""
+    return str(value) if value and Path(str(value)).suffix else None
+
+
+def record_from_indices(scene, field_id: str, indices_result: Dict, duration: Optional[float] = None,
+                        tile: Optional[str] = None) -> IndexRecord:
+    """
+    IndexRecord из SceneMetadata и словаря process_scene_indices. Облачность —
+    над полем (по SCL), а не по сцене из каталога; чего indices не посчитал — None.
+    """
+    return IndexRecord(
+        field_id=field_id,
+        date=scene.date.date().isoformat(),
+        scene_id=scene.scene_id,
+        tile=tile,
+        status=indices_result.get("status", "unknown"),
+        cloud_percent=indices_result.get("cloud_percent"),
+        nodata_percent=indices_result.get("nodata_percent"),
+        valid_pixels=indices_result.get("valid_pixels"),
+        valid_pixels_percent=indices_result.get("valid_pixels_percent"),
+        ndvi_mean=indices_result.get("ndvi_mean"),
+        ndvi_median=indices_result.get("ndvi_median"),
+        ndwi_mean=indices_result.get("ndwi_mean"),
+        duration_s=round(duration, 3) if duration is not None else None,
+        rgb_path=_path_or_none(indices_result.get("rgb_path")),
+        ndvi_path=_path_or_none(indices_result.get("ndvi_path")),
+        ndvi_cog_path=_path_or_none(indices_result.get("ndvi_cog_path")),
+    )
+
+
+def _format_for(path: Path, fmt: Optional[str]) -> str:
+    fmt = (fmt or path.suffix.lstrip(".") or settings.records_format).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Формат выгрузки {fmt!r} не поддерживается, ожидается один из {FORMATS}")
+    return fmt
+
+
+def _arrow_schema():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("Для выгрузки в Parquet нужен pyarrow: pip install pyarrow") from e
+    types = {float: pa.float64(), int: pa.int64(), str: pa.string()}
+    return pa, pa.schema([(name, types[_COLUMN_TYPES[name]]) for name in RECORD_COLUMNS])
+
+
+class RecordWriter:
+    """
+    Потоковая запись IndexRecord в один файл (создаётся заново). Формат — по
+    расширению пути или fmt. Записи копятся в буфере и сбрасываются каждые
+    flush_rows строк и при close().
+    """
+
+    def __init__(self, path, fmt: Optional[str] = None, flush_rows: Optional[int] = None):
+        self.path = Path(path)
+        self.fmt = _format_for(self.path, fmt)
+        self.flush_rows = max(1, flush_rows or settings.records_flush_rows)
+        self.rows = 0
+        self._buffer = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.fmt == "csv":
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self._csv = csv.DictWriter(self._file, fieldnames=RECORD_COLUMNS)
+            self._csv.writeheader()
+        else:
+            self._pa, self._schema = _arrow_schema()
+            import pyarrow.parquet as pq
+            self._parquet = pq.ParquetWriter(self.path, self._schema, compression="zstd")
+
+    def write(self, record: Union[IndexRecord, Dict]):
+        if not isinstance(record, IndexRecord):
+            record = IndexRecord(**{k: v for k, v in record.items() if k in _COLUMN_TYPES})
+        self._buffer.append(record.model_dump())
+        self.rows += 1
+        if len(self._buffer) >= self.flush_rows:
+            self.flush()
+
+    def write_many(self, records: Iterable[Union[IndexRecord, Dict]]):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if self._buffer:
+            if self.fmt == "csv":
+                self._csv.writerows(self._buffer)
+            else:
+                self._parquet.write_table(self._pa.Table.from_pylist(self._buffer, schema=self._schema))
+            self._buffer = []
+        if self.fmt == "csv":
+            self._file.flush()
+
+    def close(self):
+        self.flush()
+        if self.fmt == "csv":
+            self._file.close()
+        else:
+            self._parquet.close()
+        logger.debug(f"Записей: {self.rows} → {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_records(path, records: Iterable[Union[IndexRecord, Dict]], fmt: Optional[str] = None) -> Path:
+    """Все записи одним вызовом (например, отсортированные по дате)."""
+    with RecordWriter(path, fmt) as writer:
+        writer.write_many(records)
+    return writer.path
+
+
+def read_records(path, fmt: Optional[str] = None):
+    """Выгрузка в pandas.DataFrame с типами колонок IndexRecord."""
+    import pandas as pd
+
+    path = Path(path)
+    if _format_for(path, fmt) == "parquet":
+        return pd.read_parquet(path)
+    dtypes = {name: _PANDAS_DTYPES[t] for name, t in _COLUMN_TYPES.items()}
+    return pd.read_csv(path, dtype=dtypes, keep_default_na=False, na_values=[""])
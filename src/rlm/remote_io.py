@@ -0,0 +1,270 @@
+"""
+Регулятор удалённого I/O: STAC-поиск и оконные чтения COG (S3, Earth Search).
+
+При большом параллелизме серверы отвечают 429/503 (S3 — «Slow Down»), и раньше
+такая ошибка в filter_pipeline молча отбраковывала сцену. Теперь каждое
+удалённое обращение идёт через `call(href, fn, ...)`:
+
+  • лимит одновременных запросов на хост — AIMD: +1/limit за каждый успешный
+    ответ, ×0.5 на 429/503/таймаут (не чаще раза за типичную задержку хоста),
+    в пределах settings.remote_min_concurrency..remote_max_concurrency;
+  • повтор на 429/5xx и сетевых ошибках — экспоненциальная задержка с полным
+    джиттером (settings.remote_backoff_s … remote_backoff_max_s, Retry-After
+    учитывается), не больше settings.remote_retries раз; после — RemoteIOError,
+    а не пропавшие данные;
+  • хеджирование (settings.remote_hedge): если чтение идёт дольше p95 задержки
+    хоста, запускается дубликат на новом дескрипторе и берётся первый ответ.
+
+Каждое решение — в метриках rlm_remote_*{host=...}. Локальные файлы идут мимо.
+
+    data = remote_io.call(href, read_window, href, polygon, hedge=True)
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+from .config import settings
+from .metrics import inc
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUSES = (429, 503)
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+_STATUS_RE = re.compile(r"HTTP (?:response code|error code|status)\s*[:=]?\s*(\d{3})", re.IGNORECASE)
+_TRANSIENT_RE = re.compile(r"CURL error|timed out|Connection reset|not recognized as being in a supported "
+                           r"file format|Slow ?Down|Too Many Requests", re.IGNORECASE)
+
+
+class RemoteIOError(IOError):
+    """Удалённый ресурс не ответил и после всех повторов (троттлинг, 5xx, сеть)."""
+
+
+def host_of(href: str) -> Optional[str]:
+    """Хост удалённого ресурса (в т.ч. /vsicurl/http://...) или None для локального пути."""
+    href = str(href)
+    if href.startswith("/vsicurl/"):
+        href = href[len("/vsicurl/"):]
+    elif href.startswith("/vsis3/"):
+        return "s3"
+    if not href.startswith(("http://", "https://")):
+        return None
+    return urlparse(href).netloc
+
+
+def status_of(error: BaseException) -> Optional[int]:
+    """HTTP-статус из исключения requests, pystac-client или сообщения GDAL."""
+    response = getattr(error, "response", None)
+    for value in (getattr(error, "status_code", None), getattr(response, "status_code", None)):
+        if isinstance(value, int):
+            return value
+    match = _STATUS_RE.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(error: BaseException):
+    """(повторять ли, сигнал перегрузки ли, причина для метрик)."""
+    status = status_of(error)
+    if status is not None:
+        return status in RETRY_STATUSES, status in THROTTLE_STATUSES, str(status)
+    if isinstance(error, TimeoutError) or "timed out" in str(error).lower():
+        return True, True, "timeout"
+    if isinstance(error, ConnectionError) or type(error).__name__ in ("ConnectionError", "ChunkedEncodingError"):
+        return True, False, "connection"
+    if _TRANSIENT_RE.search(str(error)):
+        return True, False, "transient"
+    return False, False, type(error).__name__
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Задержка перед повтором attempt (0, 1, ...): полный джиттер, не меньше Retry-After."""
+    delay = random.uniform(0, min(settings.remote_backoff_max_s, settings.remote_backoff_s * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+class HostLimiter:
+    """AIMD-лимит одновременных запросов к одному хосту и окно последних задержек."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.limit = float(settings.remote_initial_concurrency)
+        self.in_flight = 0
+        self._latencies = deque(maxlen=256)
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, block: bool = True) -> bool:
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                if not block:
+                    return False
+                start = time.monotonic()
+                while self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                inc("rlm_remote_queue_wait_seconds_total", time.monotonic() - start, host=self.host)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            before = int(self.limit)
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease > self.percentile(0.5, default=1.0):
+                    self.limit = max(float(settings.remote_min_concurrency), self.limit * 0.5)
+                    self._last_decrease = now
+                    inc("rlm_remote_limit_changes_total", host=self.host, direction="decrease")
+                    logger.warning(f"{self.host}: перегрузка, лимит запросов {before} → {int(self.limit)}")
+            elif latency is not None:
+                self._latencies.append(latency)
+                self.limit = min(float(settings.remote_max_concurrency), self.limit + 1 / self.limit)
+                if int(self.limit) > before:
+                    inc("rlm_remote_limit_changes_total", host=self.host, direction="increase")
+            self._cond.notify_all()
+
+    def percentile(self, q: float, default: Optional[float] = None) -> Optional[float]:
+        if len(self._latencies) < 20:
+            return default
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_limiters: Dict[str, HostLimiter] = {}
+_limiters_lock = threading.Lock()
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+
+
+def limiter(host: str) -> HostLimiter:
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = HostLimiter(host)
+        return _limiters[host]
+
+
+def stats() -> Dict[str, Dict]:
+    """Текущий лимит, запросы в полёте и p95 задержки по хостам."""
+    with _limiters_lock:
+        items = list(_limiters.items())
+    return {host: {"limit": int(lim.limit), "in_flight": lim.in_flight, "p95_s": lim.percentile(0.95)}
+            for host, lim in items}
+
+
+@contextmanager
+def _attempt_env(fresh: bool, retry: bool):
+    """
+    fresh — датасеты мимо кэша открытых (дубликат не ждёт замок основного запроса).
+    retry — GDAL запоминает неудачный ответ по URL и без CPL_VSIL_CURL_NON_CACHED
+    вернул бы ту же ошибку, не обращаясь к серверу.
+    """
+    from .cache import uncached_datasets
+
+    with ExitStack() as stack:
+        if fresh:
+            stack.enter_context(uncached_datasets())
+        if retry:
+            import rasterio
+            stack.enter_context(rasterio.Env(CPL_VSIL_CURL_NON_CACHED="/vsicurl/"))
+        yield
+
+
+def _timed(lim: HostLimiter, fn: Callable, args, kwargs, fresh: bool = False, retry: bool = False):
+    """Одна попытка с занятым слотом хоста; слот освобождается здесь же."""
+    start = time.monotonic()
+    try:
+        with _attempt_env(fresh, retry):
+            result = fn(*args, **kwargs)
+    except BaseException as e:
+        lim.release(throttled=classify(e)[1])
+        raise
+    lim.release(latency=time.monotonic() - start)
+    return result
+
+
+def _hedged(lim: HostLimiter, fn: Callable, args, kwargs, retry: bool):
+    """Попытка с дубликатом: если ответа нет дольше p95 хоста, второй запрос на новом дескрипторе."""
+    global _hedge_pool
+    delay = lim.percentile(0.95)
+    if delay is None:
+        return _timed(lim, fn, args, kwargs, retry=retry)
+    with _limiters_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="rlm-hedge")
+    primary = _hedge_pool.submit(_timed, lim, fn, args, kwargs, False, retry)
+    done, _ = wait([primary], timeout=max(delay, settings.remote_hedge_min_s))
+    if done:
+        return primary.result()
+    if not lim.acquire(block=False):
+        inc("rlm_remote_hedges_total", host=lim.host, outcome="skipped")  # лимит хоста исчерпан
+        return primary.result()
+    inc("rlm_remote_hedges_total", host=lim.host, outcome="launched")
+    hedge = _hedge_pool.submit(_timed, lim, fn, args, kwargs, True, retry)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                inc("rlm_remote_hedges_total", host=lim.host, outcome="won" if future is hedge else "lost")
+                return future.result()
+    return primary.result()  # оба упали — ошибка основного запроса
+
+
+def call(href: str, fn: Callable, *args, hedge: bool = False, **kwargs):
+    """
+    fn(*args, **kwargs) под лимитом хоста href с повторами. hedge=True — можно
+    дублировать медленный вызов (fn должна быть идемпотентной; дубликат открывает
+    датасеты мимо кэша). Для локального href — просто вызов fn.
+    """
+    host = host_of(href)
+    if host is None:
+        return fn(*args, **kwargs)
+    lim = limiter(host)
+    for attempt in range(settings.remote_retries + 1):
+        lim.acquire()
+        try:
+            if hedge and settings.remote_hedge:
+                result = _hedged(lim, fn, args, kwargs, retry=attempt > 0)
+            else:
+                result = _timed(lim, fn, args, kwargs, retry=attempt > 0)
+        except Exception as e:
+            retry, throttled, reason = classify(e)
+            if throttled:
+                inc("rlm_remote_throttled_total", host=host, reason=reason)
+            if not retry:
+                inc("rlm_remote_requests_total", host=host, outcome="error")
+                raise
+            _drop_handle(href)
+            if attempt >= settings.remote_retries:
+                inc("rlm_remote_requests_total", host=host, outcome="failed")
+                raise RemoteIOError(f"{href}: {reason} после {attempt + 1} попыток: {e}") from e
+            delay = backoff_delay(attempt, _retry_after(e))
+            inc("rlm_remote_requests_total", host=host, outcome="retry")
+            inc("rlm_remote_backoff_seconds_total", delay, host=host)
+            logger.info(f"{host}: {reason} ({type(e).__name__}), повтор {attempt + 1}/{settings.remote_retries} "
+                        f"через {delay:.2f} с")
+            time.sleep(delay)
+            continue
+        inc("rlm_remote_requests_total", host=host, outcome="ok")
+        return result
+
+
+def _drop_handle(href: str):
+    """Дескриптор, на котором случилась ошибка, закрывается — повтор откроет новый."""
+    from .cache import datasets
+
+    datasets.clear(lambda key: key == href)
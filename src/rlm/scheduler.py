@@ -0,0 +1,220 @@
+"""
+Приоритетный планировщик сетевой и CPU-работы процесса.
+
+Пока идёт многотысячный backfill, интерактивный `analyze_field` агронома не
+должен ждать за ним в очереди. Работа делится на единицы — сцена, группа
+тайл×дата, фоновое задание — и каждая единица берёт слот планировщика:
+
+  • классы приоритета: interactive > monitoring > backfill; освободившийся
+    слот получает самый высокий класс из ждущих;
+  • внутри класса — честная очередь по клиентам (round-robin): агент, поставивший
+    сто заданий, не отодвигает того, кто поставил одно;
+  • settings.scheduler_interactive_reserve слотов фоновые классы не занимают —
+    интерактивный запрос стартует сразу, остальную ёмкость забирает bulk;
+  • вытеснение на границах сцен: слот держится одну единицу, следующую сцену
+    bulk-работа снова ставит в очередь и пропускает вперёд интерактивные.
+
+Общие планировщики процесса: `network` (settings.scheduler_network_slots) и
+`cpu` (settings.scheduler_cpu_slots, 0 — по числу CPU). Класс и клиент текущего
+кода задаёт `with priority("backfill", client=...)`; без него — settings.scheduler_default_priority.
+
+    with priority("backfill"):
+        for scene in scenes:
+            with network.slot():
+                fetch(scene)
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from .config import settings
+from .metrics import inc
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("interactive", "monitoring", "backfill")
+INTERACTIVE = PRIORITIES[0]
+
+_current: contextvars.ContextVar = contextvars.ContextVar("rlm_priority", default=None)
+
+
+def check_priority(name: str) -> str:
+    if name not in PRIORITIES:
+        raise ValueError(f"Неизвестный класс приоритета {name!r}, ожидается один из {PRIORITIES}")
+    return name
+
+
+def current() -> Tuple[str, str]:
+    """(класс приоритета, клиент) текущего контекста."""
+    return _current.get() or (settings.scheduler_default_priority, "local")
+
+
+@contextmanager
+def priority(name: Optional[str] = None, client: Optional[str] = None):
+    """Класс и клиент для слотов, взятых внутри with; None — унаследовать текущие."""
+    inherited, inherited_client = current()
+    token = _current.set((check_priority(name or inherited), client or inherited_client))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("priority", "client", "grant", "queued_at")
+
+    def __init__(self, priority: str, client: str, grant: Callable):
+        self.priority = priority
+        self.client = client
+        self.grant = grant
+        self.queued_at = time.monotonic()
+
+
+class Scheduler:
+    """
+    Слоты с очередью по классам приоритета и клиентам. slots и reserve — числа
+    или функции без аргументов (чтобы читать settings на лету).
+    """
+
+    def __init__(self, name: str, slots, reserve=None):
+        self.name = name
+        self.slots = slots
+        self.reserve = reserve
+        self._queues: Dict[str, "OrderedDict[str, deque]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._running = {p: 0 for p in PRIORITIES}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _limits(self) -> Tuple[int, int]:
+        slots = self.slots() if callable(self.slots) else self.slots
+        reserve = self.reserve() if callable(self.reserve) else self.reserve
+        slots = max(1, slots or os.cpu_count() or 1)
+        if reserve is None:
+            reserve = settings.scheduler_interactive_reserve
+        return slots, min(max(0, reserve), slots - 1)
+
+    def _admissible(self, name: str, slots: int, reserve: int) -> bool:
+        running = sum(self._running.values())
+        if name == INTERACTIVE:
+            return running < slots
+        return running < slots and running - self._running[INTERACTIVE] < slots - reserve
+
+    def _next_grants(self):
+        """Ждущие, которым можно выдать слот (под self._lock): по классам, внутри — round-robin по клиентам."""
+        slots, reserve = self._limits()
+        grants = []
+        for name in PRIORITIES:
+            clients = self._queues[name]
+            while clients and self._admissible(name, slots, reserve):
+                client, waiters = next(iter(clients.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+                self._running[name] += 1
+                grants.append(waiter)
+        return grants
+
+    def _dispatch(self, grants):
+        for waiter in grants:
+            wait = time.monotonic() - waiter.queued_at
+            inc("rlm_scheduler_grants_total", scheduler=self.name, priority=waiter.priority)
+            inc("rlm_scheduler_wait_seconds_total", wait, scheduler=self.name, priority=waiter.priority)
+            if wait > 1:
+                logger.debug(f"{self.name}: {waiter.priority}/{waiter.client} ждал слот {wait:.1f} с")
+            waiter.grant(waiter.priority)
+
+    def request(self, grant: Callable[[str], None], priority: Optional[str] = None,
+                client: Optional[str] = None):
+        """
+        Неблокирующая заявка на слот: grant(класс) вызывается, когда слот выделен —
+        сразу в этом потоке или позже в потоке, освободившем слот. Слот
+        возвращается release(класс).
+        """
+        inherited, inherited_client = current()
+        waiter = _Waiter(check_priority(priority or inherited), client or inherited_client, grant)
+        with self._lock:
+            self._queues[waiter.priority].setdefault(waiter.client, deque()).append(waiter)
+            grants = self._next_grants()
+        self._dispatch(grants)
+
+    def release(self, name: str):
+        with self._lock:
+            self._running[name] -= 1
+            grants = self._next_grants()
+        self._dispatch(grants)
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, client: Optional[str] = None):
+        """
+        Держит слот на время with (одна единица работы — сцена, группа). Вложенный
+        slot того же планировщика в том же потоке слот не берёт.
+        """
+        if getattr(self._local, "depth", 0):
+            self._local.depth += 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+        granted = threading.Event()
+        holder = []
+        self.request(lambda name: (holder.append(name), granted.set()), priority, client)
+        granted.wait()
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            self.release(holder[0])
+
+    def submit(self, executor, fn: Callable, *args, priority: Optional[str] = None,
+               client: Optional[str] = None, **kwargs) -> Future:
+        """
+        fn(*args, **kwargs) в executor, когда выделен слот; слот держится до
+        завершения. Возвращает Future, который можно отменить, пока задача ждёт слот.
+        """
+        outer = Future()
+
+        def start(name: str):
+            if not outer.set_running_or_notify_cancel():
+                return self.release(name)
+            try:
+                inner = executor.submit(fn, *args, **kwargs)
+            except BaseException as e:
+                self.release(name)
+                return outer.set_exception(e)
+
+            def done(f: Future):
+                self.release(name)
+                if f.cancelled():
+                    outer.set_exception(RuntimeError("задача снята исполнителем"))
+                elif f.exception() is not None:
+                    outer.set_exception(f.exception())
+                else:
+                    outer.set_result(f.result())
+            inner.add_done_callback(done)
+
+        self.request(start, priority, client)
+        return outer
+
+    def stats(self) -> Dict:
+        """Занятые слоты и длины очередей по классам."""
+        with self._lock:
+            return {
+                "slots": self._limits()[0],
+                "running": dict(self._running),
+                "queued": {p: sum(map(len, q.values())) for p, q in self._queues.items()},
+            }
+
+
+network = Scheduler("network", slots=lambda: settings.scheduler_network_slots)
+cpu = Scheduler("cpu", slots=lambda: settings.scheduler_cpu_slots)
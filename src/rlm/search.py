@@ -7,7 +7,26 @@ import geopandas as gpd
 from .config import settings
 from .models import SceneMetadata, SearchRequest
 from .dagshub_search import get_available_scenes_from_dagshub
+from .metrics import timed, inc
+from .cache import TTLCache, cached, file_key
+from .coalesce import coalesced, field_hash
+from . import remote_io
 import logging,json,tempfile,os
+
+STAC_URL = "https://earth-search.aws.element84.com/v1"
+# Результаты STAC-поиска по (bbox, период, облачность, лимит) — повторный вызов MCP за миллисекунды
+stac_results = TTLCache("stac_search", ttl=lambda: settings.cache_stac_ttl_s)
+_buffers = TTLCache("buffer")
+
+
+@cached("stac_client")
+def stac_client(url: str = STAC_URL):
+    """Открытый pystac Client на процесс: корневой каталог не запрашивается на каждый поиск."""
+    from pystac_client import Client
+    return Client.open(url)
+
+
+@cached("geometry_file", key=lambda path: file_key(path), copy=lambda gdf: gdf.copy())
 def read_geometry_file(path):
     """Read vector file with fastkml fallback."""
     try:
@@ -39,10 +58,15 @@ def read_geometry_file(path):
             os.unlink(tmp)
 
 
+@timed("buffer")
 def create_buffer(kml_path: str, buffer_meters: int = None) -> str:
     """Создаёт буферную зону вокруг поля (по умолчанию 500м)"""
     if buffer_meters is None:
         buffer_meters = settings.buffer_meters
+    key = (file_key(kml_path), buffer_meters)
+    buffered_path = _buffers.get(key) if settings.cache_enabled else None
+    if buffered_path and os.path.exists(buffered_path):
+        return buffered_path
 
     gdf = read_geometry_file(kml_path)
     if gdf.empty:
@@ -56,9 +80,13 @@ def create_buffer(kml_path: str, buffer_meters: int = None) -> str:
     # Если LineString/Point, буфер уже превратил их в Polygon
     buffered_path = kml_path.replace(".kml", f"_buffer_{buffer_meters}m.geojson")
     gdf.to_file(buffered_path, driver="GeoJSON")
+    _buffers.put(key, buffered_path)
     return buffered_path
 
 
+@timed("search")
+@coalesced("list_available_scenes", copy=list, key=lambda kml_path, start_date, end_date, max_cloud_cover, max_items: (
+    field_hash(kml_path), start_date, end_date, max_cloud_cover, max_items))
 def list_available_scenes(
     kml_path: str,
     start_date: str = "2024-01-01",
@@ -69,17 +97,21 @@ def list_available_scenes(
     """Поиск всех доступных сцен Sentinel-2 L2A через STAC API с привязкой к дате.
     Возвращает сцены, отсортированные по дате (сначала новые)."""
     import logging
-    from pystac_client import Client
 
     logger = logging.getLogger(__name__)
     logger.info(f"Поиск сцен за {start_date} — {end_date}, cloud ≤ {max_cloud_cover}%")
 
-    gdf = gpd.read_file(kml_path)
+    gdf = read_geometry_file(kml_path)
     if gdf.crs is None:
         gdf = gdf.set_crs("EPSG:4326")
     bbox = gdf.total_bounds.tolist()
+    key = ("all", tuple(bbox), start_date, end_date, max_cloud_cover, max_items)
+    cached_scenes = stac_results.get(key) if settings.cache_enabled else None
+    if cached_scenes is not None:
+        logger.info(f"Сцены из кэша STAC-поиска: {len(cached_scenes)}")
+        return list(cached_scenes)
 
-    client = Client.open("https://earth-search.aws.element84.com/v1")
+    client = stac_client()
     search = client.search(
         collections=["sentinel-2-l2a"],
         bbox=bbox,
@@ -88,7 +120,8 @@ def list_available_scenes(
         max_items=max_items,
     )
 
-    items = list(search.items())
+    items = remote_io.call(STAC_URL, lambda: list(search.items()))
+    inc("rlm_http_requests_total", client="stac")
     logger.info(f"Найдено {len(items)} сцен за период {start_date} — {end_date}")
 
     scenes = []
@@ -109,15 +142,18 @@ def list_available_scenes(
 
     # Сортируем по дате: сначала новые
     scenes.sort(key=lambda s: s.date, reverse=True)
+    stac_results.put(key, list(scenes))
     return scenes
 
 
+@timed("search")
+@coalesced("list_scenes", copy=list, key=lambda request: (
+    field_hash(request.kml_path), request.start_date, request.end_date, request.max_cloud_cover))
 def list_scenes(request: SearchRequest) -> List[SceneMetadata]:
     """Поиск сцен Sentinel-2 L2A через STAC API (Earth Search by Element 84).
     Используется pystac-client + коллекция sentinel-2-l2a вместо ручного перебора JSON."""
     import logging
     from datetime import datetime
-    from pystac_client import Client
     import geopandas as gpd
     from shapely.geometry import mapping, box
 
@@ -129,8 +165,13 @@ def list_scenes(request: SearchRequest) -> List[SceneMetadata]:
     if gdf.crs is None:
         gdf = gdf.set_crs("EPSG:4326")
     bbox = gdf.total_bounds.tolist()  # [minx, miny, maxx, maxy]
+    key = ("top", tuple(bbox), request.start_date, request.end_date, request.max_cloud_cover)
+    cached_scenes = stac_results.get(key) if settings.cache_enabled else None
+    if cached_scenes is not None:
+        logger.info(f"Сцены из кэша STAC-поиска: {len(cached_scenes)}")
+        return list(cached_scenes)
 
-    client = Client.open("https://earth-search.aws.element84.com/v1")
+    client = stac_client()
     search = client.search(
         collections=["sentinel-2-l2a"],
         bbox=bbox,
@@ -140,7 +181,8 @@ def list_scenes(request: SearchRequest) -> List[SceneMetadata]:
         # sortby убрано, т.к. вызывает ошибку mapping на сервере
     )
 
-    items = list(search.items())
+    items = remote_io.call(STAC_URL, lambda: list(search.items()))
+    inc("rlm_http_requests_total", client="stac")
     logger.info(f"Найдено {len(items)} сцен по STAC-запросу (cloud ≤ {request.max_cloud_cover}%)")
 
     scenes = []
@@ -159,6 +201,7 @@ def list_scenes(request: SearchRequest) -> List[SceneMetadata]:
         ))
         logger.info(f"Найдена сцена: {scene_id} | cloud={props.get('eo:cloud_cover', 99.0):.1f}%")
 
+    stac_results.put(key, list(scenes))
     return scenes
 
     if not scenes:
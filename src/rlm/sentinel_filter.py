@@ -16,11 +16,14 @@ import geopandas as gpd
 import numpy as np
 import rasterio
 from rasterio.windows import Window
-from rasterio.features import geometry_mask
-from pyproj import Transformer
 from pystac_client import Client
 from .search import read_geometry_file
-from shapely.geometry import Polygon, MultiPolygon, mapping, box
+from .metrics import stage, inc
+from .cache import cached, file_key
+from .coalesce import coalesced, field_hash
+from . import reader, remote_io, scheduler
+from .geometry import field_mask, project_polygon
+from shapely.geometry import Polygon, mapping, box
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +34,7 @@ CLOUD_SCL_CLASSES = {8, 9, 10, 3}  # 8=Cloud medium, 9=Cloud high, 10=Thin cirru
 STAC_API_URL = "https://earth-search.aws.element84.com/v1"
 
 
+@cached("field_polygon", key=lambda kml_path: file_key(kml_path))
 def _load_field_polygon(kml_path: str) -> Polygon:
     """Загружает полигон поля из KML, возвращает в EPSG:4326."""
     gdf = read_geometry_file(kml_path)
@@ -55,22 +59,9 @@ def _load_field_polygon(kml_path: str) -> Polygon:
     return geom
 
 
-def _project_polygon(polygon: Polygon, dst_crs) -> Polygon:
-    """Перепроецирует полигон из EPSG:4326 в dst_crs."""
-    transformer = Transformer.from_crs("EPSG:4326", dst_crs, always_xy=True)
-    if polygon.geom_type == "MultiPolygon":
-        polys = []
-        for p in polygon.geoms:
-            coords = [transformer.transform(x, y) for x, y in p.exterior.coords]
-            polys.append(Polygon(coords))
-        return MultiPolygon(polys)
-    coords = [transformer.transform(x, y) for x, y in polygon.exterior.coords]
-    return Polygon(coords)
-
-
 def _polygon_fully_within_bounds(polygon_4326: Polygon, src_bounds, src_crs) -> bool:
     """Проверяет, что полигон ПОЛНОСТЬЮ попадает в bounds снимка."""
-    polygon_proj = _project_polygon(polygon_4326, src_crs)
+    polygon_proj = project_polygon(polygon_4326, src_crs)
     scene_box = box(*src_bounds)
     return scene_box.contains(polygon_proj)
 
@@ -79,28 +70,33 @@ def _read_field_window(src_url: str, polygon_4326: Polygon, band: int = 1) -> Tu
     """
     Читает bounding box поля из COG и возвращает:
     (data, transform, polygon_in_src_crs).
-    Использует Windowed read — только нужные пиксели.
+    Использует Windowed read — только нужные пиксели; заголовок и дескриптор
+    берутся из общего читателя (reader), повторы и хеджирование — remote_io.call.
     """
-    with rasterio.open(src_url) as src:
-        polygon_proj = _project_polygon(polygon_4326, src.crs)
+    from rasterio.transform import rowcol
+    from rasterio.windows import transform as window_transform
+
+    with stage("read"):
+        hdr = reader.header(src_url)
+        polygon_proj = project_polygon(polygon_4326, hdr.crs)
         minx, miny, maxx, maxy = polygon_proj.bounds
 
         # Пиксельные координаты bbox
-        row1, col1 = src.index(minx, maxy)
-        row2, col2 = src.index(maxx, miny)
+        row1, col1 = rowcol(hdr.transform, minx, maxy)
+        row2, col2 = rowcol(hdr.transform, maxx, miny)
         row_start, row_stop = min(row1, row2), max(row1, row2) + 1
         col_start, col_stop = min(col1, col2), max(col1, col2) + 1
 
         # Ограничиваем размерами снимка
         row_start = max(0, row_start)
         col_start = max(0, col_start)
-        row_stop = min(src.height, row_stop)
-        col_stop = min(src.width, col_stop)
+        row_stop = min(hdr.height, row_stop)
+        col_stop = min(hdr.width, col_stop)
 
         window = Window.from_slices((row_start, row_stop), (col_start, col_stop))
-        data = src.read(band, window=window, boundless=False)
-        transform = src.window_transform(window)
-        return data, transform, polygon_proj
+        data = reader.read(src_url, window, band)
+        inc("rlm_bytes_fetched_total", data.nbytes, source="cog_window")
+        return data, window_transform(window, hdr.transform), polygon_proj
 
 
 def _check_nodata_inside_polygon(src_url: str, polygon_4326: Polygon) -> float:
@@ -112,9 +108,7 @@ def _check_nodata_inside_polygon(src_url: str, polygon_4326: Polygon) -> float:
     if data.size == 0:
         return 1.0
 
-    mask = geometry_mask(
-        [mapping(polygon_proj)], transform=transform, invert=True, out_shape=data.shape
-    )
+    mask = field_mask(polygon_proj, transform, data.shape)
     field_pixels = data[mask]
     if field_pixels.size == 0:
         return 1.0
@@ -132,9 +126,7 @@ def _check_cloud_over_field(scl_url: str, polygon_4326: Polygon) -> float:
     if data.size == 0:
         return 100.0
 
-    mask = geometry_mask(
-        [mapping(polygon_proj)], transform=transform, invert=True, out_shape=data.shape
-    )
+    mask = field_mask(polygon_proj, transform, data.shape)
     field_pixels = data[mask]
     if field_pixels.size == 0:
         return 100.0
@@ -148,6 +140,100 @@ def _check_cloud_over_field(scl_url: str, polygon_4326: Polygon) -> float:
     return cloud_count / valid_count * 100
 
 
+def _verify_item(item, field_polygon: Polygon, max_cloud_percent: float,
+                 index: int, total: int) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Пиксельная проверка одного STAC item: покрытие поля, nodata, облачность по SCL.
+    Возвращает (описание прошедшего снимка, None) или (None, причина отбраковки):
+    missing_assets | not_covered | nodata | cloud | error.
+    """
+    item_id = item.id
+    props = item.properties
+    date_str = props.get("datetime", "")
+    scene_cloud = float(props.get("eo:cloud_cover", 99.0))
+
+    status_prefix = f"  [{index:3d}/{total}] {item_id} | {date_str[:10]} | scene_cloud={scene_cloud:.0f}%"
+
+    assets = item.assets
+    visual_asset = assets.get("visual")
+    visual_href = visual_asset.href if visual_asset else None
+    scl_asset = assets.get("scl")
+    scl_href = scl_asset.href if scl_asset else None
+    b04_asset = assets.get("B04") or assets.get("red")
+    b04_href = b04_asset.href if b04_asset else None
+
+    if not visual_href or not scl_href:
+        logger.info(f"{status_prefix} → ОТБРАКОВАНО: отсутствуют visual или scl ассеты")
+        return None, "missing_assets"
+
+    try:
+        # A. Проверка полного покрытия
+        with stage("read"):
+            vis = reader.header(visual_href)
+            vis_bounds, vis_crs = vis.bounds, vis.crs
+
+        if not _polygon_fully_within_bounds(field_polygon, vis_bounds, vis_crs):
+            logger.info(f"{status_prefix} → ОТБРАКОВАНО: поле не полностью в bounds снимка")
+            return None, "not_covered"
+
+        # B. Проверка nodata внутри поля
+        nodata_band_url = b04_href if b04_href else visual_href
+        nodata_pct = _check_nodata_inside_polygon(nodata_band_url, field_polygon)
+        if nodata_pct > 0:
+            logger.info(f"{status_prefix} → ОТБРАКОВАНО: nodata={nodata_pct:.1%} внутри поля")
+            return None, "nodata"
+
+        # C. Проверка облачности над полем по SCL
+        cloud_pct = _check_cloud_over_field(scl_href, field_polygon)
+        if cloud_pct > max_cloud_percent:
+            logger.info(f"{status_prefix} → ОТБРАКОВАНО: облачность над полем={cloud_pct:.1f}%")
+            return None, "cloud"
+
+        logger.info(
+            f"{status_prefix} → ПРОШЁЛ ✓ | cloud_field={cloud_pct:.1f}% | nodata={nodata_pct:.1%}"
+        )
+
+        # Собираем ассеты
+        result_assets = {}
+        for key in ["visual", "red", "green", "blue", "nir", "scl", "B04", "B03", "B02", "B08", "thumbnail"]:
+            asset = assets.get(key)
+            if asset:
+                result_assets[key] = asset.href
+        if "red" not in result_assets and "B04" in result_assets:
+            result_assets["red"] = result_assets["B04"]
+        if "green" not in result_assets and "B03" in result_assets:
+            result_assets["green"] = result_assets["B03"]
+        if "blue" not in result_assets and "B02" in result_assets:
+            result_assets["blue"] = result_assets["B02"]
+        if "nir" not in result_assets and "B08" in result_assets:
+            result_assets["nir"] = result_assets["B08"]
+        if "visual" not in result_assets and "TCI" in assets:
+            result_assets["visual"] = assets["TCI"].href
+        if "visual" not in result_assets:
+            result_assets["visual"] = visual_href
+
+        return {
+            "item_id": item_id,
+            "datetime": date_str,
+            "cloud_cover_scene": scene_cloud,
+            "cloud_cover_field": round(cloud_pct, 1),
+            "nodata_percent": round(nodata_pct * 100, 1),
+            "assets": result_assets,
+            "bbox": list(item.bbox) if getattr(item, "bbox", None) else None,
+        }, None
+
+    except remote_io.RemoteIOError:
+        # Троттлинг или недоступность после всех повторов — не «нет данных», а ошибка прогона
+        logger.error(f"{status_prefix} → источник недоступен, проверка прервана")
+        raise
+    except Exception as e:
+        logger.warning(f"{status_prefix} → ОШИБКА при проверке: {type(e).__name__}: {e}")
+        return None, "error"
+
+
+@coalesced("filter_pipeline", copy=list, key=lambda kml_path, date_range, max_cloud_percent,
+           max_scene_cloud_prefilter, max_check_items: (field_hash(kml_path), date_range, max_cloud_percent,
+                                                        max_scene_cloud_prefilter, max_check_items))
 def filter_pipeline(
     kml_path: str,
     date_range: str = "2022-01-01/2025-12-31",
@@ -195,16 +281,17 @@ def filter_pipeline(
         f"центр ~({field_polygon.centroid.x:.4f}, {field_polygon.centroid.y:.4f})"
     )
 
-    client = Client.open(STAC_API_URL)
-    search = client.search(
-        collections=["sentinel-2-l2a"],
-        intersects=mapping(field_polygon),
-        datetime=date_range,
-        query={"eo:cloud_cover": {"lte": max_scene_cloud_prefilter}},
-        max_items=None,
-    )
-
-    items = list(search.items())
+    with stage("search"):
+        client = Client.open(STAC_API_URL)
+        search = client.search(
+            collections=["sentinel-2-l2a"],
+            intersects=mapping(field_polygon),
+            datetime=date_range,
+            query={"eo:cloud_cover": {"lte": max_scene_cloud_prefilter}},
+            max_items=None,
+        )
+        items = remote_io.call(STAC_API_URL, lambda: list(search.items()))
+    inc("rlm_http_requests_total", client="stac")
     logger.info(
         f"  Найдено снимков (общая облачность ≤ {max_scene_cloud_prefilter}%): {len(items)}"
     )
@@ -236,85 +323,16 @@ def filter_pipeline(
         best = min(day_items, key=lambda x: float(x.properties.get("eo:cloud_cover", 99.0)))
         checked_total += 1
         item = best
+        if len(day_items) > 1:
+            inc("rlm_scenes_rejected_total", len(day_items) - 1, reason="same_day")
 
-        item_id = item.id
-        item_id = item.id
-        props = item.properties
-        date_str = props.get("datetime", "")
-        scene_cloud = float(props.get("eo:cloud_cover", 99.0))
-
-        status_prefix = f"  [{checked_total:3d}/{total_days}] {item_id} | {date_str[:10]} | scene_cloud={scene_cloud:.0f}%"
-
-        assets = item.assets
-        visual_asset = assets.get("visual")
-        visual_href = visual_asset.href if visual_asset else None
-        scl_asset = assets.get("scl")
-        scl_href = scl_asset.href if scl_asset else None
-        b04_asset = assets.get("B04") or assets.get("red")
-        b04_href = b04_asset.href if b04_asset else None
-
-        if not visual_href or not scl_href:
-            logger.info(f"{status_prefix} → ОТБРАКОВАНО: отсутствуют visual или scl ассеты")
-            continue
-
-        try:
-            # A. Проверка полного покрытия
-            with rasterio.open(visual_href) as vis_src:
-                vis_bounds = vis_src.bounds
-                vis_crs = vis_src.crs
-
-            if not _polygon_fully_within_bounds(field_polygon, vis_bounds, vis_crs):
-                logger.info(f"{status_prefix} → ОТБРАКОВАНО: поле не полностью в bounds снимка")
-                continue
-
-            # B. Проверка nodata внутри поля
-            nodata_band_url = b04_href if b04_href else visual_href
-            nodata_pct = _check_nodata_inside_polygon(nodata_band_url, field_polygon)
-            if nodata_pct > 0:
-                logger.info(f"{status_prefix} → ОТБРАКОВАНО: nodata={nodata_pct:.1%} внутри поля")
-                continue
-
-            # C. Проверка облачности над полем по SCL
-            cloud_pct = _check_cloud_over_field(scl_href, field_polygon)
-            if cloud_pct > max_cloud_percent:
-                logger.info(f"{status_prefix} → ОТБРАКОВАНО: облачность над полем={cloud_pct:.1f}%")
-                continue
-
-            logger.info(
-                f"{status_prefix} → ПРОШЁЛ ✓ | cloud_field={cloud_pct:.1f}% | nodata={nodata_pct:.1%}"
-            )
-
-            # Собираем ассеты
-            result_assets = {}
-            for key in ["visual", "red", "green", "blue", "nir", "scl", "B04", "B03", "B02", "B08"]:
-                asset = assets.get(key)
-                if asset:
-                    result_assets[key] = asset.href
-            if "red" not in result_assets and "B04" in result_assets:
-                result_assets["red"] = result_assets["B04"]
-            if "green" not in result_assets and "B03" in result_assets:
-                result_assets["green"] = result_assets["B03"]
-            if "blue" not in result_assets and "B02" in result_assets:
-                result_assets["blue"] = result_assets["B02"]
-            if "nir" not in result_assets and "B08" in result_assets:
-                result_assets["nir"] = result_assets["B08"]
-            if "visual" not in result_assets and "TCI" in assets:
-                result_assets["visual"] = assets["TCI"].href
-            if "visual" not in result_assets:
-                result_assets["visual"] = visual_href
-
-            passed.append({
-                "item_id": item_id,
-                "datetime": date_str,
-                "cloud_cover_scene": scene_cloud,
-                "cloud_cover_field": round(cloud_pct, 1),
-                "nodata_percent": round(nodata_pct * 100, 1),
-                "assets": result_assets,
-            })
-
-        except Exception as e:
-            logger.warning(f"{status_prefix} → ОШИБКА при проверке: {type(e).__name__}: {e}")
+        with scheduler.network.slot(), stage("verify"):
+            result, reason = _verify_item(item, field_polygon, max_cloud_percent, checked_total, total_days)
+        if result is None:
+            inc("rlm_scenes_rejected_total", reason=reason)
             continue
+        inc("rlm_scenes_passed_total")
+        passed.append(result)
 
     logger.info("=" * 60)
     logger.info(f"Фильтрация завершена. Проверено: {checked_total}, прошло: {len(passed)}")
@@ -1,15 +1,69 @@
-from mcp.server.fastmcp import FastMCP
-from .search import list_scenes, create_buffer
-from .processor import process_scene
-from .llm import call_llm
+import functools
+import logging
+import sys
+from typing import Optional
+
+import anyio
+from mcp.server.fastmcp import Context, FastMCP
 from .models import SearchRequest
+from .config import settings
+
+logger = logging.getLogger(__name__)
 
 mcp = FastMCP("rlm")
+_limiter = None
 
 
-@mcp.tool()
+def tool(fn):
+    """
+    Регистрирует синхронный инструмент: вызов идёт в пуле потоков не больше чем на
+    settings.mcp_max_concurrent_requests одновременно, а не в цикле событий —
+    медленный запрос одного клиента не блокирует остальных. Возвращает саму функцию.
+    """
+    @functools.wraps(fn)
+    async def run(*args, **kwargs):
+        global _limiter
+        if _limiter is None:
+            _limiter = anyio.CapacityLimiter(settings.mcp_max_concurrent_requests)
+        return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=_limiter)
+
+    mcp.tool()(run)
+    return fn
+
+_runner = None
+
+
+def runner():
+    """Общая очередь фоновых заданий сервера (пул процессов стартует при первом задании)."""
+    global _runner
+    if _runner is None:
+        from .jobs import JobRunner
+        _runner = JobRunner()
+    return _runner
+
+
+def _analysis_key(kml_path: str, use_llm: bool) -> tuple:
+    """Ключ схлопывания анализа: то же поле (по геометрии) с теми же настройками — одно задание."""
+    from .coalesce import field_hash
+    return "analysis", field_hash(kml_path), use_llm, settings.buffer_meters, settings.max_cloud_cover
+
+
+def _client(ctx: Optional[Context]) -> str:
+    """Клиент для честной очереди планировщика: IP по HTTP (см. ratelimit.client_id), stdio — один клиент."""
+    from .ratelimit import client_id
+
+    try:
+        request = ctx.request_context.request
+    except (AttributeError, ValueError):  # вызов вне MCP-запроса
+        request = None
+    return client_id(request.scope) if request is not None else "stdio"
+
+
+@tool
 def list_available_scenes(kml_path: str, start_date: str = "2024-04-01", end_date: str = "2024-09-30", max_cloud_cover: int = 30):
     """Поиск доступных малооблачных сцен Sentinel-2 для поля"""
+    from .search import list_scenes
+
     request = SearchRequest(
         kml_path=kml_path,
         start_date=start_date,
@@ -24,25 +78,135 @@ def list_available_scenes(kml_path: str, start_date: str = "2024-04-01", end_dat
 
 
 @mcp.tool()
-def analyze_field(kml_path: str, use_llm: bool = True):
-    """Полный анализ поля с буфером 500м и LLM"""
-    result = process_scene(kml_path=kml_path)
-    
-    if use_llm and result.report:
-        llm_analysis = call_llm(
-            prompt=f"Проанализируй агрономический отчёт и дай рекомендации:\n\n{result.report}",
-            system_prompt="Ты — опытный агроном. Давай точные практические рекомендации по состоянию поля.",
-            temperature=0.3
-        )
-        result.llm_analysis = llm_analysis
-        result.report += f"\n\n=== Анализ от Qwen3 (OpenRouter) ===\n{llm_analysis}"
-    
-    return result.model_dump()
+async def analyze_field(kml_path: str, use_llm: bool = True, ctx: Context = None):
+    """Полный анализ поля с буфером 500м и LLM (ждёт результата; для долгих — start_analysis)"""
+    from . import jobs
+
+    key = await anyio.to_thread.run_sync(_analysis_key, kml_path, use_llm)
+    job = runner().submit(jobs.analyze_field, kind="analysis", key=key, priority="interactive",
+                          client=_client(ctx), kml_path=kml_path, use_llm=use_llm)
+    return await runner().wait(job.job_id)
+
+
+@tool
+def start_analysis(kml_path: str, use_llm: bool = True, priority: str = "interactive", ctx: Context = None):
+    """Запускает анализ поля в фоне и сразу возвращает job_id для get_job_status/get_job_result.
+    priority: interactive (по умолчанию), monitoring или backfill — массовые прогоны не задерживают интерактивные"""
+    from . import jobs
+
+    try:
+        job = runner().submit(jobs.analyze_field, kind="analysis", key=_analysis_key(kml_path, use_llm),
+                              priority=priority, client=_client(ctx), kml_path=kml_path, use_llm=use_llm)
+    except (RuntimeError, ValueError) as e:
+        return {"error": str(e)}
+    return runner().status(job.job_id)
+
+
+@tool
+def get_job_status(job_id: str):
+    """Статус фонового задания: queued/running/done/failed/cancelled, прогресс 0..1 и этап"""
+    try:
+        return runner().status(job_id)
+    except KeyError as e:
+        return {"error": str(e)}
+
+
+@tool
+def get_job_result(job_id: str):
+    """Результат фонового задания (или ошибка); пока не завершено — только статус"""
+    try:
+        return runner().result(job_id)
+    except KeyError as e:
+        return {"error": str(e)}
+
+
+@tool
+def cancel_job(job_id: str):
+    """Отменяет задание, которое ещё ждёт в очереди"""
+    try:
+        return {"job_id": job_id, "cancelled": runner().cancel(job_id)}
+    except KeyError as e:
+        return {"error": str(e)}
+
+
+@tool
+def list_jobs():
+    """Все фоновые задания сервера со статусами"""
+    return {"jobs": runner().jobs()}
+
+
+def http_app():
+    """
+    Starlette-приложение streamable HTTP (MCP на /mcp) с лимитом частоты по клиентам.
+    Один экземпляр на процесс: менеджер сессий FastMCP запускается однократно.
+    """
+    from .ratelimit import RateLimitMiddleware
+
+    mcp.settings.max_sessions = settings.mcp_http_max_sessions
+    app = mcp.streamable_http_app()
+    app.add_middleware(RateLimitMiddleware)
+    return app
+
+
+def run_http(host: str = None, port: int = None):
+    """
+    Streamable HTTP: один тёплый процесс (кэши, пул заданий) на несколько агентов
+    и веб-интерфейс. По SIGINT/SIGTERM новые запросы не принимаются, текущие
+    дорабатывают до settings.mcp_http_shutdown_timeout_s, задания из очереди
+    снимаются, начатые — завершаются.
+    """
+    import uvicorn
+    from mcp.server.transport_security import TransportSecuritySettings
+
+    host = host or settings.mcp_http_host
+    port = port or settings.mcp_http_port
+    if host not in ("127.0.0.1", "localhost", "::1"):
+        # FastMCP по умолчанию пускает только Host: localhost — для сети разрешаем адрес сервера
+        mcp.settings.transport_security = TransportSecuritySettings(
+            enable_dns_rebinding_protection=False)
+        logger.warning(f"MCP HTTP слушает {host}: защита от DNS rebinding выключена, "
+                       "ограничьте доступ к порту сетью или прокси")
+    config = uvicorn.Config(http_app(), host=host, port=port, log_level="info",
+                            timeout_graceful_shutdown=settings.mcp_http_shutdown_timeout_s)
+    print(f"RLM MCP Server: streamable HTTP на http://{host}:{port}{mcp.settings.streamable_http_path}")
+    try:
+        uvicorn.Server(config).run()
+    except KeyboardInterrupt:
+        pass  # uvicorn уже корректно остановился и пробрасывает сигнал дальше
+    finally:
+        if _runner is not None:
+            _runner.shutdown(wait=True, cancel_pending=True)
+
+
+def _serve(args):
+    if args.transport == "stdio":
+        mcp.run(transport="stdio")
+    else:
+        run_http(args.host, args.port)
+
 
 def main():
-    """Запуск MCP сервера RLM"""
+    """Запуск MCP сервера RLM: stdio (по умолчанию) или streamable HTTP (--http)"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="rlm-mcp")
+    parser.add_argument("--transport", choices=["stdio", "http"], default=settings.mcp_transport)
+    parser.add_argument("--http", dest="transport", action="store_const", const="http",
+                        help="то же, что --transport http")
+    parser.add_argument("--host", default=None, help="адрес HTTP (по умолчанию RLM_MCP_HTTP_HOST)")
+    parser.add_argument("--port", type=int, default=None, help="порт HTTP (по умолчанию RLM_MCP_HTTP_PORT)")
+    parser.add_argument("--profile", action="store_true")
+    args = parser.parse_args(sys.argv[1:])
+
     print("🚀 Запуск RLM MCP Server (Qwen3 via OpenRouter)...")
-    mcp.run(transport="stdio")
+    if args.profile or settings.profile:
+        from .profiling import profiling
+        with profiling("mcp-server"):
+            _serve(args)
+    else:
+        _serve(args)
+    if _runner is not None:
+        _runner.shutdown(wait=False)
 
 if __name__ == "__main__":
     main()
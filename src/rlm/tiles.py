@@ -0,0 +1,403 @@
+"""
+Пирамида тайлов XYZ (Web Mercator, EPSG:3857) для веб-интерфейса.
+
+Источники — результаты обработки полей:
+  * NDVI в COG (`<scene_id>_ndvi.tif`, см. cog.py) → слой `ndvi` (палитра RdYlGn, -1..1);
+  * окна из хранилища (`cache/windows/<поле>/<scene_id>.tif`, бэнды TCI_R/G/B) → слой `rgb`.
+
+Раскладка:
+
+    output/tiles/<слой>/<дата>/<z>/<x>/<y>.png|webp
+    output/tiles/<слой>/<дата>/tilejson.json
+    output/tiles/<слой>/manifest.json
+
+Все поля одной даты сводятся в одну пирамиду (ферма целиком). Тайлы всех зумов
+рендерятся параллельно прямо из источников. Манифест помнит для каждого тайла
+отпечаток источников, которые в него попадают: повторный запуск перерисовывает
+только тайлы, затронутые новыми датами/полями или изменёнными файлами, и удаляет
+тайлы источников, которых больше нет на диске.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+from .locks import file_lock
+from .metrics import inc, stage
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+WEB_MERCATOR = "EPSG:3857"
+ORIGIN = 20037508.342789244  # половина длины экватора в метрах Web Mercator
+MAX_ZOOM = 18
+LAYERS = ("ndvi", "rgb")
+FORMATS = ("png", "webp")
+
+# Версия отрисовки: при смене палитры/ресэмплинга все тайлы считаются устаревшими
+_RENDER_VERSION = 1
+_DATE_RE = re.compile(r"(20\d{2})(\d{2})(\d{2})")
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Границы тайла XYZ в метрах EPSG:3857: (minx, miny, maxx, maxy)."""
+    size = 2 * ORIGIN / (1 << z)
+    minx = -ORIGIN + x * size
+    maxy = ORIGIN - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tiles_for_bounds(bounds: Tuple[float, float, float, float], z: int) -> Iterable[Tuple[int, int]]:
+    """Тайлы зума z, пересекающие прямоугольник в EPSG:3857."""
+    n = 1 << z
+    size = 2 * ORIGIN / n
+    minx, miny, maxx, maxy = bounds
+    x1 = max(0, int((minx + ORIGIN) // size))
+    x2 = min(n - 1, int((maxx + ORIGIN) // size))
+    y1 = max(0, int((ORIGIN - maxy) // size))
+    y2 = min(n - 1, int((ORIGIN - miny) // size))
+    for x in range(x1, x2 + 1):
+        for y in range(y1, y2 + 1):
+            yield x, y
+
+
+def native_zoom(resolution_m: float, lat: float) -> int:
+    """Минимальный зум, на котором пиксель тайла не крупнее пикселя источника."""
+    ground = 2 * ORIGIN / TILE_SIZE * math.cos(math.radians(lat))
+    return max(0, min(MAX_ZOOM, math.ceil(math.log2(ground / resolution_m))))
+
+
+def _scene_date(path: Path, tags: Dict[str, str]) -> str:
+    for text in (tags.get("scene_id", ""), path.stem):
+        m = _DATE_RE.search(text)
+        if m:
+            return "-".join(m.groups())
+    return "undated"
+
+
+@dataclass
+class TileSource:
+    """Растр-источник, загруженный в память (окна полей маленькие)."""
+    path: Path
+    layer: str
+    date: str
+    fingerprint: str
+    data: np.ndarray  # ndvi: (H, W) float32 с NaN; rgb: (3, H, W) uint8, 0 — нет данных
+    transform: object
+    crs: object
+    bounds: Tuple[float, float, float, float]  # EPSG:3857
+    zoom: int  # родной зум источника
+
+    def entry(self) -> Dict:
+        return {"layer": self.layer, "date": self.date, "fingerprint": self.fingerprint,
+                "bounds": list(self.bounds), "zoom": self.zoom}
+
+
+def detect_layer(path) -> Optional[str]:
+    """ndvi — одноканальный индекс (COG из cog.py), rgb — окно с бэндами TCI_R/G/B, иначе None."""
+    import rasterio
+    with rasterio.open(path) as src:
+        if "TCI_R" in (src.descriptions or ()):
+            return "rgb"
+        if src.count == 1 and (src.tags().get("index") == "NDVI" or src.dtypes[0].startswith("float")):
+            return "ndvi"
+    return None
+
+
+def load_source(path, layer: Optional[str] = None) -> TileSource:
+    import rasterio
+    from rasterio.warp import transform_bounds
+    from .cog import INDEX_NODATA, INDEX_SCALE
+
+    path = Path(path)
+    layer = layer or detect_layer(path)
+    if layer is None:
+        raise ValueError(f"{path}: не NDVI и не окно с TCI — слой тайлов не определить")
+    if layer not in LAYERS:
+        raise ValueError(f"Неизвестный слой тайлов: {layer} (доступны: {', '.join(LAYERS)})")
+    stat = path.stat()
+    with stage("read"), rasterio.open(path) as src:
+        tags = src.tags()
+        if layer == "ndvi":
+            raw = src.read(1)
+            if raw.dtype == np.int16:
+                data = raw.astype(np.float32) * (src.scales[0] or 1.0 / INDEX_SCALE)
+                data[raw == INDEX_NODATA] = np.nan
+            else:
+                data = raw.astype(np.float32)
+                if src.nodata is not None:
+                    data[raw == src.nodata] = np.nan
+        else:
+            names = list(src.descriptions)
+            data = np.stack([src.read(names.index(b) + 1) for b in ("TCI_R", "TCI_G", "TCI_B")]).astype(np.uint8)
+        transform, crs = src.transform, src.crs
+        bounds = transform_bounds(crs, WEB_MERCATOR, *src.bounds)
+        lon_lat = transform_bounds(crs, "EPSG:4326", *src.bounds)
+        resolution = abs(transform.a)
+    fingerprint = hashlib.sha1(f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+    return TileSource(
+        path=path, layer=layer, date=_scene_date(path, tags), fingerprint=fingerprint,
+        data=data, transform=transform, crs=crs, bounds=tuple(bounds),
+        zoom=native_zoom(resolution, (lon_lat[1] + lon_lat[3]) / 2),
+    )
+
+
+def _intersects(a, b) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+_NDVI_LUT = None
+
+
+def _ndvi_lut() -> np.ndarray:
+    global _NDVI_LUT
+    if _NDVI_LUT is None:
+        from matplotlib import colormaps
+        _NDVI_LUT = (colormaps["RdYlGn"](np.linspace(0, 1, 256)) * 255).astype(np.uint8)
+    return _NDVI_LUT
+
+
+def render_tile(sources: List[TileSource], z: int, x: int, y: int) -> Optional[np.ndarray]:
+    """RGBA (256, 256, 4) uint8 или None, если в тайле нет данных."""
+    from rasterio.transform import from_bounds
+    from rasterio.warp import Resampling, reproject
+
+    dst_transform = from_bounds(*tile_bounds(z, x, y), TILE_SIZE, TILE_SIZE)
+    layer = sources[0].layer
+    bands = 1 if layer == "ndvi" else 3
+    mosaic = np.full((bands, TILE_SIZE, TILE_SIZE), np.nan, dtype=np.float32)
+    for src in sources:
+        # Ниже родного зума усредняем, выше — интерполируем NDVI и увеличиваем RGB без сглаживания
+        if z < src.zoom:
+            resampling = Resampling.average
+        else:
+            resampling = Resampling.bilinear if layer == "ndvi" else Resampling.nearest
+        data = src.data[None] if src.data.ndim == 2 else src.data
+        warped = np.full_like(mosaic, np.nan)
+        reproject(
+            data.astype(np.float32), warped,
+            src_transform=src.transform, src_crs=src.crs, src_nodata=np.nan if layer == "ndvi" else 0,
+            dst_transform=dst_transform, dst_crs=WEB_MERCATOR, dst_nodata=np.nan,
+            resampling=resampling,
+        )
+        empty = np.isnan(mosaic[0])
+        mosaic[:, empty] = warped[:, empty]
+
+    valid = ~np.isnan(mosaic[0])
+    if not valid.any():
+        return None
+    rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    if layer == "ndvi":
+        idx = np.clip(np.round((np.nan_to_num(mosaic[0]) + 1) / 2 * 255), 0, 255).astype(np.uint8)
+        rgba[..., :3] = _ndvi_lut()[idx, :3]
+    else:
+        rgba[..., :3] = np.moveaxis(np.clip(np.nan_to_num(mosaic), 0, 255), 0, -1).astype(np.uint8)
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return rgba
+
+
+def _save_tile(rgba: np.ndarray, path: Path, fmt: str) -> int:
+    from PIL import Image
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    image = Image.fromarray(rgba, "RGBA")
+    try:
+        if fmt == "webp":
+            image.save(tmp, format="WEBP", quality=settings.tile_webp_quality)
+        else:
+            image.save(tmp, format="PNG")
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return path.stat().st_size
+
+
+class TilePyramid:
+    """Пирамида одного слоя с инкрементальным манифестом."""
+
+    def __init__(self, root=None, layer: str = "ndvi", fmt: Optional[str] = None):
+        self.layer = layer
+        self.fmt = (fmt or settings.tile_format).lower()
+        if self.fmt not in FORMATS:
+            raise ValueError(f"Формат тайлов {self.fmt} не поддерживается (доступны: {', '.join(FORMATS)})")
+        self.root = Path(root or settings.tiles_dir) / layer
+        self.manifest_path = self.root / "manifest.json"
+
+    def tile_path(self, date: str, z: int, x: int, y: int) -> Path:
+        return self.root / date / str(z) / str(x) / f"{y}.{self.fmt}"
+
+    def _read_manifest(self) -> Dict:
+        if self.manifest_path.exists():
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+            if manifest.get("format") == self.fmt:
+                return manifest
+            # Источники остаются, тайлы старого формата удаляются и рисуются заново
+            logger.info(f"Формат тайлов сменился на {self.fmt} — пирамида {self.layer} строится заново")
+            for key in manifest["tiles"]:
+                date, z, x, y = self._parse_key(key)
+                (self.root / date / str(z) / str(x) / f"{y}.{manifest['format']}").unlink(missing_ok=True)
+            return {"format": self.fmt, "sources": manifest["sources"], "tiles": {}}
+        return {"format": self.fmt, "sources": {}, "tiles": {}}
+
+    def _write_manifest(self, manifest: Dict):
+        tmp = self.manifest_path.with_name(f".{self.manifest_path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(manifest, indent=1, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+    def build(self, sources: List[TileSource], min_zoom: Optional[int] = None, max_zoom: Optional[int] = None,
+              workers: Optional[int] = None) -> Dict:
+        """
+        Добавляет источники в манифест и досчитывает пирамиду.
+        Возвращает статистику: rendered / skipped / removed / empty.
+        """
+        min_zoom = settings.tile_min_zoom if min_zoom is None else min_zoom
+        max_zoom = max_zoom or settings.tile_max_zoom or None
+        workers = workers or settings.tile_workers or os.cpu_count() or 4
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        with file_lock(self.manifest_path):
+            manifest = self._read_manifest()
+            loaded = {str(s.path.resolve()): s for s in sources}
+            for key, src in loaded.items():
+                manifest["sources"][key] = src.entry()
+            # Источники, удалённые с диска, уходят из пирамиды вместе со своими тайлами
+            for key in [k for k in manifest["sources"] if not Path(k).exists()]:
+                del manifest["sources"][key]
+
+            wanted = self._plan(manifest["sources"], min_zoom, max_zoom)
+            todo = {k: h for k, h in wanted.items()
+                    if manifest["tiles"].get(k) != h or not self._path_for_key(k).exists()}
+            stale = [k for k in manifest["tiles"] if k not in wanted]
+
+            # Для перерисовки нужны данные всех источников затронутых дат, а не только новых
+            need = {src_key for src_key, e in manifest["sources"].items()
+                    if any(k.startswith(e["date"] + "/") for k in todo)}
+            for key in need - loaded.keys():
+                loaded[key] = load_source(key, self.layer)
+            by_date: Dict[str, List[TileSource]] = {}
+            for key in sorted(need):
+                by_date.setdefault(loaded[key].date, []).append(loaded[key])
+
+            logger.info(f"Тайлы {self.layer}: {len(wanted)} в пирамиде, перерисовать {len(todo)}, "
+                        f"удалить {len(stale)} (z{min_zoom}-{max_zoom or 'auto'}, {workers} потоков)")
+            stats = {"rendered": 0, "skipped": len(wanted) - len(todo), "removed": 0, "empty": 0, "bytes": 0}
+
+            def work(key: str):
+                date, z, x, y = self._parse_key(key)
+                bounds = tile_bounds(z, x, y)
+                srcs = [s for s in by_date.get(date, []) if _intersects(s.bounds, bounds)]
+                with stage("render"):
+                    rgba = render_tile(srcs, z, x, y) if srcs else None
+                    if rgba is None:
+                        self.tile_path(date, z, x, y).unlink(missing_ok=True)
+                        return key, 0, False
+                    return key, _save_tile(rgba, self.tile_path(date, z, x, y), self.fmt), True
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for key, size, drawn in pool.map(work, sorted(todo)):
+                    manifest["tiles"][key] = todo[key]
+                    if drawn:
+                        stats["rendered"] += 1
+                        stats["bytes"] += size
+                    else:
+                        stats["empty"] += 1
+            inc("rlm_tiles_rendered_total", stats["rendered"], layer=self.layer)
+
+            for key in stale:
+                self._path_for_key(key).unlink(missing_ok=True)
+                del manifest["tiles"][key]
+            stats["removed"] = len(stale)
+
+            self._write_manifest(manifest)
+            for date in {e["date"] for e in manifest["sources"].values()}:
+                self._write_tilejson(date, manifest)
+        logger.info(f"Тайлы {self.layer}: нарисовано {stats['rendered']}, без изменений {stats['skipped']}, "
+                    f"удалено {stats['removed']}, {stats['bytes'] / 1024:.0f} КБ")
+        return stats
+
+    def _plan(self, entries: Dict[str, Dict], min_zoom: int, max_zoom: Optional[int]) -> Dict[str, str]:
+        """Ключ тайла `<дата>/<z>/<x>/<y>` → хэш отпечатков источников, которые в него попадают."""
+        contributors: Dict[str, List[str]] = {}
+        for entry in entries.values():
+            top = max_zoom if max_zoom is not None else entry["zoom"]
+            for z in range(min_zoom, top + 1):
+                for x, y in tiles_for_bounds(entry["bounds"], z):
+                    contributors.setdefault(f"{entry['date']}/{z}/{x}/{y}", []).append(entry["fingerprint"])
+        return {
+            key: hashlib.sha1(f"{_RENDER_VERSION}:{','.join(sorted(fps))}".encode()).hexdigest()[:16]
+            for key, fps in contributors.items()
+        }
+
+    @staticmethod
+    def _parse_key(key: str) -> Tuple[str, int, int, int]:
+        date, z, x, y = key.rsplit("/", 3)
+        return date, int(z), int(x), int(y)
+
+    def _path_for_key(self, key: str) -> Path:
+        return self.tile_path(*self._parse_key(key))
+
+    def _write_tilejson(self, date: str, manifest: Dict):
+        from rasterio.warp import transform_bounds
+
+        entries = [e for e in manifest["sources"].values() if e["date"] == date]
+        zooms = [int(k.rsplit("/", 3)[1]) for k in manifest["tiles"] if k.startswith(date + "/")]
+        if not entries or not zooms:
+            return
+        merc = [min(e["bounds"][0] for e in entries), min(e["bounds"][1] for e in entries),
+                max(e["bounds"][2] for e in entries), max(e["bounds"][3] for e in entries)]
+        tilejson = {
+            "tilejson": "3.0.0",
+            "name": f"{self.layer} {date}",
+            "tiles": [f"{{z}}/{{x}}/{{y}}.{self.fmt}"],
+            "scheme": "xyz",
+            "minzoom": min(zooms),
+            "maxzoom": max(zooms),
+            "bounds": [round(v, 6) for v in transform_bounds(WEB_MERCATOR, "EPSG:4326", *merc)],
+        }
+        path = self.root / date / "tilejson.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(tilejson, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def _expand(paths: Iterable) -> List[Path]:
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(sorted(f for f in p.rglob("*.tif") if not f.name.startswith(".")))
+        elif p.exists():
+            files.append(p)
+        else:
+            logger.warning(f"Источник тайлов не найден: {p}")
+    return files
+
+
+def build_tiles(paths: Iterable, layer: Optional[str] = None, out_dir=None, min_zoom: Optional[int] = None,
+                max_zoom: Optional[int] = None, fmt: Optional[str] = None,
+                workers: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    Строит/обновляет пирамиды по файлам и папкам (`*.tif` рекурсивно).
+    layer=None — слой определяется по каждому файлу (NDVI COG или окно с TCI).
+    Возвращает статистику по слоям.
+    """
+    grouped: Dict[str, List[TileSource]] = {}
+    for path in _expand(paths):
+        if layer is None and detect_layer(path) is None:
+            logger.info(f"Пропускаем {path}: нет слоя для тайлов")
+            continue
+        src = load_source(path, layer)
+        grouped.setdefault(src.layer, []).append(src)
+    return {
+        name: TilePyramid(out_dir, name, fmt).build(sources, min_zoom, max_zoom, workers)
+        for name, sources in grouped.items()
+    }
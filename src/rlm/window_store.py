@@ -0,0 +1,273 @@
+"""
+Хранилище полевых окон: вместо полных тайлов (100+ МБ) в `cache/` храним только
+окно вокруг поля — B02/B03/B04/B08/SCL + TCI — одним сжатым тайловым GeoTIFF
+на пару (поле, сцена):
+
+    cache/windows/<ключ поля>/<scene_id>.tif
+
+Читаются только запрошенные бэнды; недостающие дочитываются на ту же сетку
+и дописываются в файл окна (расчёт NDVI берёт B04/B08, рендер — ещё и TCI).
+
+Окно совпадает с кропом, который рисует process_scene_indices (bbox поля + отступ
+max(500 px, 5% тайла)), в файле есть transform и CRS. Повторный расчёт индексов
+или перерисовка того же поля не обращаются ни к сети, ни к полным тайлам.
+
+Бэнды читаются оконно прямо из COG (HTTP Range через GDAL). SCL (20 м)
+пересэмплируется на 10-метровую сетку B04 методом nearest.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from . import reader, scheduler
+from .config import settings
+from .locks import file_lock
+from .metrics import inc, stage
+
+logger = logging.getLogger(__name__)
+
+BANDS = ("B02", "B03", "B04", "B08", "SCL", "TCI")
+
+# Ключи ассетов STAC (Earth Search v1 и старые имена) для каждого бэнда
+_ASSET_KEYS = {
+    "B02": ("B02", "blue"),
+    "B03": ("B03", "green"),
+    "B04": ("B04", "red"),
+    "B08": ("B08", "nir"),
+    "SCL": ("SCL", "scl"),
+    "TCI": ("visual", "TCI"),
+}
+_TCI_BANDS = ("TCI_R", "TCI_G", "TCI_B")
+
+
+def window_margin(width: int, height: int) -> int:
+    """Отступ вокруг поля в пикселях: минимум 500 px или 5% от размера тайла."""
+    return max(500, int(min(width, height) * 0.05))
+
+
+def field_key(gdf) -> str:
+    """Короткий ключ геометрии буфера поля (WGS84) — имя папки окон этого поля."""
+    import shapely
+
+    # shapely.union_all, а не GeoSeries.union_all: тот работает только с geopandas >= 1.0
+    geom = shapely.union_all(gdf.to_crs("EPSG:4326").geometry.values)
+    return hashlib.sha1(geom.wkb).hexdigest()[:16]
+
+
+def _cog_base_url(scene_id: str) -> str:
+    tile = scene_id.split('_')[1] if '_' in scene_id else "36UYC"
+    year = scene_id[10:14] if len(scene_id) > 14 else "2024"
+    month = int(scene_id[14:16]) if len(scene_id) > 16 else 4
+    return f"https://sentinel-cogs.s3.us-west-2.amazonaws.com/sentinel-s2-l2a-cogs/{tile[:2]}/{tile[2]}/{tile[3:]}/{year}/{month}/{scene_id}"
+
+
+def scene_hrefs(scene, scene_id: str) -> Dict[str, str]:
+    """
+    Ссылки на COG бэндов сцены. Приоритет — ассеты из filter_pipeline,
+    иначе URL строится по preview_url / scene_id (как раньше в process_scene_indices).
+    """
+    assets = getattr(scene, "assets", None) or {}
+    hrefs = {}
+    for band, keys in _ASSET_KEYS.items():
+        for key in keys:
+            if assets.get(key):
+                hrefs[band] = assets[key]
+                break
+    if hrefs:
+        return hrefs
+
+    preview = getattr(scene, "preview_url", None) or ""
+    if "thumbnail.jpg" in preview:
+        base = preview.rsplit("/", 1)[0]
+    else:
+        base = _cog_base_url(scene_id)
+    hrefs = {band: f"{base}/{band}.tif" for band in BANDS}
+    if "thumbnail.jpg" not in preview and not scene_id.startswith(("S2A_", "S2B_", "S2C_")):
+        hrefs["TCI"] = "src/input/tci.tif"
+        logger.info("Используется локальный tci.tif (fallback)")
+    return hrefs
+
+
+@dataclass
+class FieldWindow:
+    """Окно сцены вокруг поля: бэнды на общей 10-метровой сетке + привязка."""
+    transform: object
+    crs: object
+    bands: Dict[str, np.ndarray] = field(default_factory=dict)
+    path: Optional[Path] = None
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return next(iter(self.bands.values())).shape[-2:]
+
+    def band(self, name: str) -> np.ndarray:
+        if name not in self.bands:
+            raise KeyError(f"В окне {self.path} нет бэнда {name}")
+        return self.bands[name]
+
+    def rgb(self) -> np.ndarray:
+        """TCI как (H, W, 3) uint8."""
+        return np.moveaxis(self.band("TCI"), 0, -1).astype(np.uint8)
+
+
+class WindowStore:
+    """Кэш окон (поле, сцена) в `settings.window_store_dir`."""
+
+    def __init__(self, root=None):
+        self.root = Path(root or settings.window_store_dir)
+
+    def path_for(self, scene_id: str, key: str) -> Path:
+        return self.root / key / f"{scene_id}.tif"
+
+    def load(self, scene, gdf, scene_id: str, bands=BANDS) -> FieldWindow:
+        """
+        Окно из хранилища с нужными бэндами. Недостающие бэнды читаются из COG
+        и дописываются в файл окна (single-flight по пути файла).
+        """
+        path = self.path_for(scene_id, field_key(gdf))
+        window = self.read(path) if path.exists() else None
+        if window is not None and all(b in window.bands for b in bands):
+            inc("rlm_cache_hits_total", cache="window")
+            logger.info(f"Окно поля из кэша: {path}")
+            return window
+
+        with file_lock(path):
+            window = self.read(path) if path.exists() else None
+            missing = [b for b in bands if window is None or b not in window.bands]
+            if not missing:
+                inc("rlm_cache_hits_total", cache="window")
+                return window
+            inc("rlm_cache_misses_total", cache="window")
+            fetched = self.fetch(scene, gdf, scene_id, missing, like=window)
+            if window is not None:
+                fetched.bands = {**window.bands, **fetched.bands}
+            self.write(fetched, path, scene_id=scene_id)
+            return fetched
+
+    # ── чтение из COG ──
+
+    def _source(self, href: str, scene_id: str, band: str) -> str:
+        """Источник бэнда для reader: сам COG или, при window_full_tiles, полный тайл в cache/."""
+        if settings.window_full_tiles and href.startswith(("http://", "https://")):
+            # Офлайн-архив: полный тайл в cache/, окно режется локально
+            from .downloader import download_to_cache
+            href = str(download_to_cache(href, Path("cache") / f"{scene_id}_{band}.tif"))
+        return href
+
+    def fetch(self, scene, gdf, scene_id: str, bands=BANDS, like: Optional[FieldWindow] = None) -> FieldWindow:
+        """
+        Оконное чтение бэндов из COG. like — уже сохранённое окно: новые бэнды
+        читаются строго на его сетку, чтобы их можно было дописать в тот же файл.
+        Чтение держит слот scheduler.network.
+        """
+        from rasterio.transform import rowcol, array_bounds
+        from rasterio.windows import Window, from_bounds, bounds as window_bounds, transform as window_transform
+
+        hrefs = scene_hrefs(scene, scene_id)
+        missing = [b for b in bands if b not in hrefs]
+        if missing:
+            raise ValueError(f"У сцены {scene_id} нет ассетов: {', '.join(missing)}")
+
+        with scheduler.network.slot(), stage("read"):
+            if like is not None:
+                transform, crs = like.transform, like.crs
+                out_h, out_w = like.shape
+                bbox = array_bounds(out_h, out_w, transform)
+            else:
+                ref_band = "B04" if "B04" in hrefs else "TCI"
+                ref = reader.header(self._source(hrefs[ref_band], scene_id, ref_band))
+                w, h, crs, ref_transform = ref.width, ref.height, ref.crs, ref.transform
+                minx, miny, maxx, maxy = gdf.to_crs(crs).total_bounds
+                rows, cols = rowcol(ref_transform, [minx, maxx], [maxy, miny])
+                margin = window_margin(w, h)
+                x1 = max(0, int(cols[0]) - margin)
+                y1 = max(0, int(rows[0]) - margin)
+                x2 = min(w, int(cols[1]) + margin)
+                y2 = min(h, int(rows[1]) + margin)
+                if x2 <= x1 or y2 <= y1:
+                    logger.warning("Поле за пределами растра. Используем весь растр.")
+                    x1, y1, x2, y2 = 0, 0, w, h
+                ref_window = Window(x1, y1, x2 - x1, y2 - y1)
+                transform = window_transform(ref_window, ref_transform)
+                bbox = window_bounds(ref_window, ref_transform)
+                out_h, out_w = y2 - y1, x2 - x1
+                logger.info(f"Окно поля: crop=[{x1}:{x2}, {y1}:{y2}] ({out_w}x{out_h} px)")
+            logger.info(f"Читаем бэнды окна: {', '.join(bands)}")
+
+            def read_band(band: str):
+                href = self._source(hrefs[band], scene_id, band)
+                hdr = reader.header(href)
+                data = reader.read(href, from_bounds(*bbox, transform=hdr.transform), indexes=None,
+                                   out_shape=(hdr.count, out_h, out_w))
+                inc("rlm_bytes_fetched_total", data.nbytes, source="cog_window")
+                return band, data if band == "TCI" else data[0]
+
+            # Бэнды читаются параллельно: GDAL отпускает GIL на сетевом I/O
+            with ThreadPoolExecutor(max_workers=len(bands)) as pool:
+                data = dict(pool.map(read_band, bands))
+
+        return FieldWindow(transform=transform, crs=crs, bands=data)
+
+    # ── файл окна ──
+
+    def write(self, window: FieldWindow, path: Path, **tags) -> Path:
+        import rasterio
+
+        names, layers = [], []
+        for band in BANDS:
+            if band not in window.bands:
+                continue
+            data = window.bands[band]
+            if band == "TCI":
+                names.extend(_TCI_BANDS[:data.shape[0]])
+                layers.extend(data)
+            else:
+                names.append(band)
+                layers.append(data)
+        stack = np.stack(layers).astype(np.uint16)
+        h, w = stack.shape[1:]
+        profile = {
+            "driver": "GTiff", "dtype": "uint16", "count": len(names),
+            "width": w, "height": h, "crs": window.crs, "transform": window.transform,
+            "nodata": 0, "compress": "deflate", "predictor": 2,
+        }
+        if w >= 256 and h >= 256:
+            profile.update(tiled=True, blockxsize=256, blockysize=256)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            with rasterio.open(tmp, "w", **profile) as dst:
+                dst.write(stack)
+                dst.descriptions = tuple(names)
+                dst.update_tags(bands=json.dumps(names), created=datetime.now().isoformat(timespec="seconds"), **tags)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        window.path = path
+        logger.info(f"Окно поля сохранено: {path} ({path.stat().st_size / 1024:.0f} КБ, {len(names)} бэндов)")
+        return path
+
+    def read(self, path: Path) -> FieldWindow:
+        import rasterio
+
+        with stage("read"), rasterio.open(path) as src:
+            stack = src.read()
+            names = list(src.descriptions)
+            window = FieldWindow(transform=src.transform, crs=src.crs, path=path)
+        for name, layer in zip(names, stack):
+            if name not in _TCI_BANDS:
+                window.bands[name] = layer
+        tci = [stack[names.index(n)] for n in _TCI_BANDS if n in names]
+        if tci:
+            window.bands["TCI"] = np.stack(tci).astype(np.uint8)
+        return window
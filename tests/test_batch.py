@@ -0,0 +1,138 @@
+"""
+Тесты пакетной обработки полей: группы тайл×дата, одно открытие COG на сцену,
+результаты по полям.
+"""
+import csv
+from unittest.mock import patch
+
+import pytest
+
+from src.rlm import remote_io, sentinel_filter
+from src.rlm.batch import load_fields, plan_groups, run_batch
+from src.rlm.bench import FIELD_CENTER, RangeRequestServer, SyntheticStacClient, make_synthetic_dataset
+from src.rlm.config import settings
+from src.rlm.records import read_records
+
+
+@pytest.fixture(autouse=True)
+def manifest_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "job_manifest", str(tmp_path / "jobs.sqlite"))
+
+
+def _square(lon, lat, d=0.004):
+    return [(lon - d, lat - d), (lon + d, lat - d), (lon + d, lat + d), (lon - d, lat + d), (lon - d, lat - d)]
+
+
+def _write_fields_kml(path, n):
+    lon0, lat0 = FIELD_CENTER
+    placemarks = "".join(
+        f"<Placemark><name>field-{i}</name><Polygon><outerBoundaryIs><LinearRing><coordinates>"
+        + " ".join(f"{x},{y},0" for x, y in _square(lon0 + 0.02 * (i - 1), lat0 + 0.01 * (i % 2)))
+        + "</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>"
+        for i in range(n)
+    )
+    path.write_text('<?xml version="1.0" encoding="utf-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">'
+                    f"<Document>{placemarks}</Document></kml>\n", encoding="utf-8")
+    return path
+
+
+@pytest.fixture(scope="module")
+def served(tmp_path_factory):
+    root = tmp_path_factory.mktemp("batch")
+    meta = make_synthetic_dataset(root / "data", n_dates=3, size=1024, field_vertices=50)
+    with RangeRequestServer(root / "data") as server:
+        yield meta, server
+
+
+def _run(meta, server, source, out_dir, host="127.0.0.1", resume=None):
+    # Другое имя хоста — другие URL: кэш GDAL от предыдущего прогона не помогает
+    client = SyntheticStacClient(meta["items"], server.base_url.replace("127.0.0.1", host))
+    before = server.stats.snapshot()["requests"]
+    with patch.object(sentinel_filter.Client, "open", return_value=client):
+        result = run_batch(source, meta["date_range"], max_cloud=10.0, out_dir=out_dir, workers=2,
+                           resume=resume)
+    return result, server.stats.snapshot()["requests"] - before
+
+
+def test_load_fields_from_multi_placemark_kml(tmp_path):
+    fields = load_fields(_write_fields_kml(tmp_path / "farm.kml", 3))
+    assert list(fields["field_id"]) == ["field-0", "field-1", "field-2"]
+    assert fields.crs.to_epsg() == 4326
+
+
+def test_plan_groups_retries_throttled_search(served, tmp_path, monkeypatch):
+    from rasterio.errors import RasterioIOError
+
+    meta, server = served
+    monkeypatch.setattr(settings, "remote_backoff_s", 0.01)
+    remote_io._limiters.clear()
+    client = SyntheticStacClient(meta["items"], server.base_url)
+    search, failures = client.search, []
+
+    def flaky_search(**kwargs):
+        result = search(**kwargs)
+        items = result.items
+
+        def flaky_items():
+            if not failures:
+                failures.append(1)
+                raise RasterioIOError("HTTP response code: 503")
+            return items()
+        result.items = flaky_items
+        return result
+
+    monkeypatch.setattr(client, "search", flaky_search)
+    with patch.object(sentinel_filter.Client, "open", return_value=client):
+        groups = plan_groups(load_fields(_write_fields_kml(tmp_path / "farm.kml", 2)), meta["date_range"])
+    remote_io._limiters.clear()
+    assert failures and len(groups) == 3
+
+
+def test_batch_groups_by_scene(served, tmp_path):
+    meta, server = served
+    one, requests_one = _run(meta, server, _write_fields_kml(tmp_path / "one.kml", 1), tmp_path / "one")
+    many, requests_many = _run(meta, server, _write_fields_kml(tmp_path / "many.kml", 3), tmp_path / "many",
+                               host="localhost")
+
+    # Дубликат одного дня схлопывается: групп столько же, сколько дат
+    assert many["groups"] == one["groups"] == 3
+    assert len(many["records"]) == 3 * many["groups"]
+    statuses = {r["date"]: r["status"] for r in many["records"] if r["field_id"] == "field-1"}
+    assert sorted(statuses.values()) == ["cloud", "ok", "ok"]
+    # Заголовки COG читаются один раз на сцену: втрое больше полей — заметно меньше, чем втрое больше запросов
+    assert requests_many < 2 * requests_one
+
+    with open(tmp_path / "many" / "field-2" / "indices.csv", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["date"] for r in rows] == sorted(r["date"] for r in rows)
+    assert all(float(r["ndvi_mean"]) > 0 for r in rows if r["status"] == "ok")
+    assert (tmp_path / "many" / "summary.csv").exists()
+
+
+def test_overlapping_tiles_keep_one_record_per_field_date(served, tmp_path):
+    meta, server = served
+    clear, cloudy = meta["items"][0], next(item for item in meta["items"] if item["kind"] == "cloudy")
+    # Соседний тайл MGRS (сортируется раньше) снял тот же день, но над field-1 у него облако
+    overlap = dict(cloudy, id=clear["id"].replace("_", "_00", 1), datetime=clear["datetime"])
+    client = SyntheticStacClient(meta["items"] + [overlap], server.base_url)
+    with patch.object(sentinel_filter.Client, "open", return_value=client):
+        result = run_batch(_write_fields_kml(tmp_path / "farm.kml", 3), meta["date_range"], out_dir=tmp_path / "out")
+
+    assert result["groups"] == 4
+    keys = [(r["field_id"], r["date"]) for r in result["records"]]
+    assert len(keys) == len(set(keys)) == 3 * 3
+    kept = next(r for r in result["records"] if r["field_id"] == "field-1" and r["date"] == clear["datetime"][:10])
+    assert kept["scene_id"] == clear["id"] and kept["status"] == "ok"
+    assert len(read_records(tmp_path / "out" / "summary.csv")) == len(keys)
+
+
+def test_batch_resume_skips_finished_groups(served, tmp_path):
+    meta, server = served
+    farm = _write_fields_kml(tmp_path / "farm.kml", 2)
+    first, _ = _run(meta, server, farm, tmp_path / "out", resume=True)
+
+    again, requests = _run(meta, server, farm, tmp_path / "out", host="localhost", resume=True)
+    assert requests == 0
+    assert again["records"] == first["records"]
+    # Сводка повторного запуска содержит и группы, выполненные в первом
+    assert len(read_records(tmp_path / "out" / "summary.csv")) == len(first["records"])
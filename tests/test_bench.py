@@ -0,0 +1,63 @@
+"""
+Тесты бенчмарк-обвязки: Range-сервер, синтетические данные и сравнение с базовой линией.
+Работают офлайн — сеть не нужна.
+"""
+import pytest
+import requests
+from unittest.mock import patch
+
+from src.rlm import sentinel_filter
+from src.rlm.bench import (
+    RangeRequestServer, BenchContext, make_synthetic_dataset, compare, make_baseline,
+)
+
+
+@pytest.fixture(scope="module")
+def synthetic(tmp_path_factory):
+    root = tmp_path_factory.mktemp("bench")
+    meta = make_synthetic_dataset(root / "data", n_dates=6, size=256, field_vertices=400)
+    with RangeRequestServer(root / "data") as server:
+        yield meta, server
+
+
+def test_range_server_serves_byte_ranges(synthetic):
+    meta, server = synthetic
+    url = f"{server.base_url}/{meta['items'][0]['assets']['red']}"
+    full = requests.get(url).content
+    before = server.stats.snapshot()
+
+    part = requests.get(url, headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206
+    assert part.content == full[10:20]
+
+    after = server.stats.snapshot()
+    assert after["requests"] - before["requests"] == 1
+    assert after["bytes_sent"] - before["bytes_sent"] == 10
+
+
+def test_filter_pipeline_on_synthetic_scenes(synthetic):
+    """Облачная дата и дата с nodata отбраковываются, из двух снимков дня берётся лучший."""
+    meta, server = synthetic
+    ctx = BenchContext(root=meta["root"], kml_path=meta["kml_path"], base_url=server.base_url,
+                       workdir=meta["root"], items=meta["items"], date_range=meta["date_range"])
+
+    with patch.object(sentinel_filter.Client, "open", return_value=ctx.stac_client()):
+        passed = sentinel_filter.filter_pipeline(
+            kml_path=ctx.kml_path, date_range=ctx.date_range, max_cloud_percent=10.0,
+        )
+
+    expected = {it["id"] for it in ctx.clear_items()}
+    assert {p["item_id"] for p in passed} == expected
+    assert all(p["cloud_cover_field"] == 0.0 and p["nodata_percent"] == 0.0 for p in passed)
+
+
+def test_compare_detects_regressions_beyond_tolerance():
+    baseline = make_baseline({"cases": {
+        "case_a": {"wall_time_s": 1.0, "peak_rss_mb": 100.0, "bytes_read": 10_000_000, "http_requests": 50},
+    }})
+    ok = {"cases": {"case_a": {"wall_time_s": 1.3, "peak_rss_mb": 110.0, "bytes_read": 10_500_000, "http_requests": 52}}}
+    bad = {"cases": {"case_a": {"wall_time_s": 2.0, "peak_rss_mb": 100.0, "bytes_read": 20_000_000, "http_requests": 50}}}
+
+    assert not any(r["regression"] for r in compare(ok, baseline))
+    regressed = {r["metric"] for r in compare(bad, baseline) if r["regression"]}
+    assert regressed == {"wall_time_s", "bytes_read"}
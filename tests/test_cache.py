@@ -0,0 +1,117 @@
+"""
+Тесты кэшей долгоживущего процесса: LRU/TTL, инвалидация по изменению файла,
+повторный STAC-поиск и переиспользование открытых датасетов.
+"""
+import os
+import shutil
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from src.rlm import search
+from src.rlm.bench import RangeRequestServer, make_synthetic_dataset
+from src.rlm.cache import TTLCache, clear_caches, datasets, open_dataset
+from src.rlm.metrics import metrics
+from src.rlm.models import SearchRequest
+from src.rlm.sentinel_filter import _load_field_polygon
+
+
+@pytest.fixture(autouse=True)
+def cold_caches():
+    clear_caches()
+    yield
+    clear_caches()
+
+
+def test_lru_and_ttl():
+    cache = TTLCache("test_lru", maxsize=2, ttl=0.2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # вытесняет давно не читанный "b"
+    assert cache.get("b") is None and cache.get("a") == 1
+    time.sleep(0.25)
+    assert cache.get("a") is None and len(cache) == 1
+
+    calls = []
+    assert cache.get_or_create("d", lambda: calls.append(1) or 4) == 4
+    assert cache.get_or_create("d", lambda: calls.append(1) or 5) == 4
+    assert len(calls) == 1
+
+
+def test_field_geometry_cached_until_file_changes(tmp_path):
+    kml = tmp_path / "field.kml"
+    shutil.copy("src/input/test.kml", kml)
+    metrics.reset()
+
+    first = _load_field_polygon(str(kml))
+    gdf = search.read_geometry_file(str(kml))
+    original = gdf.geometry.iloc[0]
+    gdf["geometry"] = gdf.geometry.translate(xoff=1)  # вызывающий получает копию, кэш не портится
+    assert search.read_geometry_file(str(kml)).geometry.iloc[0].equals(original)
+    assert _load_field_polygon(str(kml)) is first
+    assert metrics.get("rlm_cache_hits_total", cache="field_polygon") == 1
+
+    buffer_path = search.create_buffer(str(kml), 500)
+    os.remove(buffer_path)  # пропавший файл буфера строится заново, а не берётся из кэша
+    assert os.path.exists(search.create_buffer(str(kml), 500))
+
+    stat = kml.stat()
+    os.utime(kml, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert _load_field_polygon(str(kml)) is not first
+
+
+def test_repeat_stac_search_is_served_from_cache():
+    item = SimpleNamespace(id="S2A_TEST", properties={"datetime": "2024-05-01T10:00:00Z", "eo:cloud_cover": 5.0},
+                           assets={"thumbnail": SimpleNamespace(href="http://x/t.jpg")}, self_href="http://x/item")
+    client = SimpleNamespace(searches=0)
+
+    def fake_search(**kwargs):
+        client.searches += 1
+        return SimpleNamespace(items=lambda: [item])
+
+    client.search = fake_search
+    request = SearchRequest(kml_path="src/input/test.kml", start_date="2024-04-01", end_date="2024-05-31")
+    with patch.object(search, "stac_client", return_value=client):
+        first = search.list_scenes(request)
+        again = search.list_scenes(request)
+    assert client.searches == 1
+    assert [s.scene_id for s in again] == [s.scene_id for s in first] == ["S2A_TEST"]
+
+
+def test_open_dataset_reuses_remote_handle(tmp_path):
+    meta = make_synthetic_dataset(tmp_path / "data", n_dates=1, size=512, field_vertices=20)
+    href = meta["items"][0]["assets"]["scl"]
+    with RangeRequestServer(tmp_path / "data") as server:
+        url = f"{server.base_url}/{href}"
+        with open_dataset(url) as first:
+            first.read(1, window=((0, 16), (0, 16)))
+        before = server.stats.snapshot()["requests"]
+        with open_dataset(url) as again:
+            assert again is first
+            again.read(1, window=((0, 16), (0, 16)))
+        assert server.stats.snapshot()["requests"] == before
+    assert len(datasets) == 0  # сервер остановлен — его датасеты закрыты
+
+
+def test_slow_eviction_does_not_block_cache():
+    import threading
+
+    release, closing = threading.Event(), threading.Event()
+
+    def slow_close(value):  # как закрытие датасета, пока на нём идёт удалённое чтение
+        closing.set()
+        release.wait(10)
+
+    cache = TTLCache("test_slow_evict", maxsize=1, ttl=60, on_evict=slow_close)
+    cache.put("a", 1)
+    writer = threading.Thread(target=cache.put, args=("b", 2))
+    writer.start()
+    assert closing.wait(5)
+    start = time.monotonic()
+    assert cache.get("b") == 2 and cache.get("a") is None
+    assert time.monotonic() - start < 1.0  # замок кэша уже отпущен
+    release.set()
+    writer.join(5)
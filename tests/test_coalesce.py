@@ -0,0 +1,111 @@
+"""
+Тесты схлопывания одинаковых запросов: один вызов на ключ, общий результат
+и общая ошибка, нормализация геометрии поля, одинаковые фильтрации и задания.
+"""
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+from shapely.geometry import Polygon
+
+from src.rlm import sentinel_filter
+from src.rlm.bench import RangeRequestServer, SyntheticStacClient, make_synthetic_dataset
+from src.rlm.coalesce import SingleFlight, field_hash
+from src.rlm.jobs import JobRunner
+from tests.test_jobs import slow_task
+
+
+def test_single_flight_shares_result_and_error():
+    flight = SingleFlight("test")
+    calls = []
+    started = threading.Event()
+
+    def compute(value):
+        calls.append(value)
+        started.set()
+        time.sleep(0.3)
+        return [value]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(flight.do, "key", compute, 1)
+        started.wait()
+        followers = [pool.submit(flight.do, "key", compute, 2) for _ in range(3)]
+        results = [f.result() for f in [leader, *followers]]
+    assert calls == [1] and all(r is results[0] for r in results)
+    assert flight.in_flight() == 0
+    assert flight.do("key", compute, 3) == [3]  # завершённый вызов не кэшируется
+
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("STAC недоступен")
+
+    started.clear()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "bad", fail)
+        started.wait()
+        follower = pool.submit(flight.do, "bad", fail)
+        for future in (leader, follower):
+            with pytest.raises(ValueError, match="STAC недоступен"):
+                future.result()
+
+
+def test_field_hash_ignores_vertex_order_and_file(tmp_path):
+    ring = [(37.0, 55.0), (37.01, 55.0), (37.01, 55.01), (37.0, 55.01)]
+    assert field_hash(Polygon(ring)) == field_hash(Polygon(ring[2:] + ring[:2]))
+    assert field_hash(Polygon(ring)) == field_hash(Polygon(ring[::-1]))
+    assert field_hash(Polygon(ring)) != field_hash(Polygon([(x + 0.001, y) for x, y in ring]))
+
+    copy = tmp_path / "same_field.kml"
+    shutil.copy("src/input/test.kml", copy)
+    assert field_hash(str(copy)) == field_hash("src/input/test.kml")
+
+
+def test_field_hash_covers_every_feature_in_file(tmp_path):
+    import geopandas as gpd
+
+    first = Polygon([(37.0, 55.0), (37.01, 55.0), (37.01, 55.01), (37.0, 55.01)])
+    second = Polygon([(37.02, 55.0), (37.03, 55.0), (37.03, 55.01), (37.02, 55.01)])
+    gpd.GeoDataFrame(geometry=[first], crs="EPSG:4326").to_file(tmp_path / "one.geojson")
+    gpd.GeoDataFrame(geometry=[first, second], crs="EPSG:4326").to_file(tmp_path / "two.geojson")
+    gpd.GeoDataFrame(geometry=[second, first], crs="EPSG:4326").to_file(tmp_path / "two_swapped.geojson")
+
+    assert field_hash(str(tmp_path / "one.geojson")) == field_hash(first)
+    assert field_hash(str(tmp_path / "two.geojson")) != field_hash(str(tmp_path / "one.geojson"))
+    assert field_hash(str(tmp_path / "two.geojson")) == field_hash(str(tmp_path / "two_swapped.geojson"))
+
+
+def test_identical_filter_pipelines_share_one_run(tmp_path):
+    meta = make_synthetic_dataset(tmp_path / "data", n_dates=3, size=256, field_vertices=50)
+    with RangeRequestServer(tmp_path / "data") as server:
+        client = SyntheticStacClient(meta["items"], server.base_url)
+        searches = []
+        search = client.search
+        client.search = lambda **kw: searches.append(kw) or (time.sleep(0.3), search(**kw))[1]
+
+        def run():
+            return sentinel_filter.filter_pipeline(kml_path=meta["kml_path"], date_range=meta["date_range"])
+
+        with patch.object(sentinel_filter.Client, "open", return_value=client), \
+                ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(pool.map(lambda _: run(), range(3)))
+
+    assert len(searches) == 1
+    assert results[0] and results[0] == results[1] == results[2]
+    assert results[0] is not results[1]  # у каждого вызывающего свой список: сортировка не мешает другим
+
+
+def test_identical_jobs_attach_to_running_one():
+    runner = JobRunner(workers=1, max_pending=4)
+    try:
+        first = runner.submit(slow_task, key=("analysis", "field-a"), steps=5, delay=0.1)
+        again = runner.submit(slow_task, key=("analysis", "field-a"), steps=5, delay=0.1)
+        other = runner.submit(slow_task, key=("analysis", "field-b"), steps=1, delay=0)
+        assert again is first and other is not first
+        first.future.result(timeout=120)
+        assert runner.submit(slow_task, key=("analysis", "field-a"), steps=1, delay=0) is not first
+    finally:
+        runner.shutdown()
@@ -0,0 +1,43 @@
+"""
+Тесты выгрузки индексов в COG: раскладка COG, обзоры, nodata и точность int16-масштаба.
+"""
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from src.rlm.cog import INDEX_NODATA, read_index_cog, write_index_cog
+
+
+def _ndvi(h=600, w=700):
+    rng = np.random.default_rng(0)
+    values = rng.uniform(-1, 1, (h, w)).astype(np.float32)
+    values[:50, :80] = np.nan
+    return values
+
+
+def test_roundtrip_and_cog_layout(tmp_path):
+    values = _ndvi()
+    path = write_index_cog(tmp_path / "scene_ndvi.tif", values, from_origin(500000, 5600000, 10, 10),
+                           "EPSG:32636", name="NDVI", scene_id="scene")
+
+    with rasterio.open(path) as src:
+        assert src.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG"
+        assert src.dtypes[0] == "int16"
+        assert src.nodata == INDEX_NODATA
+        assert src.scales == (1e-4,)
+        assert src.block_shapes[0] == (256, 256)
+        assert src.overviews(1)
+        assert src.descriptions == ("NDVI",)
+        assert src.tags()["scene_id"] == "scene"
+
+    restored = read_index_cog(path)
+    assert np.array_equal(np.isnan(restored), np.isnan(values))
+    assert np.nanmax(np.abs(restored - values)) <= 1e-4 / 2 + 1e-6
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_overview_read_is_smaller(tmp_path):
+    path = write_index_cog(tmp_path / "ndvi.tif", _ndvi(), from_origin(0, 0, 10, 10), "EPSG:32636",
+                           compress="ZSTD")
+    preview = read_index_cog(path, overview_level=0)
+    assert preview.shape[0] < 600 and preview.dtype == np.float32
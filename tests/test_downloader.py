@@ -0,0 +1,68 @@
+"""
+Тесты загрузчика: параллельные Range-части, докачка, проверка контрольной суммы.
+Файлы раздаёт локальный Range-сервер из rlm.bench — сеть не нужна.
+"""
+import hashlib
+import json
+import os
+
+import pytest
+
+from src.rlm.bench import RangeRequestServer
+from src.rlm.downloader import DownloadError, download_file
+
+MB = 1024 * 1024
+
+
+@pytest.fixture(scope="module")
+def served(tmp_path_factory):
+    root = tmp_path_factory.mktemp("served")
+    payload = os.urandom(5 * MB + 12345)
+    (root / "asset.tif").write_bytes(payload)
+    with RangeRequestServer(root) as server:
+        yield server, payload
+
+
+def test_parallel_ranges_and_atomic_rename(served, tmp_path):
+    server, payload = served
+    dest = tmp_path / "asset.tif"
+    before = server.stats.snapshot()
+
+    download_file(f"{server.base_url}/asset.tif", dest, part_size_mb=1, max_workers=4,
+                  checksum="sha256:" + hashlib.sha256(payload).hexdigest(), progress=False)
+
+    assert dest.read_bytes() == payload
+    assert not (tmp_path / "asset.tif.part").exists()
+    assert not (tmp_path / "asset.tif.part.json").exists()
+    # 6 частей по 1 МБ, размер узнаётся из первого же Range-ответа — без HEAD
+    assert server.stats.snapshot()["requests"] - before["requests"] == 6
+
+
+def test_resume_fetches_only_missing_parts(served, tmp_path):
+    server, payload = served
+    url = f"{server.base_url}/asset.tif"
+    dest = tmp_path / "asset.tif"
+
+    # Прерванная загрузка: части 0 и 2 уже на диске, остальное — мусор
+    part = bytearray(os.urandom(len(payload)))
+    part[0:MB] = payload[0:MB]
+    part[2 * MB:3 * MB] = payload[2 * MB:3 * MB]
+    (tmp_path / "asset.tif.part").write_bytes(bytes(part))
+    (tmp_path / "asset.tif.part.json").write_text(json.dumps({
+        "url": url, "size": len(payload), "etag": None, "part_size": MB, "done": [0, 2],
+    }))
+
+    before = server.stats.snapshot()
+    download_file(url, dest, part_size_mb=1, progress=False)
+
+    assert dest.read_bytes() == payload
+    assert server.stats.snapshot()["requests"] - before["requests"] == 4
+
+
+def test_checksum_mismatch_leaves_no_file(served, tmp_path):
+    server, _ = served
+    dest = tmp_path / "asset.tif"
+    with pytest.raises(DownloadError):
+        download_file(f"{server.base_url}/asset.tif", dest, part_size_mb=1,
+                      checksum="sha256:" + "0" * 64, progress=False)
+    assert [p.name for p in tmp_path.iterdir() if not p.name.endswith(".lock")] == []
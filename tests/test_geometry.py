@@ -0,0 +1,83 @@
+"""
+Тесты подготовки геометрии: векторная проекция совпадает с повершинной,
+Transformer на пару CRS создаётся один раз, маска поля на одной сетке — общая.
+"""
+import threading
+
+import numpy as np
+import pytest
+from pyproj import Transformer
+from rasterio.transform import from_origin
+from shapely.geometry import MultiPolygon, Polygon
+
+from src.rlm import geometry
+from src.rlm.cache import clear_caches
+from src.rlm.metrics import metrics
+
+FIELD = Polygon([(36.27, 51.84), (36.29, 51.84), (36.29, 51.85), (36.28, 51.856), (36.27, 51.85)])
+
+
+@pytest.fixture(autouse=True)
+def cold_caches():
+    clear_caches()
+    yield
+    clear_caches()
+
+
+def test_vectorized_projection_matches_per_vertex():
+    projected = geometry.project_polygon(FIELD, "EPSG:32637")
+    reference = Transformer.from_crs("EPSG:4326", "EPSG:32637", always_xy=True)
+    expected = [reference.transform(x, y) for x, y in FIELD.exterior.coords]
+    np.testing.assert_allclose(np.asarray(projected.exterior.coords), expected, rtol=0, atol=1e-6)
+
+    multi = geometry.project_polygon(MultiPolygon([FIELD, FIELD]), "EPSG:32637")
+    assert multi.geom_type == "MultiPolygon" and multi.geoms[0].equals(projected)
+    assert geometry.project_polygon(FIELD, "EPSG:32637") is projected
+
+
+def test_transformer_reused_per_crs_pair_and_thread():
+    first = geometry.transformer("EPSG:4326", "EPSG:32636")
+    assert geometry.transformer("EPSG:4326", "EPSG:32636") is first
+    assert geometry.transformer("EPSG:4326", "EPSG:32637") is not first
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(geometry.transformer("EPSG:4326", "EPSG:32636")))
+    thread.start()
+    thread.join()
+    assert other[0] is not first  # свой экземпляр в каждом потоке
+
+
+def test_field_mask_shared_on_same_grid():
+    polygon = geometry.project_polygon(FIELD, "EPSG:32637")
+    minx, _, _, maxy = polygon.bounds
+    transform = from_origin(minx - 100, maxy + 100, 10, 10)
+    misses = metrics.get("rlm_cache_misses_total", cache="field_mask")
+
+    mask = geometry.field_mask(polygon, transform, (160, 180))
+    assert mask.any() and not mask.flags.writeable
+    assert geometry.field_mask(polygon, transform, (160, 180)) is mask  # nodata и облака — одна маска
+    assert geometry.field_mask(polygon, from_origin(minx - 100, maxy + 100, 20, 20), (80, 90)) is not mask
+    assert metrics.get("rlm_cache_misses_total", cache="field_mask") - misses == 2
+
+
+def test_to_pixels_keeps_holes_and_parts():
+    import geopandas as gpd
+    from rasterio.transform import rowcol
+
+    hole = [(36.275, 51.843), (36.28, 51.843), (36.28, 51.846), (36.275, 51.846)]
+    field = Polygon(FIELD.exterior.coords, [hole])
+    projected = geometry.project_polygon(field, "EPSG:32637")
+    assert len(projected.interiors) == 1  # дыра поля не теряется при проекции
+
+    minx, _, _, maxy = projected.bounds
+    transform = from_origin(minx - 55, maxy + 55, 10, 10)
+    pixels = geometry.to_pixels(projected, transform)
+    rows, cols = rowcol(transform, *np.asarray(projected.exterior.coords).T)
+    np.testing.assert_array_equal(np.floor(np.asarray(pixels.exterior.coords)), np.column_stack([cols, rows]))
+    assert len(pixels.interiors) == 1
+    centered = geometry.to_pixels(projected, transform, center=True)
+    np.testing.assert_allclose(np.asarray(centered.exterior.coords), np.asarray(pixels.exterior.coords) - 0.5)
+
+    series = gpd.GeoSeries([MultiPolygon([projected, geometry.project_polygon(FIELD, "EPSG:32637")])])
+    (multi,) = geometry.to_pixels(series, transform)
+    assert multi.geom_type == "MultiPolygon" and multi.geoms[0].equals(pixels)
@@ -0,0 +1,93 @@
+"""
+Тесты streamable HTTP транспорта MCP-сервера: несколько клиентов одновременно,
+медленный инструмент не блокирует остальных, лимит частоты по клиенту.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+import uvicorn
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from src.rlm import server
+from src.rlm.config import settings
+from src.rlm.ratelimit import ClientRateLimiter, RateLimitMiddleware
+
+
+@server.tool
+def slow_echo(text: str, delay: float = 0.5):
+    """Тестовый инструмент: синхронная пауза, как сетевой запрос"""
+    time.sleep(delay)
+    return {"text": text}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def http_server():
+    port = _free_port()
+    config = uvicorn.Config(server.http_app(), host="127.0.0.1", port=port, log_level="warning")
+    instance = uvicorn.Server(config)
+    # Все агенты теста — с одного адреса: лимит частоты по IP проверяется отдельно
+    with patch.object(settings, "mcp_http_rate_limit", 0):
+        thread = threading.Thread(target=instance.run, daemon=True)
+        thread.start()
+        deadline = time.time() + 30
+        while not instance.started and time.time() < deadline:
+            time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}/mcp"
+        instance.should_exit = True
+        thread.join(timeout=30)
+
+
+async def _call(url, client, tool, **arguments):
+    async with streamablehttp_client(url, headers={"X-Client-Id": client}) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            result = await session.call_tool(tool, arguments)
+            return json.loads(result.content[0].text)
+
+
+def test_concurrent_clients_do_not_block_each_other(http_server):
+    async def scenario():
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            _call(http_server, f"agent-{i}", "slow_echo", text=str(i), delay=1.0) for i in range(4)
+        ), _call(http_server, "web-ui", "list_jobs"))
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(scenario())
+    assert [r["text"] for r in results[:4]] == ["0", "1", "2", "3"]
+    assert results[4] == {"jobs": []}
+    # Четыре секундных вызова идут параллельно в пуле потоков, а не друг за другом
+    assert elapsed < 3.0
+
+
+def test_rate_limit_per_client():
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    app = RateLimitMiddleware(Starlette(routes=[Route("/", ok)]), ClientRateLimiter(rate=0.5, burst=2))
+    client = TestClient(app, client=("10.0.0.1", 50000))
+    codes = [client.get("/", headers={"X-Client-Id": "greedy"}).status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+    limited = client.get("/", headers={"X-Client-Id": "greedy"})
+    assert limited.status_code == 429 and int(limited.headers["retry-after"]) >= 1
+    # Новый X-Client-Id с того же адреса не даёт нового всплеска
+    assert client.get("/", headers={"X-Client-Id": "fresh-id"}).status_code == 429
+    # Другой адрес лимит не делит
+    polite = TestClient(app, client=("10.0.0.2", 50000))
+    assert polite.get("/", headers={"X-Client-Id": "greedy"}).status_code == 200
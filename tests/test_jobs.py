@@ -0,0 +1,72 @@
+"""
+Тесты фоновых заданий MCP-сервера: submit возвращается сразу, прогресс и результат
+читаются по job_id, ошибки и переполнение очереди не роняют сервер.
+"""
+import time
+
+import pytest
+
+from src.rlm import server
+from src.rlm.jobs import JobRunner, report_progress
+
+
+def slow_task(steps: int, delay: float):
+    for i in range(steps):
+        report_progress(i / steps, f"шаг {i + 1}/{steps}")
+        time.sleep(delay)
+    return {"steps": steps}
+
+
+def failing_task():
+    raise ValueError("нет сцен")
+
+
+def _wait(runner, job_id, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = runner.status(job_id)
+        if status["status"] in ("done", "failed", "cancelled"):
+            return status
+        time.sleep(0.05)
+    raise TimeoutError(job_id)
+
+
+@pytest.fixture
+def runner():
+    runner = JobRunner(workers=2, max_pending=3)
+    yield runner
+    runner.shutdown()
+
+
+def test_job_progress_and_result(runner):
+    job = runner.submit(slow_task, steps=20, delay=0.1)
+    assert runner.status(job.job_id)["status"] in ("queued", "running")
+    assert runner.result(job.job_id).get("result") is None
+
+    seen = set()
+    while not job.future.done():
+        seen.add(runner.status(job.job_id)["progress"])
+        time.sleep(0.05)
+    assert len(seen - {0.0}) > 1  # промежуточный прогресс виден снаружи
+
+    result = runner.result(job.job_id)
+    assert result["status"] == "done" and result["progress"] == 1.0
+    assert result["result"] == {"steps": 20}
+    assert result["started_at"] >= result["created_at"]
+
+
+def test_failure_and_queue_limit(runner):
+    failed = runner.submit(failing_task)
+    slow = [runner.submit(slow_task, steps=5, delay=0.2) for _ in range(2)]
+    with pytest.raises(RuntimeError, match="Очередь заданий заполнена"):
+        runner.submit(slow_task, steps=1, delay=0)
+
+    assert _wait(runner, failed.job_id)["status"] == "failed"
+    assert runner.result(failed.job_id)["error"] == "ValueError: нет сцен"
+    assert all(_wait(runner, job.job_id)["status"] == "done" for job in slow)
+    assert {j["job_id"] for j in runner.jobs()} == {failed.job_id, *(j.job_id for j in slow)}
+
+
+def test_server_unknown_job():
+    assert "не найдено" in server.get_job_status("nope")["error"]
+    assert "не найдено" in server.get_job_result("nope")["error"]
@@ -0,0 +1,63 @@
+"""
+Тесты вызова LLM без сети: заглушка-бэкенд, постоянный кэш ответов
+(ключ — модель, промпты, температура) и вытеснение сверх лимита.
+"""
+from unittest.mock import patch
+
+import pytest
+
+from src.rlm import llm
+from src.rlm.config import settings
+from src.rlm.metrics import metrics
+
+
+@pytest.fixture
+def stub_llm(tmp_path):
+    calls = []
+
+    def backend(model, system_prompt, prompt, temperature, **kwargs):
+        calls.append(prompt)
+        return llm._stub(model, system_prompt, prompt, temperature, **kwargs)
+
+    with patch.object(settings, "llm_backend", "counting"), \
+            patch.object(settings, "llm_cache_path", str(tmp_path / "llm_cache.sqlite")), \
+            patch.dict(llm.BACKENDS, counting=backend):
+        yield calls
+
+
+def test_repeated_report_served_from_cache(stub_llm):
+    first = llm.call_llm("NDVI 0.61\nОблачность 3%", temperature=0.3)
+    assert first.startswith("[stub ")
+    assert llm.call_llm("NDVI 0.61\nОблачность 3%", temperature=0.3) == first
+    assert stub_llm == ["NDVI 0.61\nОблачность 3%"]
+
+    llm.call_llm("NDVI 0.61\nОблачность 3%", temperature=0.7)
+    llm.call_llm("NDVI 0.61\nОблачность 3%", system_prompt="Ты — агроном.", temperature=0.3)
+    assert len(stub_llm) == 3  # температура и системный промпт — часть ключа
+
+    hits = metrics.get("rlm_cache_hits_total", cache="llm")
+    llm.response_cache().close()
+    llm._caches.clear()  # «новый процесс»: кэш читается с диска
+    assert llm.call_llm("NDVI 0.61\nОблачность 3%", temperature=0.3) == first
+    assert len(stub_llm) == 3 and metrics.get("rlm_cache_hits_total", cache="llm") == hits + 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = llm.ResponseCache(tmp_path / "llm.sqlite", max_entries=2)
+    keys = [llm.ResponseCache.key("m", "s", f"отчёт {i}", 0.3) for i in range(3)]
+    cache.put(keys[0], "m", "a")
+    cache.put(keys[1], "m", "b")
+    assert cache.get(keys[0]) == "a"  # обращение освежает запись
+    cache.put(keys[2], "m", "c")
+    assert len(cache) == 2
+    assert cache.get(keys[1]) is None and cache.get(keys[0]) == "a"
+    cache.close()
+
+
+def test_unknown_backend_and_disabled_cache(stub_llm):
+    with patch.object(settings, "llm_cache", False):
+        llm.call_llm("отчёт")
+        llm.call_llm("отчёт")
+    assert len(stub_llm) == 2
+    with patch.object(settings, "llm_backend", "gpt-local"), pytest.raises(ValueError, match="Неизвестный"):
+        llm.call_llm("отчёт")
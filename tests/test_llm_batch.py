@@ -0,0 +1,67 @@
+"""
+Тесты пакетного LLM-этапа: компактный промпт в бюджете токенов, одновременные
+запросы под лимитом, ответы по мере готовности и анализ полей в run_batch.
+"""
+import threading
+import time
+from unittest.mock import patch
+
+from src.rlm import llm, sentinel_filter
+from src.rlm.batch import run_batch
+from src.rlm.bench import SyntheticStacClient
+from src.rlm.config import settings
+from src.rlm.llm_batch import analyze_many, build_prompt, estimate_tokens
+from tests.test_batch import _write_fields_kml, manifest_path, served  # noqa: F401
+
+
+def _records(n):
+    return [{"field_id": "f1", "date": f"2025-{5 + i // 28:02d}-{1 + i % 28:02d}", "scene_id": f"S{i}",
+             "status": "ok", "ndvi_mean": 0.3 + i / 100, "rgb_path": f"/very/long/path/S{i}_rgb.png",
+             "valid_pixels": None} for i in range(n)]
+
+
+def test_prompt_is_compact_and_fits_budget():
+    prompt = build_prompt("f1", _records(3), budget_tokens=800)
+    assert "rgb_path" not in prompt and "valid_pixels" not in prompt and '"earlier"' not in prompt
+
+    prompt = build_prompt("f1", _records(60), budget_tokens=300)
+    assert estimate_tokens(prompt) <= 300
+    assert '"earlier":{"dates":' in prompt and '"ndvi_max":' in prompt
+    assert '"date":"2025-07-04"' in prompt  # последние даты остаются подробно
+
+
+def test_prompts_sent_concurrently_and_streamed(tmp_path):
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def backend(model, system_prompt, prompt, temperature, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.2)
+        with lock:
+            in_flight[0] -= 1
+        return f"ответ на {prompt}"
+
+    arrived = []
+    prompts = {i: f"отчёт {i % 6}" for i in range(8)}  # 6 разных промптов, 2 повтора
+    with patch.object(settings, "llm_backend", "slow"), patch.dict(llm.BACKENDS, slow=backend), \
+            patch.object(settings, "llm_cache_path", str(tmp_path / "llm.sqlite")):
+        start = time.monotonic()
+        answers = analyze_many(prompts, on_result=lambda key, text: arrived.append(key), concurrency=3)
+    assert time.monotonic() - start < 1.0  # 6 запросов по 0.2 с в 3 потока, а не 1.2 с подряд
+    assert peak[0] == 3
+    assert answers == {i: f"ответ на отчёт {i % 6}" for i in range(8)}
+    assert sorted(arrived) == list(range(8))
+
+
+def test_run_batch_writes_field_analyses(served, tmp_path):  # noqa: F811
+    meta, server = served
+    source = _write_fields_kml(tmp_path / "farm.kml", 2)
+    with patch.object(sentinel_filter.Client, "open", return_value=SyntheticStacClient(meta["items"], server.base_url)), \
+            patch.object(settings, "llm_backend", "stub"), \
+            patch.object(settings, "llm_cache_path", str(tmp_path / "llm.sqlite")):
+        result = run_batch(source, meta["date_range"], out_dir=tmp_path / "out", use_llm=True)
+    assert set(result["llm_analysis"]) == {"field-0", "field-1"}
+    for field_id, text in result["llm_analysis"].items():
+        assert text.startswith("[stub ")
+        assert (tmp_path / "out" / field_id / "llm_analysis.md").read_text(encoding="utf-8").strip() == text
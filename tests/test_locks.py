@@ -0,0 +1,99 @@
+"""
+Тесты single-flight заполнения кэша: один и тот же ассет из нескольких потоков
+и процессов скачивается ровно один раз.
+"""
+import gc
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from src.rlm.bench import RangeRequestServer
+from src.rlm.downloader import download_to_cache
+from src.rlm import locks
+from src.rlm.locks import LockTimeout, file_lock
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope="module")
+def served(tmp_path_factory):
+    root = tmp_path_factory.mktemp("served")
+    payload = os.urandom(3 * 1024 * 1024)
+    (root / "B04.tif").write_bytes(payload)
+    with RangeRequestServer(root) as server:
+        yield server, payload
+
+
+def test_threads_share_one_download(served, tmp_path):
+    server, payload = served
+    dest = tmp_path / "scene_B04.tif"
+    before = server.stats.snapshot()
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        paths = list(pool.map(lambda _: download_to_cache(f"{server.base_url}/B04.tif", dest), range(6)))
+
+    assert all(p == dest for p in paths)
+    assert dest.read_bytes() == payload
+    assert server.stats.snapshot()["requests"] - before["requests"] == 1
+
+
+def test_processes_share_one_download(served, tmp_path):
+    server, payload = served
+    dest = tmp_path / "scene_B04.tif"
+    script = (
+        "import sys; from pathlib import Path; "
+        "from src.rlm.downloader import download_to_cache; "
+        "download_to_cache(sys.argv[1], Path(sys.argv[2]))"
+    )
+    # Ограничение скорости растягивает загрузку, чтобы процессы гарантированно пересеклись
+    env = {**os.environ, "RLM_DOWNLOAD_MAX_BANDWIDTH_MB": "10", "LITELLM_LOCAL_MODEL_COST_MAP": "True"}
+    before = server.stats.snapshot()
+
+    procs = [
+        subprocess.Popen([sys.executable, "-c", script, f"{server.base_url}/B04.tif", str(dest)],
+                         cwd=REPO_ROOT, env=env)
+        for _ in range(3)
+    ]
+    assert all(p.wait(timeout=120) == 0 for p in procs)
+
+    assert dest.read_bytes() == payload
+    assert server.stats.snapshot()["requests"] - before["requests"] == 1
+
+
+def test_lock_is_reentrant_and_times_out(tmp_path):
+    path = tmp_path / "x.tif"
+    held, release = threading.Event(), threading.Event()
+
+    def holder():
+        with file_lock(path):
+            with file_lock(path):  # повторный захват тем же потоком
+                held.set()
+                release.wait(5)
+
+    t = threading.Thread(target=holder)
+    t.start()
+    held.wait(5)
+    with pytest.raises(LockTimeout):
+        with file_lock(path, timeout=0.2):
+            pass
+    release.set()
+    t.join()
+    with file_lock(path, timeout=1) as waited:
+        assert waited is False
+
+
+def test_released_locks_leave_registry(tmp_path):
+    paths = [tmp_path / f"{i}.tif" for i in range(50)]
+    with file_lock(paths[0]):
+        for path in paths[1:]:
+            with file_lock(path):
+                pass
+        gc.collect()
+        assert len(locks._registry) == 1  # держится только захваченная
+    gc.collect()
+    assert len(locks._registry) == 0
@@ -0,0 +1,101 @@
+"""
+Тесты манифеста заданий: пропуск выполненного, повтор упавшего с задержкой,
+продолжение после прерывания.
+"""
+import pytest
+
+from src.rlm.config import settings
+from src.rlm.manifest import JobManifest
+
+
+@pytest.fixture
+def manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "job_backoff_s", 0.01)
+    return JobManifest(tmp_path / "jobs.sqlite")
+
+
+UNITS = [("field", f"S2B_{i}", "indices") for i in range(3)]
+
+
+def test_failed_unit_is_retried_with_backoff(manifest):
+    job = manifest.job("test", kml="field.kml", start="2022-01-01")
+    calls = []
+
+    def execute(units):
+        for unit in units:
+            calls.append(unit)
+            if unit == UNITS[1] and calls.count(unit) == 1:
+                yield unit, RuntimeError("timeout")
+            else:
+                yield unit, {"ndvi": unit[1]}
+
+    done = job.run_units(UNITS, execute)
+
+    assert set(done) == set(UNITS)
+    assert calls == UNITS + [UNITS[1]]
+    assert job.get(UNITS[1])["attempts"] == 1
+    assert job.status()["done"] == 3
+
+
+def test_rerun_skips_completed_units(manifest, tmp_path):
+    job = manifest.job("test", kml="field.kml")
+
+    def interrupted(units):
+        yield units[0], {"ndvi": 0.5}
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        job.run_units(UNITS, interrupted)
+    assert job.status() == {"pending": 0, "running": 2, "done": 1, "failed": 0}
+
+    # Новый процесс, те же параметры — то же задание
+    again = JobManifest(tmp_path / "jobs.sqlite").job("test", kml="field.kml")
+    assert again.job_id == job.job_id
+    seen = []
+
+    def execute(units):
+        seen.extend(units)
+        for unit in units:
+            yield unit, {"ndvi": 0.6}
+
+    done = again.run_units(UNITS, execute)
+    assert seen == UNITS[1:]
+    assert done[UNITS[0]] == {"ndvi": 0.5}
+    assert manifest.jobs()[0]["units"]["done"] == 3
+
+
+def test_done_unit_with_missing_outputs_is_rerun(manifest, tmp_path):
+    job = manifest.job("test", kml="files.kml")
+    for unit in UNITS:
+        (tmp_path / f"{unit[1]}.png").write_bytes(b"png")
+
+    def execute(units):
+        for unit in units:
+            yield unit, {"path": str(tmp_path / f"{unit[1]}.png")}
+
+    def files_exist(unit, outputs):
+        return (tmp_path / f"{unit[1]}.png").exists()
+
+    job.run_units(UNITS, execute, valid=files_exist)
+    (tmp_path / f"{UNITS[2][1]}.png").unlink()
+    seen = []
+
+    def execute_again(units):
+        seen.extend(units)
+        yield from execute(units)
+
+    done = job.run_units(UNITS, execute_again, valid=files_exist)
+    assert seen == UNITS[2:] and set(done) == set(UNITS)
+
+
+def test_gives_up_after_max_attempts(manifest):
+    job = manifest.job("test", kml="other.kml")
+
+    def always_fails(units):
+        for unit in units:
+            yield unit, OSError("403")
+
+    done = job.run_units(UNITS[:1], always_fails, max_attempts=2)
+    assert done == {}
+    state = job.get(UNITS[0])
+    assert state["status"] == "failed" and state["attempts"] == 2 and "403" in state["error"]
@@ -0,0 +1,88 @@
+"""Тесты реестра метрик: вложенные этапы, выгрузка в JSON lines и Prometheus."""
+import gc
+import json
+import threading
+import time
+
+from src.rlm.metrics import MetricsRegistry
+
+
+def test_nested_stages_do_not_double_count():
+    reg = MetricsRegistry()
+    with reg.stage("compute"):
+        time.sleep(0.02)
+        with reg.stage("read"):
+            assert reg.current_stages() == ["compute", "read"]
+            time.sleep(0.05)
+
+    stages = {s["labels"]["stage"]: s for s in reg.snapshot()["stages"]}
+    assert stages["read"]["count"] == 1
+    assert stages["compute"]["sum"] >= stages["read"]["sum"] >= 0.05
+    # Собственное время внешнего этапа — без вложенного чтения
+    assert stages["compute"]["self"] < stages["read"]["sum"]
+    assert reg.current_stages() == []
+
+
+def test_stage_stacks_of_finished_threads_are_dropped():
+    reg = MetricsRegistry()
+    seen = []
+
+    def work():
+        with reg.stage("read"):
+            seen.append(reg.active_stages().get(threading.get_ident()))
+
+    threads = [threading.Thread(target=work) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    assert seen == ["read"] * 20
+    del threads, thread
+    gc.collect()
+    assert len(reg._stacks) == 0
+
+
+def test_exports():
+    reg = MetricsRegistry()
+    reg.inc("rlm_scenes_rejected_total", reason="cloud")
+    reg.inc("rlm_scenes_rejected_total", 2, reason="cloud")
+    reg.inc("rlm_bytes_fetched_total", 1024, source="download")
+    reg.observe("read", 1.5)
+
+    assert reg.get("rlm_scenes_rejected_total", reason="cloud") == 3
+
+    prom = reg.to_prometheus()
+    assert "# TYPE rlm_scenes_rejected_total counter" in prom
+    assert 'rlm_scenes_rejected_total{reason="cloud"} 3' in prom
+    assert 'rlm_stage_seconds_sum{stage="read"} 1.500000' in prom
+
+    lines = [json.loads(line) for line in reg.to_jsonl(run_id="r1").splitlines()]
+    assert {line["name"] for line in lines} == {
+        "rlm_scenes_rejected_total", "rlm_bytes_fetched_total", "rlm_stage_seconds",
+    }
+    assert all(line["run_id"] == "r1" for line in lines)
+
+
+def test_run_exports_only_its_own_delta(tmp_path):
+    reg = MetricsRegistry()
+    reg.inc("rlm_scenes_rejected_total", 5, reason="cloud")
+    reg.observe("read", 4.0)
+
+    baseline = reg.snapshot()
+    reg.inc("rlm_scenes_rejected_total", reason="cloud")
+    reg.inc("rlm_scenes_passed_total", 2)
+    reg.observe("read", 0.5)
+    reg.observe("compute", 1.0)
+
+    path = reg.export(tmp_path / "metrics.jsonl", since=baseline, kml="b.kml")
+    lines = {(line["name"], line["labels"].get("stage")): line
+             for line in map(json.loads, path.read_text(encoding="utf-8").splitlines())}
+    assert lines[("rlm_scenes_rejected_total", None)]["value"] == 1
+    assert lines[("rlm_scenes_passed_total", None)]["value"] == 2
+    read = lines[("rlm_stage_seconds", "read")]
+    assert (read["count"], read["sum"], read["max"]) == (1, 0.5, 0.5)
+    assert lines[("rlm_stage_seconds", "compute")]["count"] == 1
+    assert "rlm_scenes_rejected_total{reason=cloud} = 1" in reg.format_summary(since=baseline)
+
+    # Prometheus — накопленные значения процесса
+    prom = reg.export(tmp_path / "metrics.prom", since=baseline).read_text(encoding="utf-8")
+    assert 'rlm_scenes_rejected_total{reason="cloud"} 6' in prom
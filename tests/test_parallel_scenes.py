@@ -0,0 +1,52 @@
+"""
+Тест параллельной обработки сцен: пул процессов возвращает результаты
+в порядке сцен, метрики воркеров сводятся в родительский реестр.
+"""
+import pytest
+
+from src.rlm.bench import BenchContext, RangeRequestServer, make_synthetic_dataset
+from src.rlm.config import settings
+from src.rlm.metrics import metrics
+from src.rlm.processor import _peak_memory_mb, run_scenes, scene_workers
+from src.rlm.search import create_buffer
+
+
+@pytest.fixture(scope="module")
+def scenes(tmp_path_factory):
+    root = tmp_path_factory.mktemp("parallel")
+    meta = make_synthetic_dataset(root / "data", n_dates=3, size=1024, field_vertices=50)
+    with RangeRequestServer(root / "data") as server:
+        ctx = BenchContext(root=meta["root"], kml_path=meta["kml_path"], base_url=server.base_url,
+                           workdir=str(root), items=meta["items"], date_range=meta["date_range"])
+        yield ctx, [ctx.scene_metadata(item) for item in ctx.clear_items()]
+
+
+def test_results_in_submission_order(scenes, tmp_path, monkeypatch):
+    ctx, selected = scenes
+    monkeypatch.chdir(tmp_path)
+    buffer_path = create_buffer(ctx.kml_path, 500)
+    metrics.reset()
+
+    processed = run_scenes(selected, buffer_path, tmp_path / "output", workers=2)
+
+    assert all(r["status"] == "success" for r, _ in processed)
+    assert [s.scene_id in r["ndvi_path"] for (r, _), s in zip(processed, selected)] == [True] * len(selected)
+    remote = metrics.snapshot()["counters"]["rlm_remote_requests_total"]
+    assert sum(c["value"] for c in remote if c["labels"]["outcome"] == "ok") > 0
+
+
+def test_worker_count_respects_memory_budget(monkeypatch):
+    monkeypatch.setattr(settings, "scene_worker_memory_mb", 1024)
+    monkeypatch.setattr("src.rlm.processor._available_memory_mb", lambda: 3000)
+    assert scene_workers(30, workers=8) == 2
+    assert scene_workers(1, workers=8) == 1
+    monkeypatch.setattr(settings, "scene_worker_memory_mb", 0)
+    assert scene_workers(30, workers=8) == 8
+
+
+def test_peak_memory_without_resource_module(monkeypatch):
+    import sys
+
+    assert _peak_memory_mb() > 0
+    monkeypatch.setitem(sys.modules, "resource", None)  # как на Windows: import resource → ImportError
+    assert _peak_memory_mb() is None
@@ -0,0 +1,69 @@
+"""
+Тесты быстрых превью: окно поля из обзоров COG вместо полного тайла,
+запасной путь через thumbnail и кэш превью.
+"""
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.rlm.bench import RangeRequestServer, make_synthetic_dataset
+from src.rlm.preview import build_previews
+from src.rlm.sentinel_filter import _load_field_polygon
+
+
+@pytest.fixture(scope="module")
+def served(tmp_path_factory):
+    root = tmp_path_factory.mktemp("previews")
+    meta = make_synthetic_dataset(root / "data", n_dates=2, size=1536, field_vertices=50)
+    thumb = io.BytesIO()
+    Image.new("RGB", (343, 343), (30, 160, 40)).save(thumb, format="JPEG")
+    (root / "data" / "thumbnail.jpg").write_bytes(thumb.getvalue())
+    with RangeRequestServer(root / "data") as server:
+        yield meta, server
+
+
+def _scenes(meta, server):
+    return [
+        {"item_id": item["id"], "datetime": item["datetime"], "cloud_cover_field": item["eo:cloud_cover"],
+         "assets": {"visual": f"{server.base_url}/{item['assets']['visual']}"}}
+        for item in meta["items"]
+    ]
+
+
+def test_cog_previews_read_a_fraction_of_the_tile(served, tmp_path):
+    meta, server = served
+    scenes = _scenes(meta, server)
+    before = server.stats.snapshot()
+
+    result = build_previews(scenes, meta["kml_path"], out_dir=tmp_path)
+
+    assert all(result["previews"]) and result["sheet"].exists()
+    image = np.asarray(Image.open(result["previews"][0]))
+    assert image.shape == (256, 256, 3)
+    assert ((image[..., 0] == 255) & (image[..., 1] == 0)).any()  # контур поля
+    tile_size = sum(os.path.getsize(os.path.join(meta["root"], it["assets"]["visual"])) for it in meta["items"])
+    assert server.stats.snapshot()["bytes_sent"] - before["bytes_sent"] < tile_size / 2
+
+    # Повторный выбор дат по тому же полю — из кэша, без сети
+    before = server.stats.snapshot()
+    build_previews(scenes, meta["kml_path"], out_dir=tmp_path)
+    assert server.stats.snapshot() == before
+
+
+def test_thumbnail_fallback(served, tmp_path):
+    meta, server = served
+    polygon = _load_field_polygon(meta["kml_path"])
+    west, south, east, north = polygon.buffer(0.1).bounds
+    scene = {"item_id": "S2B_TEST_20250501_0_L2A", "datetime": "2025-05-01T08:46:30Z",
+             "cloud_cover_field": 0.0, "bbox": [west, south, east, north],
+             "assets": {"visual": f"{server.base_url}/missing.tif",
+                        "thumbnail": f"{server.base_url}/thumbnail.jpg"}}
+
+    result = build_previews([scene], polygon, out_dir=tmp_path)
+
+    preview = np.asarray(Image.open(result["previews"][0]))
+    assert preview.shape == (256, 256, 3)
+    assert abs(int(preview[128, 5, 1]) - 160) < 10  # зелёная миниатюра, JPEG чуть искажает цвет
@@ -0,0 +1,29 @@
+"""Тесты профилировщика: разметка сэмплов этапами и файлы collapsed stacks."""
+import time
+
+from src.rlm.metrics import stage
+from src.rlm.profiling import profiling
+
+
+def _busy_compute(seconds):
+    deadline = time.perf_counter() + seconds
+    x = 0
+    while time.perf_counter() < deadline:
+        x += 1
+    return x
+
+
+def test_profile_writes_collapsed_stacks_per_stage(tmp_path):
+    with profiling("test", out_dir=tmp_path, interval_ms=1, use_cprofile=True) as session:
+        with stage("compute"):
+            _busy_compute(0.2)
+
+    out = session.out_dir
+    assert (out / "all.collapsed").exists()
+    assert (out / "main.prof").exists()
+
+    lines = (out / "compute.collapsed").read_text(encoding="utf-8").splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert stack.startswith("MainThread;") and int(count) > 0
+    assert any("_busy_compute" in line for line in lines)
@@ -0,0 +1,47 @@
+"""
+Тесты общего читателя растров: склейка окон одного ассета, совпадение
+склеенных чтений с отдельными и заголовки из кэша без повторных запросов.
+"""
+import numpy as np
+import pytest
+from rasterio.windows import Window
+
+from src.rlm import reader
+from src.rlm.bench import RangeRequestServer, make_synthetic_dataset
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    root = tmp_path_factory.mktemp("reader")
+    return make_synthetic_dataset(root / "data", n_dates=1, size=512, field_vertices=50)
+
+
+def test_merge_windows_groups_close_windows():
+    windows = [Window(0, 0, 10, 10), Window(500, 500, 10, 10), Window(10, 0, 10, 10), Window(5, 8, 10, 10)]
+    groups = reader.merge_windows(windows, ratio=2.0)
+    assert sorted(sorted(members) for _, members in groups) == [[0, 2, 3], [1]]
+    union = next(u for u, members in groups if 0 in members)
+    assert (union.col_off, union.row_off, union.width, union.height) == (0, 0, 20, 18)
+    assert len(reader.merge_windows(windows, ratio=1.0)) == 3  # только соседние 0 и 2: без лишних пикселей
+
+
+def test_read_windows_equals_separate_reads(dataset):
+    href = f"{dataset['root']}/{dataset['items'][0]['assets']['red']}"
+    windows = [Window(100, 100, 40, 30), Window(130, 110, 40, 40), Window(400, 20, 20, 20),
+               Window(-5, -5, 20, 20)]
+    merged = reader.read_windows(href, windows, boundless=True, fill_value=0)
+    for window, data in zip(windows, merged):
+        np.testing.assert_array_equal(data, reader.read(href, window, boundless=True, fill_value=0))
+    assert merged[3][:5].sum() == 0  # за краем растра — fill_value
+
+
+def test_header_cached_without_new_requests(dataset):
+    with RangeRequestServer(dataset["root"]) as server:
+        href = f"{server.base_url}/{dataset['items'][0]['assets']['scl']}"
+        hdr = reader.header(href)
+        assert (hdr.width, hdr.height, hdr.count) == (256, 256, 1)
+        requests = server.stats.snapshot()["requests"]
+        assert reader.header(href) is hdr
+        reader.read(href, Window(0, 0, 16, 16))  # дескриптор из пула: заголовок TIFF не перечитывается
+        reader.read(href, Window(0, 0, 16, 16))
+        assert server.stats.snapshot()["requests"] - requests <= 1
@@ -0,0 +1,56 @@
+"""
+Тесты числовых записей: IndexRecord из результата indices и потоковая выгрузка CSV/Parquet.
+"""
+from datetime import datetime
+
+import pytest
+
+from src.rlm.models import SceneMetadata
+from src.rlm.records import RECORD_COLUMNS, RecordWriter, read_records, record_from_indices
+
+
+def _records(n):
+    for i in range(n):
+        yield {"field_id": f"field-{i % 100}", "date": f"2024-{i % 12 + 1:02d}-01", "scene_id": f"S2A_{i}",
+               "tile": "36UUA", "status": "ok" if i % 3 else "cloud", "cloud_percent": i % 50 / 2,
+               "nodata_percent": 0.0, "valid_pixels": i if i % 3 else None,
+               "ndvi_mean": 0.5 + i % 7 / 100 if i % 3 else None}
+
+
+def test_record_from_indices():
+    scene = SceneMetadata(scene_id="S2A_36UUA_20240515", date=datetime(2024, 5, 15, 8, 30),
+                          cloud_cover=3.5, title="S2A_36UUA_20240515")
+    record = record_from_indices(scene, "field-1", {
+        "status": "success", "ndvi_mean": 0.612, "ndwi_mean": -0.38, "cloud_percent": 0.0, "nodata_percent": 0.0,
+        "valid_pixels_percent": 100.0, "rgb_path": "output/S2A_rgb.png", "ndvi_path": "не создан",
+    }, duration=1.23456)
+
+    assert record.date == "2024-05-15"
+    assert record.ndvi_mean == 0.612 and record.ndwi_mean == -0.38
+    assert record.cloud_percent == 0.0  # облачность над полем, а не сцены по каталогу (3.5)
+    assert record.duration_s == 1.235
+    assert record.rgb_path == "output/S2A_rgb.png" and record.ndvi_path is None
+
+    missing = record_from_indices(scene, "field-1", {"status": "warning", "ndvi_mean": None})
+    assert missing.cloud_percent is missing.ndwi_mean is missing.valid_pixels_percent is None
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_streaming_roundtrip(tmp_path, fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    path = tmp_path / f"summary.{fmt}"
+    with RecordWriter(path, flush_rows=1000) as writer:
+        for i, record in enumerate(_records(20000)):
+            writer.write(record)
+            if i == 1500 and fmt == "csv":
+                # Сброшенная часть видна ещё до конца прогона
+                assert read_records(path).shape == (1000, len(RECORD_COLUMNS))
+
+    df = read_records(path)
+    assert tuple(df.columns) == RECORD_COLUMNS
+    assert len(df) == 20000
+    assert str(df["ndvi_mean"].dtype) == "float64"
+    assert df["valid_pixels"].isna().sum() == df["ndvi_mean"].isna().sum() == 6667
+    assert df.loc[df["status"] == "ok", "ndvi_mean"].between(0.5, 0.57).all()
+    assert df["rgb_path"].isna().all()
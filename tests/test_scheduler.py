@@ -0,0 +1,87 @@
+"""
+Тесты приоритетного планировщика: классы приоритета, резерв для интерактивных,
+честная очередь по клиентам, вложенные слоты и порядок фоновых заданий.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.rlm.jobs import JobRunner
+from src.rlm.scheduler import Scheduler, current, priority
+from tests.test_jobs import slow_task
+
+
+def _request(scheduler, order, label, name, client="local"):
+    scheduler.request(lambda granted: order.append(label), name, client)
+
+
+def test_priority_classes_and_interactive_reserve():
+    scheduler = Scheduler("test", slots=2, reserve=1)
+    order = []
+    _request(scheduler, order, "bulk-1", "backfill")
+    _request(scheduler, order, "bulk-2", "backfill")
+    assert order == ["bulk-1"]  # второй слот зарезервирован под интерактивные
+    _request(scheduler, order, "agronomist", "interactive")
+    assert order == ["bulk-1", "agronomist"]
+    _request(scheduler, order, "monitor", "monitoring")
+
+    scheduler.release("interactive")
+    assert order == ["bulk-1", "agronomist"]  # освободился резервный слот — bulk его не берёт
+    scheduler.release("backfill")
+    assert order == ["bulk-1", "agronomist", "monitor"]  # monitoring раньше backfill
+    scheduler.release("monitoring")
+    assert order[-1] == "bulk-2"
+    assert scheduler.stats()["queued"] == {"interactive": 0, "monitoring": 0, "backfill": 0}
+
+    with pytest.raises(ValueError, match="Неизвестный класс"):
+        scheduler.request(lambda granted: None, "urgent")
+
+
+def test_fair_queue_between_clients():
+    scheduler = Scheduler("test", slots=1, reserve=0)
+    order = []
+    _request(scheduler, order, "hold", "backfill")
+    for i in range(3):
+        _request(scheduler, order, f"a{i}", "backfill", client="agent-a")
+    _request(scheduler, order, "b0", "backfill", client="agent-b")
+    for _ in range(4):
+        scheduler.release("backfill")
+    assert order == ["hold", "a0", "b0", "a1", "a2"]
+
+
+def test_slot_context_nesting_and_submit():
+    scheduler = Scheduler("test", slots=1, reserve=0)
+    with priority("monitoring", client="dashboard"):
+        assert current() == ("monitoring", "dashboard")
+        with scheduler.slot():
+            with scheduler.slot():  # вложенный слот в том же потоке не ждёт сам себя
+                assert scheduler.stats()["running"]["monitoring"] == 1
+    assert current()[0] == "interactive"
+
+    gate = threading.Event()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        first = scheduler.submit(pool, gate.wait, 10, priority="backfill")
+        second = scheduler.submit(pool, lambda: "second", priority="backfill")
+        assert not second.running()  # ждёт слот, пока занят первый
+        assert second.cancel()
+        third = scheduler.submit(pool, lambda: "third", priority="backfill")
+        gate.set()
+        assert first.result(10) is True and third.result(10) == "third"
+    assert sum(scheduler.stats()["running"].values()) == 0
+
+
+def test_interactive_job_overtakes_backfill():
+    runner = JobRunner(workers=1, max_pending=8)
+    try:
+        blocker = runner.submit(slow_task, priority="backfill", client="backfill", steps=10, delay=0.1)
+        bulk = [runner.submit(slow_task, priority="backfill", client="backfill", steps=2, delay=0.1)
+                for _ in range(2)]
+        interactive = runner.submit(slow_task, priority="interactive", client="agronomist", steps=1, delay=0)
+        assert runner.status(interactive.job_id)["priority"] == "interactive"
+
+        assert interactive.future.result(120) == {"steps": 1}
+        assert blocker.future.done() and not any(job.future.done() for job in bulk)
+        assert all(job.future.result(120) == {"steps": 2} for job in bulk)
+    finally:
+        runner.shutdown()
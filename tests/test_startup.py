@@ -0,0 +1,22 @@
+"""Старт CLI и MCP-сервера не должен загружать тяжёлые геозависимости и litellm."""
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ("rasterio", "geopandas", "matplotlib", "litellm", "sentinelsat", "pystac_client")
+
+
+@pytest.mark.parametrize("module", ["src.rlm.cli", "src.rlm.server"])
+def test_import_is_lazy(module):
+    probe = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+def test_lazy_package_attributes():
+    import src.rlm as rlm
+    from src.rlm.processor import process_scene
+    assert rlm.process_scene is process_scene
+    with pytest.raises(AttributeError):
+        rlm.no_such_attribute
@@ -0,0 +1,58 @@
+"""
+Тесты пирамиды тайлов: сетка XYZ, отрисовка NDVI и инкрементальная перерисовка
+только тех тайлов, которые затронуло новое поле.
+"""
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+from rasterio.transform import from_origin
+
+from src.rlm.cog import write_index_cog
+from src.rlm.tiles import ORIGIN, TilePyramid, build_tiles, tile_bounds, tiles_for_bounds
+
+
+def _field(path, x0, y0, size=200):
+    values = np.linspace(-0.2, 0.9, size * size, dtype=np.float32).reshape(size, size)
+    return write_index_cog(path, values, from_origin(x0, y0, 10, 10), "EPSG:32636",
+                           scene_id="S2B_36UYC_20240415_0_L2A")
+
+
+def test_tile_grid():
+    assert tile_bounds(0, 0, 0) == pytest.approx((-ORIGIN, -ORIGIN, ORIGIN, ORIGIN))
+    assert list(tiles_for_bounds((1.0, 1.0, 2.0, 2.0), 1)) == [(1, 0)]
+    assert len(list(tiles_for_bounds(tile_bounds(3, 2, 5), 5))) >= 16
+
+
+def test_incremental_build(tmp_path):
+    a = _field(tmp_path / "a_ndvi.tif", 700000, 5550000)
+    stats = build_tiles([a], out_dir=tmp_path / "tiles", min_zoom=11, workers=4)["ndvi"]
+    assert stats["rendered"] > 0
+
+    root = tmp_path / "tiles" / "ndvi"
+    tiles = sorted(root.glob("2024-04-15/*/*/*.png"))
+    assert len(tiles) == stats["rendered"]
+    assert {p.parent.parent.name for p in tiles} == {"11", "12", "13", "14"}
+    image = Image.open(tiles[0])
+    assert image.size == (256, 256) and image.mode == "RGBA"
+    tilejson = json.loads((root / "2024-04-15" / "tilejson.json").read_text())
+    assert tilejson["maxzoom"] == 14
+
+    # Повторный запуск без изменений — ничего не рисуется
+    again = build_tiles([a], out_dir=tmp_path / "tiles", min_zoom=11)["ndvi"]
+    assert again["rendered"] == 0 and again["skipped"] == stats["rendered"]
+
+    # Второе поле далеко от первого: перерисовываются только его тайлы и общие тайлы мелких зумов
+    b = _field(tmp_path / "b_ndvi.tif", 760000, 5550000)
+    before = {p: p.stat().st_mtime_ns for p in tiles}
+    added = build_tiles([b], out_dir=tmp_path / "tiles", min_zoom=11)["ndvi"]
+    changed = [p for p in tiles if p.stat().st_mtime_ns != before[p]]
+    assert 0 < added["rendered"] < stats["rendered"] * 3
+    assert all(int(p.parent.parent.name) < 13 for p in changed)
+
+    # Удалённый источник уходит из пирамиды вместе со своими тайлами
+    b.unlink()
+    removed = TilePyramid(tmp_path / "tiles", "ndvi").build([], min_zoom=11)
+    assert removed["removed"] > 0
+    assert len(list(root.glob("2024-04-15/*/*/*.png"))) == len(tiles)
@@ -0,0 +1,78 @@
+"""
+Тесты хранилища полевых окон на синтетической сцене: окно совпадает с кропом
+полного тайла, бэнды дочитываются на ту же сетку, повторная загрузка — без сети.
+"""
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+
+from src.rlm.bench import BenchContext, RangeRequestServer, make_synthetic_dataset
+from src.rlm.search import read_geometry_file
+from src.rlm.window_store import WindowStore, window_margin
+
+
+@pytest.fixture(scope="module")
+def scene(tmp_path_factory):
+    root = tmp_path_factory.mktemp("windows")
+    meta = make_synthetic_dataset(root / "data", n_dates=1, size=1536, field_vertices=200)
+    with RangeRequestServer(root / "data") as server:
+        ctx = BenchContext(root=meta["root"], kml_path=meta["kml_path"], base_url=server.base_url,
+                           workdir=str(root), items=meta["items"], date_range=meta["date_range"])
+        gdf = read_geometry_file(ctx.kml_path)
+        yield ctx, server, gdf, ctx.scene_metadata(ctx.items[0])
+
+
+def test_window_matches_tile_crop_and_is_reused(scene, tmp_path):
+    ctx, server, gdf, meta = scene
+    store = WindowStore(tmp_path / "windows")
+
+    window = store.load(meta, gdf, meta.scene_id, bands=("B04", "B08"))
+    assert window.path.exists() and set(window.bands) == {"B04", "B08"}
+
+    with rasterio.open(meta.assets["red"]) as src:
+        full = src.read(1)
+        minx, miny, maxx, maxy = gdf.to_crs(src.crs).total_bounds
+        row, col = src.index(minx, maxy)
+        margin = window_margin(src.width, src.height)
+    y1, x1 = max(0, row - margin), max(0, col - margin)
+    h, w = window.shape
+    np.testing.assert_array_equal(window.band("B04"), full[y1:y1 + h, x1:x1 + w])
+
+    # Дочитываем TCI и SCL — на ту же сетку, файл окна дополняется
+    merged = store.load(meta, gdf, meta.scene_id, bands=("TCI", "SCL", "B04"))
+    assert merged.transform == window.transform and merged.shape == window.shape
+    assert merged.rgb().shape == (h, w, 3)
+
+    before = server.stats.snapshot()
+    again = store.load(meta, gdf, meta.scene_id, bands=("TCI", "B04", "B08", "SCL"))
+    assert server.stats.snapshot() == before
+    np.testing.assert_array_equal(again.band("B08"), window.band("B08"))
+
+
+def test_field_statistics_from_window(scene, tmp_path):
+    from src.rlm.indices import field_statistics
+
+    ctx, server, gdf, meta = scene
+    window = WindowStore(tmp_path / "windows").load(meta, gdf, meta.scene_id, bands=("B03", "B04", "B08", "SCL"))
+    stats = field_statistics(window, gdf)
+    assert stats["nodata_percent"] == stats["cloud_percent"] == 0.0  # первая сцена набора — ясная
+    assert stats["valid_pixels_percent"] == 100.0 and stats["valid_pixels"] > 0
+    assert -1 < stats["ndwi_mean"] < 0  # B03 < B08 на растительности
+
+    # NDVI — под маской поля, а не по всему окну с отступом
+    from src.rlm.geometry import field_mask
+    from src.rlm.indices import calculate_ndvi
+    inside = field_mask(gdf.to_crs(window.crs).geometry.iloc[0], window.transform, window.shape)
+    red, nir = window.band("B04").astype(np.float32), window.band("B08").astype(np.float32)
+    field_ndvi = calculate_ndvi(nir, red)[inside]
+    assert stats["ndvi_mean"] == pytest.approx(field_ndvi.mean(), abs=1e-4)
+    assert stats["ndvi_median"] == pytest.approx(np.median(field_ndvi), abs=1e-4)
+    assert stats["ndvi_mean"] != pytest.approx(calculate_ndvi(nir, red).mean(), abs=1e-3)
+
+    scl = window.bands["SCL"].copy()
+    scl[:] = 9
+    window.bands["SCL"] = scl
+    cloudy = field_statistics(window, gdf)
+    assert cloudy["cloud_percent"] == 100.0 and cloudy["valid_pixels"] == 0
+    assert cloudy["ndvi_mean"] is cloudy["ndvi_median"] is cloudy["ndwi_mean"] is None